@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from applications.cart.utils import purge_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned anonymous carts, their items and sessions, plus expired sessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Retention in days for anonymous carts (default: CART_RETENTION_DAYS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows deleted per batch (default: CART_PURGE_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rows would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        counts = purge_abandoned_carts(
+            retention_days=options["days"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        summary = f"{counts['carts']} carts, {counts['items']} items, {counts['sessions']} sessions"
+        if options["dry_run"]:
+            self.stdout.write(f"Would delete {summary}.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {summary}."))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='wishlist',
+            name='cart_wishli_user_id_9f8c4b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['user', '-added_at', '-id'], name='cart_wishli_user_id_47721a_idx'),
+        ),
+    ]
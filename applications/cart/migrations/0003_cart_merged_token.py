@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='merged_token',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 del último carrito firmado fusionado', max_length=64),
+        ),
+    ]
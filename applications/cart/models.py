@@ -1,4 +1,7 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from applications.products.models import Product
@@ -10,6 +13,9 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creado')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Actualizado')
     is_active = models.BooleanField(default=True, verbose_name='Activo')
+    merged_token = models.CharField(
+        max_length=64, blank=True, default='', help_text='SHA-256 del último carrito firmado fusionado'
+    )
 
     class Meta:
         verbose_name = 'Carrito'
@@ -25,18 +31,51 @@ class Cart(models.Model):
             return f"Carrito de {self.user.username}"
         return f"Carrito anónimo ({self.session_id})"
 
+    @property
+    def totals(self):
+        """
+        {'total_price', 'total_items', 'item_count'} calculados una sola vez:
+        desde los items precargados si los hay, si no con un único aggregate
+        """
+        if getattr(self, '_totals', None) is None:
+            prefetched = getattr(self, '_prefetched_objects_cache', {}).get('items')
+            if prefetched is not None:
+                self._totals = {
+                    'total_price': sum((item.subtotal for item in prefetched), Decimal('0')),
+                    'total_items': sum(item.quantity for item in prefetched),
+                    'item_count': len(prefetched),
+                }
+            else:
+                # Mismo criterio que Product.final_price: discount_price si no es 0/NULL
+                unit_price = Coalesce(NullIf('product__discount_price', Value(0)), 'product__price')
+                totals = self.items.aggregate(
+                    total_price=Sum(F('quantity') * unit_price, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                    total_items=Sum('quantity'),
+                    item_count=Count('pk'),
+                )
+                self._totals = {
+                    'total_price': totals['total_price'] or Decimal('0'),
+                    'total_items': totals['total_items'] or 0,
+                    'item_count': totals['item_count'],
+                }
+        return self._totals
+
+    def refresh_totals(self):
+        """Descarta los totales e items cacheados tras modificar el carrito"""
+        self._totals = None
+        getattr(self, '_prefetched_objects_cache', {}).pop('items', None)
+
     @property
     def total_price(self):
-        total = sum(item.subtotal for item in self.items.all())
-        return round(total, 2)
+        return round(self.totals['total_price'], 2)
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.totals['total_items']
 
     @property
     def item_count(self):
-        return self.items.count()
+        return self.totals['item_count']
 
 class CartItem(models.Model):
     """Item individual del carrito"""
@@ -57,6 +96,21 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._refresh_cart_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._refresh_cart_totals()
+        return result
+
+    def _refresh_cart_totals(self):
+        # Solo si el carrito ya está cargado en memoria (no dispara consultas)
+        cart = self._state.fields_cache.get('cart')
+        if cart is not None:
+            cart.refresh_totals()
+
     @property
     def subtotal(self):
         price = self.product.final_price
@@ -79,7 +133,7 @@ class Wishlist(models.Model):
         unique_together = [('user', 'product')]
         ordering = ['-added_at']
         indexes = [
-            models.Index(fields=['user', '-added_at']),
+            models.Index(fields=['user', '-added_at', '-id']),
         ]
 
     def __str__(self):
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Cart, CartItem, Wishlist
 from applications.products.serializers import ProductListSerializer
+from applications.orders.holds import release_expired_holds
 from applications.products.models import Product
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -32,11 +33,12 @@ class CartItemCreateSerializer(serializers.Serializer):
         return value
 
     def validate(self, data):
+        release_expired_holds([data['product_id']])
         try:
             product = Product.objects.get(id=data['product_id'])
-            if data['quantity'] > product.stock:
+            if data['quantity'] > product.available_stock:
                 raise serializers.ValidationError({
-                    "quantity": f"Stock insuficiente. Solo hay {product.stock} unidades."
+                    "quantity": f"Stock insuficiente. Solo hay {product.available_stock} unidades."
                 })
         except Product.DoesNotExist:
             pass
@@ -55,13 +57,37 @@ class CartItemUpdateSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         item = self.instance
+        if item is None:
+            # Carrito firmado: el stock se valida al aplicar la operación
+            return data
         quantity = data.get('quantity', item.quantity)
-        if quantity > item.product.stock:
+        if release_expired_holds([item.product_id]):
+            item.product.refresh_from_db(fields=['stock', 'held_stock'])
+        if quantity > item.product.available_stock:
             raise serializers.ValidationError({
-                "quantity": f"Stock insuficiente. Solo hay {item.product.stock} unidades."
+                "quantity": f"Stock insuficiente. Solo hay {item.product.available_stock} unidades."
             })
         return data
 
+class CartBatchOperationSerializer(serializers.Serializer):
+    """Operación de un lote: add suma, set fija la cantidad, remove quita"""
+    OPERATIONS = ('add', 'set', 'remove')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        if data['op'] == 'add' and data.get('quantity', 1) < 1:
+            raise serializers.ValidationError({"quantity": "La cantidad debe ser al menos 1."})
+        if data['op'] == 'set' and 'quantity' not in data:
+            raise serializers.ValidationError({"quantity": "Este campo es requerido para set."})
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    """Lista de operaciones aplicadas en una sola transacción"""
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=100)
+
 class CartSerializer(serializers.ModelSerializer):
     """Serializer completo del carrito"""
     items = CartItemSerializer(many=True, read_only=True)
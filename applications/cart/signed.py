@@ -0,0 +1,149 @@
+"""
+Carrito anónimo sin estado en el servidor (CART_ANONYMOUS_MODE = 'signed').
+
+El carrito viaja con el cliente como un token firmado y comprimido con
+los pares [product_id, cantidad], en la cookie CART_COOKIE_NAME o en el
+header X-Cart-Token. Leerlo cuesta solo las consultas de los productos y
+no crea sesión, Cart ni CartItem; se persiste en un Cart al iniciar
+sesión (merge_quantities). La respuesta tiene la misma forma que la de
+CartSerializer: los items no guardados usan el id del producto como id.
+
+El login que fusiona el token responde con X-Cart-Token vacío y
+cart_token: null (clear_token): el cliente debe descartarlo. Si igual lo
+reenvía, el Cart guarda el hash del último token fusionado y no lo suma
+dos veces.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from rest_framework import serializers
+
+from .models import CartItem
+from .utils import resolve_quantities, touched_quantities, validate_quantities
+from applications.orders.holds import release_expired_holds
+from applications.products.models import Product
+
+SIGNING_SALT = 'applications.cart.signed'
+TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+
+
+def signed_carts_enabled(request):
+    return (
+        getattr(settings, 'CART_ANONYMOUS_MODE', 'session') == 'signed'
+        and not request.user.is_authenticated
+    )
+
+
+def cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart_token')
+
+
+def max_age():
+    return getattr(settings, 'CART_RETENTION_DAYS', 30) * 24 * 60 * 60
+
+
+def request_token(request):
+    """Token del header X-Cart-Token o de la cookie, sin validar"""
+    return request.META.get(TOKEN_HEADER) or request.COOKIES.get(cookie_name())
+
+
+def clear_token(response):
+    """Indica al cliente que descarte el token: header vacío y cookie borrada"""
+    response['X-Cart-Token'] = ''
+    response.delete_cookie(cookie_name())
+    return response
+
+
+class SignedCart:
+    """
+    Carrito en memoria con la interfaz que usa CartSerializer
+    """
+    id = None
+    user = None
+    created_at = None
+    updated_at = None
+
+    def __init__(self, quantities=None, digest=''):
+        # {product_id: cantidad}, en orden de inserción
+        self.quantities = {pk: qty for pk, qty in (quantities or {}).items() if qty > 0}
+        # SHA-256 del token recibido (merge_quantities no lo fusiona dos veces)
+        self.digest = digest
+        self._products = None
+
+    @classmethod
+    def from_request(cls, request):
+        """Carrito del header X-Cart-Token o de la cookie; vacío si es inválido"""
+        token = request_token(request)
+        if not token:
+            return cls()
+        try:
+            pairs = signing.loads(token, salt=SIGNING_SALT, max_age=max_age())
+            return cls({int(pk): int(qty) for pk, qty in pairs}, hashlib.sha256(token.encode()).hexdigest())
+        except (signing.BadSignature, TypeError, ValueError):
+            return cls()
+
+    @property
+    def token(self):
+        pairs = [[pk, qty] for pk, qty in self.quantities.items()]
+        return signing.dumps(pairs, salt=SIGNING_SALT, compress=True)
+
+    def attach(self, response):
+        """Devuelve el token actualizado en la cookie y en el header"""
+        token = self.token
+        response['X-Cart-Token'] = token
+        response.set_cookie(
+            cookie_name(), token, max_age=max_age(), httponly=True, samesite='Lax'
+        )
+        return response
+
+    @property
+    def products(self):
+        """Productos activos del carrito en modo catálogo (una carga)"""
+        if self._products is None:
+            self._products = Product.objects.filter(is_active=True).for_catalog().in_bulk(
+                list(self.quantities)
+            )
+        return self._products
+
+    def apply(self, operations):
+        """
+        Aplica operaciones {op, product_id, quantity} con la misma
+        validación que el carrito en base de datos (todo o nada, solo sobre
+        los productos que tocan las operaciones)
+        """
+        quantities = resolve_quantities(self.quantities, operations)
+        wanted = [pk for pk, qty in quantities.items() if qty > 0]
+        limit = getattr(settings, 'CART_SIGNED_MAX_ITEMS', 50)
+        if len(wanted) > limit:
+            raise serializers.ValidationError(
+                {"operations": f"El carrito admite como máximo {limit} productos distintos."}
+            )
+        touched = touched_quantities(quantities, operations)
+        release_expired_holds(touched)
+        self._products = Product.objects.filter(is_active=True).for_catalog().in_bulk(wanted)
+        validate_quantities(touched, self._products)
+        self.quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+        return self
+
+    @property
+    def items(self):
+        # Productos eliminados o desactivados desaparecen del carrito
+        return [
+            CartItem(pk=pk, product=self.products[pk], quantity=qty)
+            for pk, qty in self.quantities.items()
+            if pk in self.products
+        ]
+
+    @property
+    def total_price(self):
+        return round(sum((item.subtotal for item in self.items), Decimal('0')), 2)
+
+    @property
+    def total_items(self):
+        return sum(item.quantity for item in self.items)
+
+    @property
+    def item_count(self):
+        return len(self.items)
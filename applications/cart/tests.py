@@ -1,12 +1,25 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APITestCase
 from .models import Cart, CartItem
-from applications.products.models import Product
+from .utils import purge_abandoned_carts
+from applications.orders.holds import place_holds
+from applications.orders.models import StockHold
+from applications.products.models import Brand, Category, Product, ProductImage
 
 class CartModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='test', password='pass')
-        self.product = Product.objects.create(name="Mesa", price=100, stock=10, is_active=True)
+        self.category = Category.objects.create(name='Comedor')
+        self.product = Product.objects.create(name="Mesa", sku='MESA-1', category=self.category, price=100, stock=10, is_active=True)
         self.cart = Cart.objects.create(user=self.user)
     
     def test_add_item_cart(self):
@@ -18,3 +31,269 @@ class CartModelTest(TestCase):
         item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
         item.delete()
         self.assertEqual(self.cart.items.count(), 0)
+
+    def test_totals_in_one_query(self):
+        silla = Product.objects.create(
+            name='Silla', sku='SILLA-1', category=self.category, price=80, discount_price=60, stock=10
+        )
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=silla, quantity=3)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total_price, Decimal('380.00'))
+            self.assertEqual(cart.total_items, 5)
+            self.assertEqual(cart.item_count, 2)
+
+    def test_totals_follow_item_changes(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.assertEqual(self.cart.total_price, 100)
+        item.quantity = 4
+        item.save()
+        self.assertEqual(self.cart.total_price, 400)
+        item.delete()
+        self.assertEqual(self.cart.total_items, 0)
+
+
+class CartQueryCountTest(APITestCase):
+    """
+    GET /api/cart/ cuesta un número fijo de consultas
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        self.category = Category.objects.create(name='Living')
+        self.brand = Brand.objects.create(name='Nordic Home')
+        self.cart = Cart.objects.create(user=self.user, is_active=True)
+        self.client.force_authenticate(self.user)
+
+    def add_products(self, count):
+        for i in range(CartItem.objects.count(), CartItem.objects.count() + count):
+            product = Product.objects.create(
+                name=f'Sofá {i}', sku=f'SOFA-{i}', category=self.category, brand=self.brand,
+                price=100, stock=10,
+            )
+            ProductImage.objects.create(product=product, image=f'products/sofa_{i}.png', is_primary=True)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_constant_queries(self):
+        # carrito, items, productos, categorías, marcas
+        self.add_products(1)
+        with self.assertNumQueries(5):
+            self.client.get(reverse('cart-detail'))
+        self.add_products(6)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('cart-detail'))
+        self.assertEqual(response.data['item_count'], 7)
+        self.assertEqual(response.data['total_items'], 14)
+        self.assertEqual(response.data['total_price'], Decimal('1400.00'))
+        self.assertTrue(response.data['items'][0]['product']['primary_image'].endswith('.png'))
+
+    def test_mutations_return_fresh_totals(self):
+        self.add_products(1)
+        product = Product.objects.create(name='Puff', sku='PUFF-1', category=self.category, price=50, stock=10)
+        response = self.client.post(reverse('cart-add-item'), {'product_id': product.pk, 'quantity': 2})
+        self.assertEqual(response.data['cart_total'], Decimal('300.00'))
+        self.assertEqual(response.data['cart_items_count'], 4)
+        item = CartItem.objects.get(product=product)
+        response = self.client.delete(reverse('cart-remove-item', args=[item.pk]))
+        self.assertEqual(response.data['cart_total'], Decimal('200.00'))
+
+    def test_adding_to_existing_item_respects_holds(self):
+        product = Product.objects.create(name='Puff', sku='PUFF-1', category=self.category, price=50, stock=10)
+        CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        place_holds('pi_otro', {product.pk: 7})
+
+        response = self.client.post(reverse('cart-add-item'), {'product_id': product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Solo hay 3', response.data['error'])
+
+        # Vencido el hold, el stock vuelve a estar disponible
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(reverse('cart-add-item'), {'product_id': product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CartItem.objects.get(product=product).quantity, 4)
+
+
+class CartBatchTest(APITestCase):
+    """
+    POST /api/cart/batch/ aplica todas las operaciones o ninguna
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Living')
+        self.sofa = Product.objects.create(name='Sofá', sku='SOFA-1', category=category, price=500, stock=3)
+        self.puff = Product.objects.create(name='Puff', sku='PUFF-1', category=category, price=50, stock=10)
+        self.mesa = Product.objects.create(name='Mesa', sku='MESA-1', category=category, price=200, stock=5)
+        self.cart = Cart.objects.create(user=self.user, is_active=True)
+        CartItem.objects.create(cart=self.cart, product=self.mesa, quantity=1)
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *operations):
+        return self.client.post(reverse('cart-batch'), {'operations': list(operations)}, format='json')
+
+    def test_applies_operations_in_order(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.sofa.pk, 'quantity': 1},
+            {'op': 'add', 'product_id': self.sofa.pk, 'quantity': 1},
+            {'op': 'set', 'product_id': self.puff.pk, 'quantity': 4},
+            {'op': 'remove', 'product_id': self.mesa.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['items']}
+        self.assertEqual(quantities, {self.sofa.pk: 2, self.puff.pk: 4})
+        self.assertEqual(response.data['total_price'], Decimal('1200.00'))
+
+    def test_rejects_whole_batch(self):
+        response = self.batch(
+            {'op': 'set', 'product_id': self.puff.pk, 'quantity': 2},
+            {'op': 'add', 'product_id': self.sofa.pk, 'quantity': 4},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.sofa.pk), response.data['operations'])
+        self.assertEqual(
+            list(self.cart.items.values_list('product_id', 'quantity')), [(self.mesa.pk, 1)]
+        )
+
+    def test_stale_lines_do_not_block_other_operations(self):
+        CartItem.objects.create(cart=self.cart, product=self.sofa, quantity=2)
+        Product.objects.filter(pk=self.mesa.pk).update(is_active=False)
+        Product.objects.filter(pk=self.sofa.pk).update(stock=1)
+
+        response = self.batch({'op': 'add', 'product_id': self.puff.pk, 'quantity': 1})
+        self.assertEqual(response.status_code, 200)
+        response = self.batch({'op': 'remove', 'product_id': self.mesa.pk})
+        self.assertEqual(response.status_code, 200)
+        # Lo que sí toca la operación se sigue validando
+        response = self.batch({'op': 'add', 'product_id': self.sofa.pk, 'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            dict(self.cart.items.values_list('product_id', 'quantity')), {self.sofa.pk: 2, self.puff.pk: 1}
+        )
+
+    def test_invalid_operation(self):
+        response = self.batch({'op': 'set', 'product_id': self.puff.pk})
+        self.assertEqual(response.status_code, 400)
+
+
+class PurgeAbandonedCartsTest(TestCase):
+    """
+    La purga elimina carritos anónimos viejos o inactivos con sus sesiones
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Living')
+        self.product = Product.objects.create(name='Puff', sku='PUFF-1', category=category, price=50, stock=10)
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        old = timezone.now() - timedelta(days=60)
+        future = timezone.now() + timedelta(days=7)
+
+        self.stale = [self.anonymous_cart(f'vieja-{i}', future) for i in range(3)]
+        self.inactive = self.anonymous_cart('inactiva', future, is_active=False)
+        self.recent = self.anonymous_cart('reciente', future)
+        self.user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.user_cart, product=self.product, quantity=1)
+        Cart.objects.filter(pk__in=[c.pk for c in self.stale] + [self.user_cart.pk]).update(updated_at=old)
+        Session.objects.create(session_key='expirada', session_data='', expire_date=timezone.now() - timedelta(days=1))
+
+    def anonymous_cart(self, session_key, expire_date, **kwargs):
+        Session.objects.create(session_key=session_key, session_data='', expire_date=expire_date)
+        cart = Cart.objects.create(session_id=session_key, **kwargs)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        return cart
+
+    def test_dry_run_only_counts(self):
+        out = StringIO()
+        call_command('purge_carts', '--dry-run', days=30, stdout=out)
+        self.assertIn('4 carts, 4 items, 5 sessions', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 6)
+
+    def test_purges_in_batches(self):
+        counts = purge_abandoned_carts(retention_days=30, batch_size=2)
+        self.assertEqual(counts, {'carts': 4, 'items': 4, 'sessions': 5})
+        self.assertEqual(
+            set(Cart.objects.values_list('pk', flat=True)), {self.recent.pk, self.user_cart.pk}
+        )
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), ['reciente'])
+
+
+@override_settings(CART_ANONYMOUS_MODE='signed')
+class SignedCartTest(APITestCase):
+    """
+    Modo carrito firmado: el carrito anónimo viaja en un token, sin escrituras
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Living')
+        self.sofa = Product.objects.create(name='Sofá', sku='SOFA-1', category=category, price=500, stock=3)
+        self.puff = Product.objects.create(name='Puff', sku='PUFF-1', category=category, price=50, stock=10)
+
+    def test_anonymous_cart_without_writes(self):
+        response = self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['cart_total'], Decimal('1000.00'))
+        response = self.client.post(
+            reverse('cart-batch'),
+            {'operations': [{'op': 'add', 'product_id': self.puff.pk, 'quantity': 3}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Misma forma que el carrito en base de datos
+        response = self.client.get(reverse('cart-detail'))
+        self.assertEqual(
+            set(response.data), {'id', 'user', 'items', 'total_price', 'total_items', 'item_count', 'created_at', 'updated_at'}
+        )
+        self.assertEqual(response.data['total_items'], 5)
+        self.assertEqual(response.data['item_count'], 2)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_header_token_and_stock_validation(self):
+        response = self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})
+        token = response['X-Cart-Token']
+        self.client.cookies.clear()
+        response = self.client.put(
+            reverse('cart-update-item', args=[self.sofa.pk]), {'quantity': 5}, HTTP_X_CART_TOKEN=token
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.delete(reverse('cart-remove-item', args=[self.sofa.pk]), HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.data['cart_items_count'], 0)
+
+    def test_stale_product_does_not_lock_the_cart(self):
+        self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})
+        self.client.post(reverse('cart-add-item'), {'product_id': self.puff.pk, 'quantity': 1})
+        Product.objects.filter(pk=self.sofa.pk).update(stock=1)
+
+        response = self.client.put(reverse('cart-update-item', args=[self.puff.pk]), {'quantity': 4})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(
+            reverse('cart-batch'), {'operations': [{'op': 'set', 'product_id': self.sofa.pk, 'quantity': 1}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('cart-detail')).data['total_items'], 5)
+
+    def test_tampered_token_is_ignored(self):
+        response = self.client.get(reverse('cart-detail'), HTTP_X_CART_TOKEN='manipulado')
+        self.assertEqual(response.data['items'], [])
+
+    def test_persisted_on_login(self):
+        user = User.objects.create_user(username='ana', email='ana@example.com', password='pass1234')
+        self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})
+        response = self.client.post(reverse('user-login'), {'username': 'ana', 'password': 'pass1234'})
+        self.assertEqual(response.status_code, 200)
+        cart = Cart.objects.get(user=user, is_active=True)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.sofa.pk: 2})
+        self.assertEqual(response.cookies['cart_token'].value, '')
+
+    def test_header_token_merged_once(self):
+        User.objects.create_user(username='ana', email='ana@example.com', password='pass1234')
+        token = self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})['X-Cart-Token']
+        self.client.cookies.clear()
+
+        for _ in range(2):
+            response = self.client.post(
+                reverse('user-login'), {'username': 'ana', 'password': 'pass1234'}, HTTP_X_CART_TOKEN=token
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cart-Token'], '')
+            self.assertIsNone(response.data['cart_token'])
+        cart = Cart.objects.get(user__username='ana', is_active=True)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.sofa.pk: 2})
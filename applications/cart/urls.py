@@ -11,5 +11,6 @@ urlpatterns = [
     path('<int:pk>/update/', CartViewSet.as_view({'put': 'update_item', 'patch': 'update_item'}), name='cart-update-item'),
     path('<int:pk>/remove/', CartViewSet.as_view({'delete': 'remove_item'}), name='cart-remove-item'),
     path('clear/', CartViewSet.as_view({'delete': 'clear_cart'}), name='cart-clear'),
+    path('batch/', CartViewSet.as_view({'post': 'batch'}), name='cart-batch'),
     path('', include(router.urls)),
 ]
@@ -1,4 +1,13 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from rest_framework import serializers
 from .models import Cart, CartItem
+from applications.orders.holds import release_expired_holds
+from applications.products.models import Product
 
 def get_or_create_cart(request):
     """
@@ -22,25 +31,240 @@ def get_or_create_cart(request):
 
 def merge_carts(user, session_id):
     """
-    Fusiona un carrito anónimo con el del usuario.
-    Se puede llamar tras login para juntar ambos carritos.
-    """
-    try:
-        user_cart = Cart.objects.get(user=user, is_active=True)
-    except Cart.DoesNotExist:
-        user_cart = Cart.objects.create(user=user, is_active=True)
-    try:
-        anon_cart = Cart.objects.get(session_id=session_id, is_active=True, user__isnull=True)
-        for item in anon_cart.items.all():
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=user_cart,
-                product=item.product,
-                defaults={'quantity': item.quantity}
-            )
-            if not created:
-                cart_item.quantity += item.quantity
-                cart_item.save()
+    Fusiona el carrito anónimo de la sesión con el del usuario (tras login).
+    Operación por conjuntos: una consulta bloquea ambos carritos, otra lee
+    sus items, un upsert escribe las cantidades sumadas (limitadas al
+    stock disponible) y un delete elimina el carrito anónimo. Los bloqueos hacen que
+    dos logins simultáneos de la misma sesión no dupliquen cantidades: el
+    segundo ya no encuentra el carrito anónimo.
+    """
+    if not session_id:
+        return Cart.objects.get_or_create(user=user, is_active=True)[0]
+
+    with transaction.atomic():
+        carts = list(
+            Cart.objects.select_for_update().filter(
+                Q(user=user) | Q(session_id=session_id, user__isnull=True),
+                is_active=True
+            ).order_by('pk')
+        )
+        user_cart = next((cart for cart in carts if cart.user_id == user.pk), None)
+        anon_cart = next((cart for cart in carts if cart.user_id is None), None)
+        if anon_cart is None:
+            return user_cart or Cart.objects.get_or_create(user=user, is_active=True)[0]
+        if user_cart is None:
+            # Sin carrito propio: el anónimo pasa a ser del usuario
+            anon_cart.user = user
+            anon_cart.session_id = None
+            anon_cart.save(update_fields=['user', 'session_id', 'updated_at'])
+            return anon_cart
+
+        current = {}
+        incoming = {}
+        stock = {}
+        rows = CartItem.objects.filter(cart__in=[user_cart, anon_cart]).values_list(
+            'cart_id', 'product_id', 'quantity', 'product__stock', 'product__held_stock'
+        )
+        for cart_id, product_id, quantity, product_stock, held_stock in rows:
+            target = current if cart_id == user_cart.pk else incoming
+            target[product_id] = quantity
+            stock[product_id] = max(product_stock - held_stock, 0)
+
+        _upsert_merged(user_cart, current, incoming, stock)
         anon_cart.delete()
-    except Cart.DoesNotExist:
-        pass
+    user_cart.refresh_totals()
+    return user_cart
+
+
+def _upsert_merged(user_cart, current, incoming, stock):
+    """
+    Suma incoming a current ({product_id: cantidad}) limitado al stock
+    disponible ({product_id: unidades}) y lo escribe con un único upsert sobre (cart, product)
+    """
+    merged = []
+    for product_id, quantity in incoming.items():
+        if product_id not in stock:
+            continue
+        existing = current.get(product_id, 0)
+        # Nunca por encima del stock, pero sin reducir lo que ya tenía
+        total = max(existing, min(existing + quantity, stock[product_id]))
+        if total > 0 and total != existing:
+            merged.append(CartItem(cart=user_cart, product_id=product_id, quantity=total))
+    if merged:
+        CartItem.objects.bulk_create(
+            merged,
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+
+
+def merge_quantities(user, quantities, digest=''):
+    """
+    Fusiona {product_id: cantidad} (ej: un carrito firmado anónimo) con el
+    carrito del usuario: mismo criterio que merge_carts. digest identifica
+    el origen (hash del token firmado): el mismo origen se fusiona una vez
+    """
+    with transaction.atomic():
+        user_cart, _ = Cart.objects.select_for_update().get_or_create(user=user, is_active=True)
+        if quantities and not (digest and digest == user_cart.merged_token):
+            current = dict(user_cart.items.values_list('product_id', 'quantity'))
+            stock = {
+                product.pk: product.available_stock
+                for product in Product.objects.filter(pk__in=quantities, is_active=True).only('stock', 'held_stock')
+            }
+            _upsert_merged(user_cart, current, quantities, stock)
+            if digest:
+                user_cart.merged_token = digest
+                user_cart.save(update_fields=['merged_token', 'updated_at'])
+    user_cart.refresh_totals()
     return user_cart
+
+
+def resolve_quantities(current, operations):
+    """
+    Aplica en memoria las operaciones {op, product_id, quantity} sobre
+    {product_id: cantidad}; remove deja la cantidad en 0
+    """
+    quantities = dict(current)
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + operation.get('quantity', 1)
+        elif operation['op'] == 'set':
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+    return quantities
+
+
+def touched_quantities(quantities, operations):
+    """
+    Cantidades finales con cantidad > 0 de los productos que nombran las
+    operaciones: las demás líneas del carrito no se validan, así que una
+    línea desactivada o sin stock no bloquea operaciones sobre otras
+    """
+    touched = {operation['product_id'] for operation in operations}
+    return {pk: qty for pk, qty in quantities.items() if pk in touched and qty > 0}
+
+
+def validate_quantities(quantities, products):
+    """
+    Lanza ValidationError si alguna cantidad final no es válida.
+    products: {product_id: Product} activos
+    """
+    errors = {}
+    for product_id, quantity in quantities.items():
+        if quantity <= 0:
+            continue
+        product = products.get(product_id)
+        if product is None:
+            errors[str(product_id)] = "Producto no encontrado o inactivo."
+        elif quantity > product.available_stock:
+            errors[str(product_id)] = f"Stock insuficiente. Solo hay {product.available_stock} unidades."
+    if errors:
+        raise serializers.ValidationError({"operations": errors})
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Aplica una lista de operaciones {op, product_id, quantity} al carrito en
+    una transacción: una consulta para los items actuales, una para los
+    productos y escrituras agrupadas. Si alguna línea tocada por las
+    operaciones no es válida (producto inexistente/inactivo o sin stock) no
+    se aplica ninguna.
+    """
+    with transaction.atomic():
+        items = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update().filter(cart=cart)
+        }
+        quantities = resolve_quantities(
+            {product_id: item.quantity for product_id, item in items.items()}, operations
+        )
+        touched = touched_quantities(quantities, operations)
+        release_expired_holds(touched)
+        products = Product.objects.filter(is_active=True).in_bulk(list(touched))
+        validate_quantities(touched, products)
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if quantity <= 0:
+                if item:
+                    to_delete.append(item.pk)
+            elif item is None:
+                to_create.append(CartItem(cart=cart, product=products[product_id], quantity=quantity))
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_delete or to_update or to_create:
+            # bulk_* no llama a save(): actualizar updated_at a mano
+            cart.save(update_fields=['updated_at'])
+    cart.refresh_totals()
+    return cart
+
+
+def purge_abandoned_carts(retention_days=None, batch_size=None, dry_run=False):
+    """
+    Elimina carritos anónimos inactivos o sin cambios en retention_days
+    días, junto con sus items y sus sesiones, y las sesiones expiradas.
+    Borra en lotes acotados (rangos de pk para carritos) para no bloquear
+    las tablas. Con dry_run solo cuenta.
+    Retorna {'carts': n, 'items': n, 'sessions': n}.
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, 'CART_RETENTION_DAYS', 30)
+    if batch_size is None:
+        batch_size = getattr(settings, 'CART_PURGE_BATCH_SIZE', 1000)
+    batch_size = max(batch_size, 1)
+    now = timezone.now()
+    cutoff = now - timedelta(days=retention_days)
+
+    abandoned = Cart.objects.filter(
+        Q(is_active=False) | Q(updated_at__lt=cutoff),
+        user__isnull=True
+    )
+    expired_sessions = Session.objects.filter(expire_date__lt=now)
+    if dry_run:
+        session_keys = abandoned.exclude(session_id__isnull=True).values('session_id')
+        return {
+            'carts': abandoned.count(),
+            'items': CartItem.objects.filter(cart__in=abandoned).count(),
+            'sessions': Session.objects.filter(
+                Q(expire_date__lt=now) | Q(session_key__in=session_keys)
+            ).count(),
+        }
+
+    counts = {'carts': 0, 'items': 0, 'sessions': 0}
+    bounds = abandoned.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is not None:
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            with transaction.atomic():
+                rows = list(
+                    abandoned.filter(pk__gte=start, pk__lt=start + batch_size)
+                    .values_list('pk', 'session_id')
+                )
+                if not rows:
+                    continue
+                cart_ids = [pk for pk, _ in rows]
+                session_keys = [key for _, key in rows if key]
+                counts['items'] += CartItem.objects.filter(cart_id__in=cart_ids).delete()[0]
+                counts['carts'] += Cart.objects.filter(pk__in=cart_ids).delete()[0]
+                if session_keys:
+                    counts['sessions'] += Session.objects.filter(session_key__in=session_keys).delete()[0]
+
+    # Las sesiones no tienen pk numérica: lotes por clave hasta agotarlas
+    while True:
+        keys = list(expired_sessions.values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            break
+        counts['sessions'] += Session.objects.filter(pk__in=keys).delete()[0]
+    return counts
@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -7,10 +7,20 @@ from django.db.models import Prefetch
 from .models import Cart, CartItem, Wishlist
 from .serializers import (
     CartSerializer, CartItemSerializer, CartItemCreateSerializer,
-    CartItemUpdateSerializer, WishlistSerializer, WishlistCreateSerializer
+    CartItemUpdateSerializer, WishlistSerializer, WishlistCreateSerializer,
+    CartBatchSerializer
 )
+from .signed import SignedCart, signed_carts_enabled
+from .utils import apply_cart_operations, get_or_create_cart
 from drf_spectacular.utils import extend_schema
 from applications.products.models import Product
+from applications.products.pagination import KeysetPagination, keyset_orderings
+
+
+class WishlistCursorPagination(KeysetPagination):
+    default_ordering = '-added_at'
+    orderings = keyset_orderings('added_at')
+
 
 @extend_schema(tags=['Cart'])
 class CartViewSet(viewsets.ViewSet):
@@ -20,42 +30,75 @@ class CartViewSet(viewsets.ViewSet):
         return [AllowAny()]
     
     def get_cart(self, request):
+        # Items y productos en modo catálogo (categoría, marca e imagen
+        # principal precargadas): el carrito se serializa con un número
+        # fijo de consultas y los totales salen de los items precargados
+        carts = Cart.objects.select_related('user').prefetch_related(
+            Prefetch('items__product', queryset=Product.objects.for_catalog())
+        )
         if request.user.is_authenticated:
-            cart, created = Cart.objects.prefetch_related(
-                Prefetch('items__product')
-            ).get_or_create(user=request.user, is_active=True)
+            cart, created = carts.get_or_create(user=request.user, is_active=True)
         else:
             session_id = request.session.session_key
             if not session_id:
                 request.session.create()
                 session_id = request.session.session_key
-            cart, created = Cart.objects.prefetch_related(
-                Prefetch('items__product')
-            ).get_or_create(session_id=session_id, is_active=True)
+            cart, created = carts.get_or_create(session_id=session_id, is_active=True)
         return cart
     
     def list(self, request):
-        cart = self.get_cart(request)
+        if signed_carts_enabled(request):
+            cart = SignedCart.from_request(request)
+        else:
+            cart = self.get_cart(request)
         serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
     
+    def apply_signed(self, request, operations):
+        """
+        Modo carrito firmado: aplica las operaciones sobre el token del
+        cliente (sin sesión ni escrituras). Retorna (carrito, respuesta de error)
+        """
+        cart = SignedCart.from_request(request)
+        try:
+            cart.apply(operations)
+        except serializers.ValidationError as exc:
+            errors = exc.detail.get('operations', exc.detail)
+            message = next(iter(errors.values())) if isinstance(errors, dict) else errors
+            return cart, Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+        return cart, None
+    
     @action(detail=False, methods=['post'], url_path='items')
     def add_item(self, request):
         serializer = CartItemCreateSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        cart = self.get_cart(request)
         product_id = serializer.validated_data['product_id']
         quantity = serializer.validated_data['quantity']
         
+        if signed_carts_enabled(request):
+            cart, error = self.apply_signed(request, [{'op': 'add', 'product_id': product_id, 'quantity': quantity}])
+            if error:
+                return error
+            item = next(item for item in cart.items if item.product_id == product_id)
+            return cart.attach(Response({
+                "message": "Producto agregado al carrito",
+                "item": CartItemSerializer(item, context={'request': request}).data,
+                "cart_total": cart.total_price,
+                "cart_items_count": cart.total_items
+            }, status=status.HTTP_201_CREATED))
+        
+        cart = self.get_cart(request)
         try:
             cart_item = CartItem.objects.select_related('product').get(cart=cart, product_id=product_id)
             new_quantity = cart_item.quantity + quantity
             product = cart_item.product
-            if new_quantity > product.stock:
+            # CartItemCreateSerializer ya liberó los holds vencidos del
+            # producto, que se lee después
+            if new_quantity > product.available_stock:
                 return Response({
-                    "error": f"Stock insuficiente. Solo hay {product.stock} unidades."
+                    "error": f"Stock insuficiente. Solo hay {product.available_stock} unidades."
                 }, status=status.HTTP_400_BAD_REQUEST)
             cart_item.quantity = new_quantity
             cart_item.save()
@@ -64,6 +107,7 @@ class CartViewSet(viewsets.ViewSet):
             product = Product.objects.get(id=product_id)
             cart_item = CartItem.objects.create(cart=cart, product=product, quantity=quantity)
             message = "Producto agregado al carrito"
+        cart.refresh_totals()
         
         item_serializer = CartItemSerializer(cart_item, context={'request': request})
         return Response({
@@ -75,6 +119,8 @@ class CartViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=['put', 'patch'], url_path='update')
     def update_item(self, request, pk=None):
+        if signed_carts_enabled(request):
+            return self.update_signed_item(request, int(pk))
         cart = self.get_cart(request)
         try:
             cart_item = CartItem.objects.select_related('product').get(id=pk, cart=cart)
@@ -86,19 +132,52 @@ class CartViewSet(viewsets.ViewSet):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         serializer.save()
+        cart.refresh_totals()
         return Response({
             "message": "Cantidad actualizada",
             "item": CartItemSerializer(cart_item, context={'request': request}).data,
             "cart_total": cart.total_price
         })
     
+    def update_signed_item(self, request, product_id):
+        # En el carrito firmado el id del item es el id del producto
+        if product_id not in SignedCart.from_request(request).quantities:
+            return Response({"error": "Item no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = CartItemUpdateSerializer(data=request.data)
+        serializer.fields['quantity'].required = True
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        cart, error = self.apply_signed(request, [
+            {'op': 'set', 'product_id': product_id, 'quantity': serializer.validated_data['quantity']}
+        ])
+        if error:
+            return error
+        item = next(item for item in cart.items if item.product_id == product_id)
+        return cart.attach(Response({
+            "message": "Cantidad actualizada",
+            "item": CartItemSerializer(item, context={'request': request}).data,
+            "cart_total": cart.total_price
+        }))
+    
     @action(detail=True, methods=['delete'], url_path='remove')
     def remove_item(self, request, pk=None):
+        if signed_carts_enabled(request):
+            cart = SignedCart.from_request(request)
+            if int(pk) not in cart.quantities:
+                return Response({"error": "Item no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+            product = cart.products.get(int(pk))
+            cart.apply([{'op': 'remove', 'product_id': int(pk)}])
+            return cart.attach(Response({
+                "message": f"{product.name if product else 'Producto'} eliminado del carrito",
+                "cart_total": cart.total_price,
+                "cart_items_count": cart.total_items
+            }))
         cart = self.get_cart(request)
         try:
-            cart_item = CartItem.objects.get(id=pk, cart=cart)
+            cart_item = CartItem.objects.select_related('product').get(id=pk, cart=cart)
             product_name = cart_item.product.name
             cart_item.delete()
+            cart.refresh_totals()
             return Response({
                 "message": f"{product_name} eliminado del carrito",
                 "cart_total": cart.total_price,
@@ -107,8 +186,38 @@ class CartViewSet(viewsets.ViewSet):
         except CartItem.DoesNotExist:
             return Response({"error": "Item no encontrado."}, status=status.HTTP_404_NOT_FOUND)
     
+    @action(detail=False, methods=['post'], url_path='batch')
+    @extend_schema(
+        request=CartBatchSerializer,
+        responses=CartSerializer,
+        description=(
+            'Aplica varias operaciones (add, set, remove) en una sola transacción '
+            'y devuelve el carrito final. Si alguna falla no se aplica ninguna.'
+        )
+    )
+    def batch(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        if signed_carts_enabled(request):
+            cart = SignedCart.from_request(request).apply(serializer.validated_data['operations'])
+            return cart.attach(Response(CartSerializer(cart, context={'request': request}).data))
+        
+        # Sin precarga: los items se leen dentro de la transacción del lote
+        apply_cart_operations(get_or_create_cart(request), serializer.validated_data['operations'])
+        cart = self.get_cart(request)
+        return Response(CartSerializer(cart, context={'request': request}).data)
+    
     @action(detail=False, methods=['delete'], url_path='clear')
     def clear_cart(self, request):
+        if signed_carts_enabled(request):
+            items_count = len(SignedCart.from_request(request).quantities)
+            return SignedCart().attach(Response({
+                "message": f"Carrito vaciado. {items_count} productos eliminados.",
+                "cart_total": 0,
+                "cart_items_count": 0
+            }))
         cart = self.get_cart(request)
         items_count = cart.items.count()
         cart.items.all().delete()
@@ -122,6 +231,7 @@ class CartViewSet(viewsets.ViewSet):
 class WishlistViewSet(viewsets.ModelViewSet):
     serializer_class = WishlistSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WishlistCursorPagination
     
     def get_queryset(self):
         return Wishlist.objects.filter(user=self.request.user).select_related('product')
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, OrderStatusHistory
+from .models import Order, OrderItem, OrderStatusHistory, LowStockAlert, StockMovement
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -20,3 +20,34 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
     list_display = ['order', 'status', 'comment', 'created_by', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['order__order_number', 'comment']
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """El libro de inventario solo se lee: los movimientos se agregan desde el código"""
+    list_display = ['product', 'delta', 'reason', 'order', 'created_at']
+    list_filter = ['reason', 'created_at']
+    search_fields = ['product__sku', 'product__name', 'order__order_number']
+    list_select_related = ['product', 'order']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    """Las alertas se abren y cierran solas con los movimientos de stock"""
+    list_display = ['product', 'stock', 'min_stock', 'created_at', 'notified_at']
+    list_filter = ['notified_at']
+    search_fields = ['product__sku', 'product__name']
+    list_select_related = ['product']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
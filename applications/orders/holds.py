@@ -0,0 +1,100 @@
+"""
+Stock apartado durante el checkout.
+
+Antes de crear el PaymentIntent las líneas del carrito se apartan por
+STOCK_HOLD_MINUTES con una clave generada (checkout_<uuid>) y, creado el
+intent, pasan a su id (move_holds): cada StockHold suma su cantidad a
+Product.held_stock en la misma transacción, así que el stock disponible
+(stock - held_stock) se lee de la fila del producto sin recorrer los
+holds. Confirmar el pago libera los holds del PaymentIntent antes de
+descontar el stock.
+
+Los holds vencidos se liberan al validar disponibilidad en el carrito y
+en la orden (release_expired_holds con los productos involucrados) y en
+bloque con la task release_expired_stock_holds. Las lecturas del
+catálogo (listado, detalle, facetas y el filtro in_stock) no liberan:
+siguen descontando un hold vencido hasta que corre la task, así que su
+intervalo de programación es el atraso máximo del stock publicado.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StockHold
+from applications.products.cache import PRODUCTS, invalidate_on_commit
+from applications.products.models import Product
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, 'STOCK_HOLD_MINUTES', 15))
+
+
+def _release(holds):
+    """
+    Borra los holds del queryset y descuenta sus cantidades de held_stock.
+    Las filas se bloquean (saltando las tomadas por otra liberación) para
+    no descontar dos veces el mismo hold
+    """
+    with transaction.atomic():
+        rows = list(holds.select_for_update(skip_locked=True).values_list('pk', 'product_id', 'quantity'))
+        if not rows:
+            return 0
+        quantities = defaultdict(int)
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        Product.objects.unhold_stock(quantities)
+        invalidate_on_commit(PRODUCTS)
+    return len(rows)
+
+
+def release_expired_holds(product_ids=None, now=None):
+    """Libera los holds vencidos (de product_ids o de todos los productos)"""
+    holds = StockHold.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        holds = holds.filter(product__in=list(product_ids))
+    return _release(holds)
+
+
+def release_holds(key):
+    """Libera los holds de un checkout (pago confirmado, cancelado o reintentado)"""
+    if not key:
+        return 0
+    return _release(StockHold.objects.filter(key=key))
+
+
+def move_holds(key, new_key):
+    """
+    Pasa los holds de key a new_key, reemplazando los que ya tuviera
+    new_key (reintento que devolvió el mismo PaymentIntent)
+    """
+    if key == new_key:
+        return
+    with transaction.atomic():
+        release_holds(new_key)
+        StockHold.objects.filter(key=key).update(key=new_key)
+
+
+def place_holds(key, quantities):
+    """
+    Aparta {product_id: cantidad} para el checkout key, reemplazando sus
+    holds anteriores. Todo o nada: devuelve el vencimiento o None si algún
+    producto no tiene stock disponible
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+    expires_at = timezone.now() + hold_duration()
+    with transaction.atomic():
+        release_holds(key)
+        release_expired_holds(quantities)
+        if not Product.objects.filter(is_active=True).hold_stock(quantities):
+            transaction.set_rollback(True)
+            return None
+        StockHold.objects.bulk_create([
+            StockHold(key=key, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+        invalidate_on_commit(PRODUCTS)
+    return expires_at
@@ -0,0 +1,138 @@
+"""
+Reintentos idempotentes del checkout (cabecera Idempotency-Key).
+
+OrderViewSet.create, create_payment_intent y confirm_payment aceptan
+Idempotency-Key; confirm_payment usa el payment_intent_id cuando no
+viene. La primera petición confirma un IdempotencyKey "en curso" (sin
+status_code) en una transacción corta y ejecuta la vista fuera de ella,
+así las llamadas a Stripe no retienen bloqueos de filas; al terminar con
+2xx guarda la respuesta y un reintento la recibe con una sola consulta
+(y la cabecera Idempotent-Replayed). Un duplicado mientras la primera
+sigue en curso responde 409 con Retry-After.
+
+Las respuestas de error no se guardan: la clave se borra y se puede
+volver a usar. Una clave en curso por más de IDEMPOTENCY_LOCK_SECONDS
+(proceso caído) se considera abandonada y la toma la siguiente petición.
+Reusar una clave con otro cuerpo u otro usuario responde 422. Las claves
+vencen a las IDEMPOTENCY_KEY_TTL_HOURS (task purge_idempotency_keys).
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def key_ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+
+
+def request_fingerprint(request):
+    """SHA-256 del usuario, el método, la ruta y el cuerpo de la petición"""
+    user_id = request.user.pk if request.user.is_authenticated else None
+    payload = json.dumps(
+        [user_id, request.method, request.path, request.data], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def abandoned(record, now):
+    """Clave que sigue en curso pasado IDEMPOTENCY_LOCK_SECONDS"""
+    return record.status_code is None and record.created_at <= now - lock_timeout()
+
+
+def replay(record, fingerprint):
+    """
+    Respuesta guardada de record, 422 si la clave vino con otra petición o
+    409 si la primera todavía está en curso
+    """
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"error": "La Idempotency-Key ya se usó con otra petición"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"error": "La petición con esta Idempotency-Key todavía está en curso"},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'},
+        )
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(scope, default_key=None):
+    """
+    Decorador para vistas de api_view y acciones de ViewSet. default_key
+    (request -> str) da la clave cuando no viene la cabecera; sin clave la
+    vista se ejecuta como siempre
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.headers.get(HEADER) or (default_key(request) if default_key else None)
+            if not key:
+                return view(*args, **kwargs)
+            key = str(key)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} admite hasta {MAX_KEY_LENGTH} caracteres"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            fingerprint = request_fingerprint(request)
+            now = timezone.now()
+            keys = IdempotencyKey.objects.filter(scope=scope, key=key)
+            stored = keys.filter(expires_at__gt=now).first()
+            if stored and not abandoned(stored, now):
+                return replay(stored, fingerprint)
+
+            try:
+                # Transacción corta: la clave queda en curso y visible para
+                # los duplicados antes de ejecutar la vista
+                with transaction.atomic():
+                    keys.filter(expires_at__lte=now).delete()
+                    if stored:
+                        keys.filter(pk=stored.pk, status_code__isnull=True).delete()
+                    record = IdempotencyKey.objects.create(
+                        scope=scope, key=key, fingerprint=fingerprint, expires_at=now + key_ttl()
+                    )
+            except IntegrityError:
+                # Otra petición la tomó primero; si ya la borró, sigue en curso
+                # para este cliente hasta que reintente
+                stored = keys.first()
+                return replay(stored or IdempotencyKey(fingerprint=fingerprint), fingerprint)
+
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                keys.filter(pk=record.pk).delete()
+                raise
+            if status.is_success(response.status_code):
+                keys.filter(pk=record.pk).update(status_code=response.status_code, response=response.data)
+            else:
+                keys.filter(pk=record.pk).delete()
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired_keys(now=None):
+    """Borra las claves vencidas; devuelve cuántas"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
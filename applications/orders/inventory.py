@@ -0,0 +1,96 @@
+"""
+Libro de movimientos de inventario.
+
+Cada cambio de stock agrega filas a StockMovement (un INSERT por
+operación, sin importar cuántos productos toque) en la misma transacción
+que actualiza Product.stock, que queda como proyección cacheada de la suma
+de los movimientos:
+
+- checkout y cancelación: reserve_stock / release_stock más
+  record_stock_movements con la orden
+- ediciones desde el admin o la API: señales de Product (ajuste por la
+  diferencia con el stock guardado)
+- import_products: un movimiento 'import' por producto cuyo stock cambió
+
+rebuild_stock recalcula la proyección desde el libro con un único UPDATE;
+stock_drift (task check_stock_drift) lista los productos que no cuadran.
+
+Cada escritura del libro revisa además el min_stock de los productos
+tocados (detect_low_stock) y abre o cierra sus LowStockAlert.
+"""
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import LowStockAlert, StockMovement
+from applications.products.cache import PRODUCTS, invalidate_on_commit
+from applications.products.models import Product
+
+
+def record_stock_movements(deltas, reason, order=None):
+    """
+    Agrega un movimiento por producto de {product_id: delta} (los delta en
+    cero se omiten) con un único INSERT y revisa el stock bajo de todos
+    """
+    movements = [
+        StockMovement(product_id=product_id, order=order, reason=reason, delta=delta)
+        for product_id, delta in deltas.items()
+        if product_id and delta
+    ]
+    created = StockMovement.objects.bulk_create(movements)
+    detect_low_stock([product_id for product_id in deltas if product_id])
+    return created
+
+
+def detect_low_stock(product_ids):
+    """
+    Abre una alerta para los productos de product_ids que quedaron en o
+    bajo su min_stock (o actualiza el stock de la abierta, sin duplicarla)
+    y cierra las de los que se repusieron. Lee solo esas filas por pk
+    """
+    if not product_ids:
+        return
+    low = {
+        pk: (stock, min_stock)
+        for pk, stock, min_stock in Product.objects.filter(pk__in=product_ids).low_stock().values_list(
+            'pk', 'stock', 'min_stock'
+        )
+    }
+    if low:
+        LowStockAlert.objects.bulk_create(
+            [LowStockAlert(product_id=pk, stock=stock, min_stock=min_stock) for pk, (stock, min_stock) in low.items()],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['stock', 'min_stock'],
+        )
+    recovered = [pk for pk in product_ids if pk not in low]
+    if recovered:
+        LowStockAlert.objects.filter(product__in=recovered).delete()
+
+
+def ledger_stock():
+    """Suma de los movimientos del producto de la fila (0 si no tiene)"""
+    total = StockMovement.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Sum('delta')
+    ).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def stock_drift(queryset=None):
+    """Productos cuyo stock no coincide con la suma de sus movimientos"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    return queryset.annotate(ledger_stock=ledger_stock()).exclude(stock=F('ledger_stock'))
+
+
+def rebuild_stock():
+    """
+    Reescribe Product.stock desde el libro en un único UPDATE, solo en los
+    productos con diferencias. Devuelve cuántos corrigió
+    """
+    with transaction.atomic():
+        updated = Product.objects.filter(
+            pk__in=stock_drift().values('pk')
+        ).update(stock=ledger_stock())
+        if updated:
+            invalidate_on_commit(PRODUCTS)
+    return updated
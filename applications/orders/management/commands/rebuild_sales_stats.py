@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from applications.orders.sales import WINDOWS, rebuild_sales_stats, roll_sales_windows
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the daily sales table from existing order items and recompute the "
+        f"rolling {'/'.join(str(days) for days in WINDOWS)}-day sales ranks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--roll-only",
+            action="store_true",
+            help="Only recompute the rolling windows from the daily sales table",
+        )
+
+    def handle(self, *args, **options):
+        if options["roll_only"]:
+            ranked = roll_sales_windows()
+        else:
+            ranked = rebuild_sales_stats()
+        self.stdout.write(self.style.SUCCESS(f"Sales ranks updated for {ranked} products."))
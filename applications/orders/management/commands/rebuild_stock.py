@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from applications.orders.inventory import rebuild_stock, stock_drift
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Product.stock desde el libro de movimientos de stock para cada "
+        "producto cuyo stock no coincide con la suma de sus movimientos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Solo informa los productos descuadrados respecto del libro, sin corregirlos",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = stock_drift().order_by("pk").values_list("sku", "stock", "ledger_stock")
+            for sku, stock, ledger in drift.iterator():
+                self.stdout.write(f"{sku}: stock {stock}, libro {ledger}")
+            self.stdout.write(self.style.SUCCESS(f"{drift.count()} productos descuadrados respecto del libro."))
+            return
+        fixed = rebuild_stock()
+        self.stdout.write(self.style.SUCCESS(f"Stock recalculado desde el libro para {fixed} productos."))
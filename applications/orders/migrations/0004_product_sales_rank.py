@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_related_products'),
+        ('orders', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesRank',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_rank', serialize=False, to='products.product', verbose_name='Producto')),
+                ('units_7d', models.IntegerField(default=0)),
+                ('units_30d', models.IntegerField(default=0)),
+                ('units_90d', models.IntegerField(default=0)),
+                ('revenue_7d', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_30d', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_90d', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('rolled_on', models.DateField(blank=True, help_text='Último día en que se recalcularon las ventanas', null=True)),
+            ],
+            options={
+                'verbose_name': 'Ranking de ventas',
+                'verbose_name_plural': 'Ranking de ventas',
+                'indexes': [models.Index(fields=['-units_7d'], name='orders_prod_units_7_d42130_idx'), models.Index(fields=['-units_30d'], name='orders_prod_units_3_8f3dec_idx'), models.Index(fields=['-units_90d'], name='orders_prod_units_9_02943b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='products.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Ventas diarias',
+                'verbose_name_plural': 'Ventas diarias',
+                'indexes': [models.Index(fields=['date'], name='orders_prod_date_0e1c87_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsalesday',
+            constraint=models.UniqueConstraint(fields=('product', 'date'), name='unique_product_sales_day'),
+        ),
+    ]
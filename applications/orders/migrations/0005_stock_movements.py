@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_ledger(apps, schema_editor):
+    """
+    El stock actual ya refleja las ventas anteriores: se toma como saldo
+    inicial de cada producto
+    """
+    Product = apps.get_model('products', 'Product')
+    StockMovement = apps.get_model('orders', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(product_id=pk, reason='initial', delta=stock)
+            for pk, stock in Product.objects.exclude(stock=0).values_list('pk', 'stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_image_variants'),
+        ('orders', '0004_product_sales_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('initial', 'Stock inicial'), ('sale', 'Venta'), ('cancellation', 'Cancelación'), ('adjustment', 'Ajuste manual'), ('import', 'Importación')], max_length=20, verbose_name='Motivo')),
+                ('delta', models.IntegerField(help_text='Unidades que entran (+) o salen (-)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='orders.order', verbose_name='Orden')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='orders_stoc_product_bd8bb5_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
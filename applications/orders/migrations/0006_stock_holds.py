@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_held_stock'),
+        ('orders', '0005_stock_movements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Identificador del checkout (PaymentIntent)', max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='products.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Stock apartado',
+                'verbose_name_plural': 'Stock apartado',
+                'indexes': [models.Index(fields=['expires_at'], name='orders_stoc_expires_a9b1e2_idx'), models.Index(fields=['product', 'expires_at'], name='orders_stoc_product_4229f0_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockhold',
+            constraint=models.UniqueConstraint(fields=('key', 'product'), name='unique_stock_hold'),
+        ),
+    ]
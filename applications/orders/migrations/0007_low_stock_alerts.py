@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+
+
+def open_alerts(apps, schema_editor):
+    """Alertas para los productos que ya están en o bajo su min_stock"""
+    Product = apps.get_model('products', 'Product')
+    LowStockAlert = apps.get_model('orders', 'LowStockAlert')
+    LowStockAlert.objects.bulk_create(
+        [
+            LowStockAlert(product_id=pk, stock=stock, min_stock=min_stock)
+            for pk, stock, min_stock in Product.objects.filter(
+                is_active=True, stock__lte=F('min_stock')
+            ).values_list('pk', 'stock', 'min_stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_low_stock_index'),
+        ('orders', '0006_stock_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='low_stock_alert', serialize=False, to='products.product', verbose_name='Producto')),
+                ('stock', models.IntegerField(help_text='Stock al detectarse')),
+                ('min_stock', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Alerta de stock bajo',
+                'verbose_name_plural': 'Alertas de stock bajo',
+                'indexes': [models.Index(fields=['notified_at'], name='orders_lows_notifie_223b9d_idx')],
+            },
+        ),
+        migrations.RunPython(open_alerts, migrations.RunPython.noop),
+    ]
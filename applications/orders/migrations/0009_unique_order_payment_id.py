@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_orde_payment_59dc0b_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_id__isnull', False), models.Q(('payment_id', ''), _negated=True)), fields=('payment_id',), name='unique_order_payment_id'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_unique_order_payment_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='emailed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='webhook_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
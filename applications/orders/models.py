@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
 from applications.products.models import Product
@@ -52,6 +53,17 @@ class Order(models.Model):
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
+        constraints = [
+            # Una sola orden por pago (ver confirm_payment)
+            models.UniqueConstraint(
+                fields=['payment_id'],
+                condition=models.Q(payment_id__isnull=False) & ~models.Q(payment_id=''),
+                name='unique_order_payment_id',
+            ),
+        ]
 
     def __str__(self):
         return f"Orden {self.order_number} - {self.user.username}"
@@ -106,3 +118,156 @@ class Coupon(models.Model):
 
     def __str__(self):
         return self.code
+
+class ProductSalesDay(models.Model):
+    """Unidades e ingresos vendidos por producto y día (ver sales.py)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_days', verbose_name='Producto')
+    date = models.DateField(verbose_name='Fecha')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Ventas diarias'
+        verbose_name_plural = 'Ventas diarias'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_product_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.date}: {self.units}"
+
+class ProductSalesRank(models.Model):
+    """Ventas por producto en ventanas móviles de 7, 30 y 90 días"""
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='sales_rank', verbose_name='Producto'
+    )
+    units_7d = models.IntegerField(default=0)
+    units_30d = models.IntegerField(default=0)
+    units_90d = models.IntegerField(default=0)
+    revenue_7d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_30d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_90d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rolled_on = models.DateField(null=True, blank=True, help_text='Último día en que se recalcularon las ventanas')
+
+    class Meta:
+        verbose_name = 'Ranking de ventas'
+        verbose_name_plural = 'Ranking de ventas'
+        indexes = [
+            models.Index(fields=['-units_7d']),
+            models.Index(fields=['-units_30d']),
+            models.Index(fields=['-units_90d']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.units_30d} (30d)"
+
+class StockMovement(models.Model):
+    """
+    Movimiento del inventario (solo se agregan filas, ver inventory.py).
+    Product.stock es la proyección de la suma de delta por producto
+    """
+    REASON_CHOICES = [
+        ('initial', 'Stock inicial'),
+        ('sale', 'Venta'),
+        ('cancellation', 'Cancelación'),
+        ('adjustment', 'Ajuste manual'),
+        ('import', 'Importación'),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements', verbose_name='Producto')
+    order = models.ForeignKey(
+        Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements', verbose_name='Orden'
+    )
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name='Motivo')
+    delta = models.IntegerField(help_text='Unidades que entran (+) o salen (-)')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Movimiento de stock'
+        verbose_name_plural = 'Movimientos de stock'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.delta:+d} ({self.reason})"
+
+class StockHold(models.Model):
+    """
+    Unidades apartadas para un checkout en curso (ver holds.py). Cuentan
+    contra el stock disponible a través de Product.held_stock hasta que se
+    confirma el pago, se liberan o vencen
+    """
+    key = models.CharField(max_length=100, help_text='Identificador del checkout (PaymentIntent)')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds', verbose_name='Producto')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Stock apartado'
+        verbose_name_plural = 'Stock apartado'
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'product'], name='unique_stock_hold'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['product', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.product_id} x{self.quantity}"
+
+class LowStockAlert(models.Model):
+    """
+    Producto que quedó en o bajo su min_stock (ver inventory.detect_low_stock).
+    Hay como máximo una alerta por producto; se borra al reponer el stock.
+    El resumen (task send_low_stock_digest) marca el envío por cada canal y
+    notified_at cuando llegó por todos los configurados
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='low_stock_alert', verbose_name='Producto'
+    )
+    stock = models.IntegerField(help_text='Stock al detectarse')
+    min_stock = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+    webhook_sent_at = models.DateTimeField(null=True, blank=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Alerta de stock bajo'
+        verbose_name_plural = 'Alertas de stock bajo'
+        indexes = [
+            models.Index(fields=['notified_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.stock} <= {self.min_stock}"
+
+class IdempotencyKey(models.Model):
+    """
+    Respuesta guardada de una petición con Idempotency-Key (ver
+    idempotency.py). La fila se confirma al empezar a procesar, sin
+    status_code mientras la petición está en curso
+    """
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text='SHA-256 del usuario, la ruta y el cuerpo')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Clave de idempotencia'
+        verbose_name_plural = 'Claves de idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}: {self.key}"
@@ -0,0 +1,151 @@
+"""
+Ranking de ventas por producto en ventanas móviles (7, 30 y 90 días).
+
+- ProductSalesDay acumula unidades e ingresos por producto y día.
+- ProductSalesRank guarda las sumas de cada ventana para ordenar
+  best_sellers con una lectura indexada.
+
+Confirmar o cancelar una orden suma o resta sus items en ambas tablas
+con un número fijo de consultas (record_order_sales). Como las ventanas
+avanzan con el calendario, roll_sales_windows (task diaria) las recalcula
+desde ProductSalesDay y descarta los días fuera de la ventana más larga;
+rebuild_sales_stats reconstruye todo desde OrderItem.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import OrderItem, ProductSalesDay, ProductSalesRank
+from applications.products.cache import PRODUCTS, invalidate_on_commit
+
+WINDOWS = (7, 30, 90)
+# Estados en los que una orden cuenta como venta
+SALE_STATUSES = ('confirmed', 'processing', 'shipped', 'in_transit', 'delivered')
+
+
+def window_start(days, today=None):
+    """Primer día incluido en la ventana de days días que termina hoy"""
+    return (today or timezone.localdate()) - timedelta(days=days - 1)
+
+
+def order_sales_lines(order):
+    """[(product_id, unidades, ingresos)] de los items de la orden"""
+    return list(order.items.filter(product__isnull=False).values_list('product_id', 'quantity', 'subtotal'))
+
+
+def _increment(field, deltas, output_field):
+    """field + CASE product_id WHEN ... THEN delta END"""
+    return F(field) + Case(
+        *[When(product_id=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def record_order_sales(order, lines, sign=1):
+    """
+    Suma (sign=1) o resta (sign=-1) las líneas [(product_id, unidades,
+    ingresos)] de la orden en su día y en las ventanas que lo incluyen
+    """
+    units = defaultdict(int)
+    revenue = defaultdict(Decimal)
+    for product_id, quantity, subtotal in lines:
+        if product_id:
+            units[product_id] += sign * quantity
+            revenue[product_id] += sign * Decimal(subtotal)
+    if not units:
+        return
+
+    day = timezone.localdate(order.created_at)
+    with transaction.atomic():
+        # Crear las filas que falten primero y sumar después con UPDATE
+        # mantiene correctos los incrementos concurrentes
+        ProductSalesDay.objects.bulk_create(
+            [ProductSalesDay(product_id=pk, date=day) for pk in units], ignore_conflicts=True
+        )
+        ProductSalesDay.objects.filter(product_id__in=units, date=day).update(
+            units=_increment('units', units, IntegerField()),
+            revenue=_increment('revenue', revenue, DecimalField()),
+        )
+
+        windows = [days for days in WINDOWS if day >= window_start(days)]
+        if windows:
+            ProductSalesRank.objects.bulk_create(
+                [ProductSalesRank(product_id=pk) for pk in units], ignore_conflicts=True
+            )
+            updates = {}
+            for days in windows:
+                updates[f'units_{days}d'] = _increment(f'units_{days}d', units, IntegerField())
+                updates[f'revenue_{days}d'] = _increment(f'revenue_{days}d', revenue, DecimalField())
+            ProductSalesRank.objects.filter(product_id__in=units).update(**updates)
+        invalidate_on_commit(PRODUCTS)
+
+
+def roll_sales_windows(today=None):
+    """
+    Recalcula las ventanas de todos los productos desde ProductSalesDay y
+    borra los días que ya no entran en ninguna. Devuelve cuántos productos
+    tienen ventas en la ventana más larga
+    """
+    today = today or timezone.localdate()
+    oldest = window_start(max(WINDOWS), today)
+    sums = {}
+    for days in WINDOWS:
+        in_window = Q(date__gte=window_start(days, today))
+        sums[f'units_{days}d'] = Coalesce(Sum('units', filter=in_window), 0)
+        sums[f'revenue_{days}d'] = Coalesce(
+            Sum('revenue', filter=in_window), Value(Decimal('0')), output_field=DecimalField()
+        )
+    rows = ProductSalesDay.objects.filter(date__gte=oldest, date__lte=today).values('product_id').annotate(**sums)
+    ranks = [ProductSalesRank(rolled_on=today, **row) for row in rows]
+
+    with transaction.atomic():
+        ProductSalesDay.objects.filter(date__lt=oldest).delete()
+        ProductSalesRank.objects.exclude(product_id__in=[rank.product_id for rank in ranks]).delete()
+        ProductSalesRank.objects.bulk_create(
+            ranks,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=[*sums, 'rolled_on'],
+            batch_size=1000,
+        )
+        invalidate_on_commit(PRODUCTS)
+    return len(ranks)
+
+
+def rebuild_sales_stats(today=None):
+    """
+    Reconstruye ProductSalesDay desde los items de órdenes vendidas en la
+    ventana más larga y recalcula las ventanas
+    """
+    today = today or timezone.localdate()
+    oldest = window_start(max(WINDOWS), today)
+    days = (
+        OrderItem.objects.filter(
+            product__isnull=False,
+            order__status__in=SALE_STATUSES,
+            order__created_at__date__gte=oldest,
+        )
+        .annotate(date=TruncDate('order__created_at'))
+        .values('product_id', 'date')
+        .annotate(total_units=Sum('quantity'), total_revenue=Sum('subtotal'))
+        .order_by()
+    )
+    with transaction.atomic():
+        ProductSalesDay.objects.all().delete()
+        ProductSalesDay.objects.bulk_create(
+            [
+                ProductSalesDay(
+                    product_id=row['product_id'], date=row['date'],
+                    units=row['total_units'], revenue=row['total_revenue'],
+                )
+                for row in days
+            ],
+            batch_size=1000,
+        )
+        return roll_sales_windows(today)
@@ -1,8 +1,16 @@
 from rest_framework import serializers
+from collections import defaultdict
 from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth.models import User
 from .models import Order, OrderItem, OrderStatusHistory, Coupon
+from .holds import release_expired_holds, release_holds
+from .inventory import record_stock_movements
+from .sales import record_order_sales
+from .utils import stock_problems
+from applications.products.cache import PRODUCTS, invalidate_on_commit
 from applications.products.models import Product
 
 
@@ -48,14 +56,10 @@ class OrderCreateItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField()
 
     def validate(self, data):
-        try:
-            product = Product.objects.get(id=data['product_id'], is_active=True)
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Producto no encontrado o inactivo.")
+        # Existencia, estado y stock se validan para toda la orden a la vez
+        # en OrderCreateSerializer.create (una sola consulta)
         if data['quantity'] < 1:
             raise serializers.ValidationError("La cantidad debe ser al menos 1.")
-        if data['quantity'] > product.stock:
-            raise serializers.ValidationError(f"Stock insuficiente ({product.stock})")
         return data
 
 
@@ -97,53 +101,78 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 
         # Limpieza de campos no permitidos en create directo
         validated_data.pop('user', None)
+        # Checkout iniciado con create_payment_intent (ver holds.py)
+        hold_key = validated_data.pop('hold_key', None)
         validated_data.pop('status', None)
         validated_data.pop('is_paid', None)
         validated_data.pop('paid_at', None)
 
-        subtotal = Decimal('0')
+        quantities = defaultdict(int)
         for item in items_data:
-            try:
-                product = Product.objects.get(id=item['product_id'])
-                subtotal += product.final_price * item['quantity']
-            except Product.DoesNotExist:
-                continue
-
-        shipping_cost = Decimal('10')
-        tax = subtotal * Decimal('0.18')
-        discount = Decimal('0')
-        applied_coupon = None
-
-        if coupon_code:
-            try:
-                coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-                if coupon.discount_type == 'amount':
-                    discount = coupon.discount_value
-                elif coupon.discount_type == 'percent':
-                    discount = subtotal * (coupon.discount_value / 100)
-                applied_coupon = coupon
-            except Coupon.DoesNotExist:
-                pass
-
-        total = subtotal + shipping_cost + tax - discount
-
-        order = Order.objects.create(
-            user=user,  # Usuario real o invitado
-            subtotal=subtotal,
-            shipping_cost=shipping_cost,
-            tax=tax,
-            discount=discount,
-            total=total,
-            status='confirmed',
-            is_paid=True,
-            paid_at=timezone.now(),
-            **validated_data,
-        )
+            quantities[item['product_id']] += item['quantity']
+
+        # Todo el checkout es una sola transacción: si alguna línea no tiene
+        # stock, no queda ni la orden ni ningún descuento de stock.
+        # Número de consultas constante sin importar las líneas de la orden.
+        with transaction.atomic():
+            # Lo apartado por este checkout deja de contar y los holds
+            # vencidos de estos productos se liberan antes de validar
+            release_holds(hold_key)
+            release_expired_holds(quantities)
+            # Carga y bloquea todos los productos en una consulta, en orden de
+            # pk para que los checkouts concurrentes no se bloqueen mutuamente
+            # (select_for_update no tiene efecto en SQLite)
+            products = Product.objects.select_for_update().filter(
+                pk__in=quantities
+            ).order_by('pk').in_bulk()
+            problems = stock_problems(products, quantities)
+            if problems:
+                raise serializers.ValidationError({'items': problems})
+            # UPDATE condicional: la garantía real frente a otros checkouts
+            if not Product.objects.filter(is_active=True).reserve_stock(quantities):
+                raise serializers.ValidationError({'items': ["Stock insuficiente"]})
+            invalidate_on_commit(PRODUCTS)
+
+            subtotal = sum(
+                (products[item['product_id']].final_price * item['quantity'] for item in items_data),
+                Decimal('0')
+            )
 
-        for item in items_data:
-            try:
-                product = Product.objects.get(id=item['product_id'])
-                OrderItem.objects.create(
+            shipping_cost = Decimal('10')
+            tax = subtotal * Decimal('0.18')
+            discount = Decimal('0')
+            applied_coupon = None
+
+            if coupon_code:
+                try:
+                    coupon = Coupon.objects.get(code=coupon_code, is_active=True)
+                    if coupon.discount_type == 'amount':
+                        discount = coupon.discount_value
+                    elif coupon.discount_type == 'percent':
+                        discount = subtotal * (coupon.discount_value / 100)
+                    applied_coupon = coupon
+                except Coupon.DoesNotExist:
+                    pass
+
+            total = subtotal + shipping_cost + tax - discount
+
+            order = Order.objects.create(
+                user=user,  # Usuario real o invitado
+                subtotal=subtotal,
+                shipping_cost=shipping_cost,
+                tax=tax,
+                discount=discount,
+                total=total,
+                status='confirmed',
+                is_paid=True,
+                paid_at=timezone.now(),
+                **validated_data,
+            )
+
+            order_items = []
+            for item in items_data:
+                product = products[item['product_id']]
+                order_items.append(OrderItem(
                     order=order,
                     product=product,
                     product_name=product.name,
@@ -151,15 +180,15 @@ class OrderCreateSerializer(serializers.ModelSerializer):
                     product_price=product.final_price,
                     quantity=item['quantity'],
                     subtotal=product.final_price * item['quantity'],
-                )
-                product.stock -= item['quantity']
-                product.save()
-            except Product.DoesNotExist:
-                continue
-
-        if applied_coupon:
-            applied_coupon.used_count += 1
-            applied_coupon.save()
+                ))
+            OrderItem.objects.bulk_create(order_items)
+            record_stock_movements({pk: -qty for pk, qty in quantities.items()}, 'sale', order)
+            record_order_sales(
+                order, [(item.product_id, item.quantity, item.subtotal) for item in order_items]
+            )
+
+            if applied_coupon:
+                Coupon.objects.filter(pk=applied_coupon.pk).update(used_count=F('used_count') + 1)
             
         return order
 
@@ -2,7 +2,6 @@ from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from .models import Order, OrderStatusHistory, OrderItem
-from applications.products.models import Product
 
 @receiver(pre_save, sender=Order)
 def calculate_totals(sender, instance, **kwargs):
@@ -25,12 +24,3 @@ def create_status_history(sender, instance, created, **kwargs):
             comment='Orden creada',
             created_by=instance.user
         )
-
-@receiver(post_save, sender=Order)
-def update_stock(sender, instance, created, **kwargs):
-    if created:
-        for item in instance.items.all():
-            product = item.product
-            if product:
-                product.stock = max(product.stock - item.quantity, 0)
-                product.save()
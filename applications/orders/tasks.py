@@ -1,6 +1,13 @@
+import json
+import logging
+from urllib.request import Request, urlopen
+
 from celery import shared_task
+from django.conf import settings
 from django.core.mail import send_mail
 
+logger = logging.getLogger(__name__)
+
 @shared_task
 def send_order_confirmation_email(user_email, order_number):
     subject = f"Confirmación de Orden {order_number}"
@@ -8,6 +15,128 @@ def send_order_confirmation_email(user_email, order_number):
     send_mail(subject, message, 'no-reply@ecommerce.com', [user_email])
 
 @shared_task
-def clean_old_carts():
-    # Aquí la lógica para limpiar carritos antiguos
-    pass
+def clean_old_carts(retention_days=None, batch_size=None, dry_run=False):
+    """
+    Elimina carritos anónimos abandonados, sus items y sesiones
+    (ver cart.utils.purge_abandoned_carts)
+    """
+    from applications.cart.utils import purge_abandoned_carts
+    return purge_abandoned_carts(retention_days, batch_size, dry_run)
+
+@shared_task
+def roll_sales_windows():
+    """
+    Avanza las ventanas móviles del ranking de ventas (programar a diario)
+    """
+    from .sales import roll_sales_windows as roll
+    return roll()
+
+@shared_task
+def check_stock_drift(limit=20):
+    """
+    Informa los productos cuyo stock no cuadra con el libro de inventario
+    (programar periódicamente; corregir con el comando rebuild_stock)
+    """
+    from .inventory import stock_drift
+
+    drift = stock_drift()
+    total = drift.count()
+    if total:
+        sample = list(drift.order_by('pk').values_list('sku', 'stock', 'ledger_stock')[:limit])
+        logger.warning("Stock descuadrado en %d productos (sku, stock, libro): %s", total, sample)
+    return total
+
+@shared_task
+def release_expired_stock_holds():
+    """
+    Libera en bloque el stock apartado por checkouts vencidos. Programar
+    cada pocos minutos: el catálogo muestra los holds vencidos hasta que
+    corre (el carrito y la orden ya liberan los de sus productos)
+    """
+    from .holds import release_expired_holds
+    return release_expired_holds()
+
+@shared_task
+def purge_idempotency_keys():
+    """
+    Borra las Idempotency-Key vencidas (programar a diario)
+    """
+    from .idempotency import purge_expired_keys
+    return purge_expired_keys()
+
+@shared_task
+def send_low_stock_digest(limit=500):
+    """
+    Envía en un solo resumen las alertas de stock bajo aún no notificadas
+    (por email a LOW_STOCK_ALERT_EMAILS y/o POST a LOW_STOCK_WEBHOOK_URL).
+    Cada canal marca las que entregó, así que un canal caído las reintenta
+    en la próxima ejecución sin repetir el otro; notified_at se marca al
+    completar todos. Programar periódicamente; devuelve cuántas completó
+    """
+    from django.utils import timezone
+    from .models import LowStockAlert
+
+    emails = getattr(settings, 'LOW_STOCK_ALERT_EMAILS', [])
+    webhook_url = getattr(settings, 'LOW_STOCK_WEBHOOK_URL', '')
+    if not emails and not webhook_url:
+        return 0
+
+    alerts = list(
+        LowStockAlert.objects.filter(notified_at__isnull=True).select_related('product').order_by('created_at')[:limit]
+    )
+    if not alerts:
+        return 0
+
+    def mark(sent, field):
+        # Por pk y created_at leídos: una alerta borrada y vuelta a crear
+        # mientras tanto es otra y queda pendiente
+        now = timezone.now()
+        LowStockAlert.objects.filter(
+            pk__in=[alert.pk for alert in sent], created_at__in={alert.created_at for alert in sent}
+        ).update(**{field: now})
+        for alert in sent:
+            setattr(alert, field, now)
+
+    pending = [alert for alert in alerts if alert.emailed_at is None]
+    if emails and pending:
+        lines = [
+            f"- {alert.product.sku} {alert.product.name}: stock {alert.stock} (mínimo {alert.min_stock})"
+            for alert in pending
+        ]
+        subject = f"Stock bajo en {len(pending)} productos"
+        try:
+            send_mail(subject, "\n".join(lines), 'no-reply@ecommerce.com', emails)
+        except OSError as error:
+            logger.error("No se pudo enviar el resumen de stock bajo por email: %s", error)
+        else:
+            mark(pending, 'emailed_at')
+
+    pending = [alert for alert in alerts if alert.webhook_sent_at is None]
+    if webhook_url and pending:
+        payload = json.dumps({'alerts': [
+            {
+                'product_id': alert.product_id,
+                'sku': alert.product.sku,
+                'name': alert.product.name,
+                'stock': alert.stock,
+                'min_stock': alert.min_stock,
+                'created_at': alert.created_at.isoformat(),
+            }
+            for alert in pending
+        ]}).encode()
+        request = Request(webhook_url, data=payload, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=5):
+                pass
+        except OSError as error:
+            logger.error("No se pudo enviar el resumen de stock bajo a %s: %s", webhook_url, error)
+        else:
+            mark(pending, 'webhook_sent_at')
+
+    done = [
+        alert for alert in alerts
+        if (not emails or alert.emailed_at) and (not webhook_url or alert.webhook_sent_at)
+    ]
+    if done:
+        mark(done, 'notified_at')
+    return len(done)
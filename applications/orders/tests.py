@@ -1,12 +1,41 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib import admin
 from django.contrib.auth.models import User
-from .models import Cart, CartItem
-from applications.products.models import Product
+from django.core import mail
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APITestCase
+from applications.cart.models import Cart, CartItem
+from applications.cart.utils import merge_quantities
+from applications.products.admin import ProductAdmin
+from applications.products.models import Category, Product
+from . import views
+from .holds import place_holds
+from .inventory import stock_drift
+from .models import (
+    IdempotencyKey, LowStockAlert, Order, OrderItem, ProductSalesDay, ProductSalesRank, StockHold, StockMovement,
+)
+from .sales import roll_sales_windows
+from .serializers import OrderCreateSerializer
+from .tasks import (
+    check_stock_drift, purge_idempotency_keys, release_expired_stock_holds, send_low_stock_digest,
+)
 
 class CartTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpass')
-        self.product = Product.objects.create(name='Silla', price=50, stock=20, is_active=True)
+        self.category = Category.objects.create(name='Sillas')
+        self.product = Product.objects.create(name='Silla', sku='SILLA-1', category=self.category, price=50, stock=20, is_active=True)
         self.cart = Cart.objects.create(user=self.user)
         self.cart_item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
 
@@ -17,9 +46,605 @@ class CartTestCase(TestCase):
         self.assertEqual(self.cart.total_items, 2)
 
     def test_add_item(self):
-        new_item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=3)
+        banco = Product.objects.create(name='Banco', sku='BANCO-1', category=self.category, price=30, stock=20)
+        new_item = CartItem.objects.create(cart=self.cart, product=banco, quantity=3)
         self.assertEqual(self.cart.total_items, 5)
 
     def test_remove_item(self):
         self.cart_item.delete()
         self.assertEqual(self.cart.items.count(), 0)
+
+
+ORDER_DATA = {
+    'full_name': 'Ana Pérez', 'email': 'ana@example.com', 'phone': '999999999',
+    'address_line1': 'Av. Siempre Viva 123', 'city': 'Lima', 'state': 'Lima',
+    'postal_code': '15001', 'country': 'Perú',
+}
+
+
+def create_order(user, items):
+    serializer = OrderCreateSerializer(
+        data=dict(ORDER_DATA, items=items),
+        context={'request': SimpleNamespace(user=user)}
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class CheckoutStockTest(APITestCase):
+    """
+    El checkout reserva el stock de todas las líneas o de ninguna
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Comedor')
+        self.mesa = Product.objects.create(name='Mesa', sku='MESA-1', category=category, price=300, stock=5)
+        self.silla = Product.objects.create(name='Silla', sku='SILLA-1', category=category, price=80, stock=2)
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock
+
+    def test_decrements_stock_once(self):
+        order = create_order(self.user, [
+            {'product_id': self.mesa.pk, 'quantity': 2},
+            {'product_id': self.silla.pk, 'quantity': 1},
+        ])
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(self.stock(self.mesa), 3)
+        self.assertEqual(self.stock(self.silla), 1)
+
+    def test_rejects_whole_order(self):
+        # Ambas líneas pasan la validación por separado, pero la silla
+        # aparece dos veces y juntas superan su stock
+        with self.assertRaises(serializers.ValidationError):
+            create_order(self.user, [
+                {'product_id': self.mesa.pk, 'quantity': 1},
+                {'product_id': self.silla.pk, 'quantity': 2},
+                {'product_id': self.silla.pk, 'quantity': 1},
+            ])
+        self.assertEqual(self.stock(self.mesa), 5)
+        self.assertEqual(self.stock(self.silla), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_inactive_product_rejected(self):
+        self.mesa.is_active = False
+        self.mesa.save()
+        with self.assertRaises(serializers.ValidationError) as error:
+            create_order(self.user, [{'product_id': self.mesa.pk, 'quantity': 1}])
+        self.assertIn('inactivo', str(error.exception.detail['items'][0]))
+        self.assertEqual(self.stock(self.mesa), 5)
+
+    def test_constant_queries(self):
+        """Mismo número de consultas con 2 líneas que con 50"""
+        category = Category.objects.get(name='Comedor')
+        products = [
+            Product.objects.create(name=f'Vaso {i}', sku=f'VASO-{i}', category=category, price=10, stock=100)
+            for i in range(50)
+        ]
+        counts = []
+        for lines in (products[:2], products):
+            with CaptureQueriesContext(connection) as queries:
+                order = create_order(self.user, [{'product_id': p.pk, 'quantity': 2} for p in lines])
+            counts.append(len(queries))
+            self.assertEqual(order.items.count(), len(lines))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.stock(products[0]), 96)
+
+    def test_cancel_restores_stock_once(self):
+        order = create_order(self.user, [{'product_id': self.mesa.pk, 'quantity': 2}])
+        self.client.force_authenticate(self.user)
+        url = reverse('orders-cancel-order', args=[order.order_number])
+        self.assertEqual(self.client.put(url).status_code, 200)
+        self.assertEqual(self.client.put(url).status_code, 400)
+        self.assertEqual(self.stock(self.mesa), 5)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """
+    Checkouts simultáneos del mismo producto nunca venden más que el stock
+    """
+    initial_stock = 5
+    buyers = 12
+
+    def setUp(self):
+        category = Category.objects.create(name='Dormitorio')
+        self.cama = Product.objects.create(name='Cama', sku='CAMA-1', category=category, price=500, stock=self.initial_stock)
+        self.users = [
+            User.objects.create_user(username=f'comprador{i}', password='pass1234')
+            for i in range(self.buyers)
+        ]
+
+    def checkout(self, user, barrier, results):
+        barrier.wait()
+        try:
+            # SQLite serializa las escrituras: reintentar si la base está bloqueada
+            for _ in range(50):
+                try:
+                    create_order(user, [{'product_id': self.cama.pk, 'quantity': 1}])
+                    results.append('ok')
+                    return
+                except OperationalError:
+                    continue
+                except serializers.ValidationError:
+                    results.append('rejected')
+                    return
+            results.append('locked')
+        finally:
+            connection.close()
+
+    def test_no_overselling(self):
+        barrier = threading.Barrier(self.buyers)
+        results = []
+        threads = [
+            threading.Thread(target=self.checkout, args=(user, barrier, results))
+            for user in self.users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.cama.refresh_from_db()
+        sold = results.count('ok')
+        self.assertLessEqual(sold, self.initial_stock)
+        self.assertEqual(self.cama.stock, self.initial_stock - sold)
+        self.assertEqual(OrderItem.objects.filter(product=self.cama).count(), sold)
+        self.assertEqual(Order.objects.count(), sold)
+        if 'locked' not in results:
+            self.assertEqual(sold, self.initial_stock)
+
+
+class SalesRankTest(APITestCase):
+    """
+    Ranking de ventas en ventanas móviles mantenido por checkout y cancelación
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        self.living = Category.objects.create(name='Living')
+        self.sofas = Category.objects.create(name='Sofás', parent=self.living)
+        self.jardin = Category.objects.create(name='Jardín')
+        self.sofa = Product.objects.create(name='Sofá', sku='SOFA-1', category=self.sofas, price=500, stock=50)
+        self.mesa = Product.objects.create(name='Mesa', sku='MESA-1', category=self.living, price=200, stock=50)
+        self.reposera = Product.objects.create(
+            name='Reposera', sku='REPO-1', category=self.jardin, price=90, stock=50, views_count=100
+        )
+
+    def rank(self, product):
+        return ProductSalesRank.objects.get(product=product)
+
+    def test_checkout_and_cancel_update_windows(self):
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 2}])
+        order = create_order(self.user, [
+            {'product_id': self.sofa.pk, 'quantity': 1},
+            {'product_id': self.mesa.pk, 'quantity': 3},
+        ])
+        rank = self.rank(self.sofa)
+        self.assertEqual((rank.units_7d, rank.units_30d, rank.units_90d), (3, 3, 3))
+        self.assertEqual(rank.revenue_30d, 1500)
+
+        self.client.force_authenticate(self.user)
+        self.client.put(reverse('orders-cancel-order', args=[order.order_number]))
+        self.assertEqual(self.rank(self.sofa).units_30d, 2)
+        self.assertEqual(self.rank(self.mesa).units_30d, 0)
+        self.assertEqual(ProductSalesDay.objects.get(product=self.sofa).units, 2)
+
+    def test_roll_moves_days_out_of_windows(self):
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 4}])
+        roll_sales_windows(timezone.localdate() + timedelta(days=10))
+        rank = self.rank(self.sofa)
+        self.assertEqual((rank.units_7d, rank.units_30d, rank.units_90d), (0, 4, 4))
+        roll_sales_windows(timezone.localdate() + timedelta(days=100))
+        self.assertFalse(ProductSalesRank.objects.exists())
+        self.assertFalse(ProductSalesDay.objects.exists())
+
+    def test_rebuild_from_order_items(self):
+        create_order(self.user, [{'product_id': self.mesa.pk, 'quantity': 2}])
+        cancelled = create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 5}])
+        Order.objects.filter(pk=cancelled.pk).update(status='cancelled')
+        ProductSalesDay.objects.all().delete()
+        ProductSalesRank.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_sales_stats', stdout=out)
+        self.assertIn('1 products', out.getvalue())
+        self.assertEqual(self.rank(self.mesa).units_7d, 2)
+
+    def test_best_sellers_read_the_rank(self):
+        create_order(self.user, [{'product_id': self.mesa.pk, 'quantity': 3}])
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 1}])
+        response = self.client.get(reverse('product-best-sellers'))
+        # Vendidos primero; el resto por vistas
+        self.assertEqual(
+            [item['id'] for item in response.data], [self.mesa.pk, self.sofa.pk, self.reposera.pk]
+        )
+        response = self.client.get(reverse('product-best-sellers'), {'category': self.living.slug, 'window': 7})
+        self.assertEqual([item['id'] for item in response.data], [self.mesa.pk, self.sofa.pk])
+
+
+class StockLedgerTest(APITestCase):
+    """
+    Cada cambio de stock queda en el libro y la proyección se puede reconstruir
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Comedor')
+        self.mesa = Product.objects.create(name='Mesa', sku='MESA-1', category=category, price=300, stock=5)
+        self.silla = Product.objects.create(name='Silla', sku='SILLA-1', category=category, price=80, stock=8)
+
+    def movements(self, product):
+        return list(
+            StockMovement.objects.filter(product=product).order_by('pk').values_list('reason', 'delta', 'order')
+        )
+
+    def test_checkout_cancel_and_edits_are_recorded(self):
+        order = create_order(self.user, [
+            {'product_id': self.mesa.pk, 'quantity': 2},
+            {'product_id': self.silla.pk, 'quantity': 1},
+            {'product_id': self.silla.pk, 'quantity': 2},
+        ])
+        self.client.force_authenticate(self.user)
+        self.client.put(reverse('orders-cancel-order', args=[order.order_number]))
+
+        self.silla.refresh_from_db()
+        self.silla.stock = 20
+        self.silla.save()
+        self.silla.name = 'Silla de roble'
+        self.silla.save()
+
+        self.assertEqual(self.movements(self.mesa), [
+            ('initial', 5, None), ('sale', -2, order.pk), ('cancellation', 2, order.pk),
+        ])
+        self.assertEqual(self.movements(self.silla), [
+            ('initial', 8, None), ('sale', -3, order.pk), ('cancellation', 3, order.pk), ('adjustment', 12, None),
+        ])
+        self.assertFalse(stock_drift().exists())
+
+    def test_rebuild_fixes_drift(self):
+        create_order(self.user, [{'product_id': self.mesa.pk, 'quantity': 2}])
+        # Cambios por fuera del libro
+        Product.objects.filter(pk=self.mesa.pk).update(stock=40)
+        Product.objects.filter(pk=self.silla.pk).update(stock=0)
+
+        self.assertEqual(check_stock_drift(), 2)
+        out = StringIO()
+        call_command('rebuild_stock', '--check', stdout=out)
+        self.assertIn('MESA-1: stock 40, libro 3', out.getvalue())
+        self.assertEqual(Product.objects.get(pk=self.mesa.pk).stock, 40)
+
+        out = StringIO()
+        call_command('rebuild_stock', stdout=out)
+        self.assertIn('Stock recalculado desde el libro para 2 productos', out.getvalue())
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'stock')), {'MESA-1': 3, 'SILLA-1': 8}
+        )
+        self.assertEqual(check_stock_drift(), 0)
+
+
+class StockHoldTest(APITestCase):
+    """
+    El stock apartado por un checkout no se puede vender a otro hasta que vence
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Living')
+        self.sofa = Product.objects.create(name='Sofá', sku='SOFA-1', category=category, price=500, stock=3)
+        self.puff = Product.objects.create(name='Puff', sku='PUFF-1', category=category, price=50, stock=10)
+
+    def held(self, product):
+        product.refresh_from_db()
+        return product.held_stock
+
+    def test_holds_count_against_available_stock(self):
+        self.assertIsNotNone(place_holds('pi_ana', {self.sofa.pk: 2, self.puff.pk: 1}))
+        self.assertEqual(self.held(self.sofa), 2)
+        self.assertEqual(self.sofa.available_stock, 1)
+
+        # Todo o nada: el puff tampoco queda apartado
+        self.assertIsNone(place_holds('pi_luis', {self.sofa.pk: 2, self.puff.pk: 1}))
+        self.assertEqual(self.held(self.puff), 1)
+        with self.assertRaises(serializers.ValidationError):
+            create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 2}])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Solo hay 1', str(response.data))
+
+        # Reintentar el checkout reemplaza los holds anteriores
+        place_holds('pi_ana', {self.sofa.pk: 3})
+        self.assertEqual((self.held(self.sofa), self.held(self.puff)), (3, 0))
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=0)
+    def test_catalog_and_merges_show_available_stock(self):
+        place_holds('pi_ana', {self.sofa.pk: 3, self.puff.pk: 4})
+
+        response = self.client.get(reverse('product-list'))
+        stock = {p['sku']: (p['stock'], p['is_in_stock']) for p in response.data['results']}
+        self.assertEqual(stock, {'SOFA-1': (0, False), 'PUFF-1': (6, True)})
+        response = self.client.get(reverse('product-detail', args=[self.puff.slug]))
+        self.assertEqual(response.data['stock'], 6)
+        response = self.client.get(reverse('product-facets'))
+        self.assertEqual(response.data['availability'], {'in_stock': 1, 'out_of_stock': 1})
+
+        cart = merge_quantities(self.user, {self.sofa.pk: 1, self.puff.pk: 9})
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.puff.pk: 6})
+
+    @mock.patch('applications.orders.views.stripe.PaymentIntent')
+    def test_payment_intent_created_after_holds(self, payment_intent):
+        payment_intent.create.return_value = SimpleNamespace(id='pi_ana', client_secret='secreto')
+
+        def intent(quantity, **headers):
+            return self.client.post(reverse('create-payment-intent'), {
+                'amount': 150000, 'items': [{'product_id': self.sofa.pk, 'quantity': quantity}],
+            }, format='json', headers=headers)
+
+        # Sin stock no llega a crearse el intent
+        self.assertEqual(intent(4).status_code, 400)
+        payment_intent.create.assert_not_called()
+
+        response = intent(2, **{'Idempotency-Key': 'intent-1'})
+        self.assertEqual(response.data['paymentIntentId'], 'pi_ana')
+        self.assertEqual(intent(2, **{'Idempotency-Key': 'intent-1'}).data['paymentIntentId'], 'pi_ana')
+        self.assertEqual(payment_intent.create.call_count, 1)
+        self.assertEqual(list(StockHold.objects.values_list('key', 'quantity')), [('pi_ana', 2)])
+        self.assertEqual(self.held(self.sofa), 2)
+
+        # Un fallo después de crear el intent lo cancela y libera los holds
+        payment_intent.create.return_value = SimpleNamespace(id='pi_otro', client_secret='secreto')
+        with mock.patch('applications.orders.views.move_holds', side_effect=RuntimeError('sin conexión')):
+            self.assertEqual(intent(1).status_code, 400)
+        payment_intent.cancel.assert_called_once_with('pi_otro')
+        self.assertEqual(self.held(self.sofa), 2)
+
+    def test_confirm_payment_consumes_own_holds(self):
+        place_holds('sim_ana', {self.sofa.pk: 3})
+        response = self.client.post(reverse('confirm-payment'), {
+            'payment_intent_id': 'sim_ana',
+            'order': dict(ORDER_DATA, items=[{'product_id': self.sofa.pk, 'quantity': 3}]),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.sofa.refresh_from_db()
+        self.assertEqual((self.sofa.stock, self.sofa.held_stock), (0, 0))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_released(self):
+        place_holds('pi_ana', {self.sofa.pk: 3, self.puff.pk: 4})
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # Al leer disponibilidad se liberan los del producto consultado
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('cart-add-item'), {'product_id': self.sofa.pk, 'quantity': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.held(self.sofa), self.held(self.puff)), (0, 4))
+
+        # El resto, con la task periódica
+        self.assertEqual(release_expired_stock_holds(), 1)
+        self.assertEqual(self.held(self.puff), 0)
+        self.assertFalse(StockHold.objects.exists())
+
+
+@override_settings(LOW_STOCK_ALERT_EMAILS=['compras@example.com'], LOW_STOCK_WEBHOOK_URL='')
+class LowStockAlertTest(APITestCase):
+    """
+    Las ventas que cruzan min_stock abren una alerta única y el resumen la envía una vez
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Sala')
+        self.sofa = Product.objects.create(
+            name='Sofá', sku='SOFA-1', category=category, price=900, stock=8, min_stock=3
+        )
+        self.puff = Product.objects.create(
+            name='Puff', sku='PUFF-1', category=category, price=60, stock=20, min_stock=3
+        )
+
+    def alerts(self):
+        return list(LowStockAlert.objects.order_by('pk').values_list('product', 'stock'))
+
+    def test_sales_open_one_alert_and_restock_closes_it(self):
+        create_order(self.user, [
+            {'product_id': self.sofa.pk, 'quantity': 4},
+            {'product_id': self.puff.pk, 'quantity': 1},
+        ])
+        self.assertEqual(self.alerts(), [])
+
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 1}])
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 1}])
+        self.assertEqual(self.alerts(), [(self.sofa.pk, 2)])
+
+        self.sofa.refresh_from_db()
+        self.sofa.stock = 10
+        self.sofa.save()
+        self.assertEqual(self.alerts(), [])
+
+        # Subir el umbral también cuenta
+        self.puff.min_stock = 19
+        self.puff.save(update_fields=['min_stock'])
+        self.assertEqual(self.alerts(), [(self.puff.pk, 19)])
+
+    def test_admin_activation_actions_update_alerts(self):
+        product_admin = ProductAdmin(Product, admin.site)
+        Product.objects.filter(pk=self.sofa.pk).update(stock=2, is_active=False)
+        products = Product.objects.filter(pk=self.sofa.pk)
+        with mock.patch.object(product_admin, 'message_user'):
+            product_admin.mark_as_active(None, products)
+            self.assertEqual(self.alerts(), [(self.sofa.pk, 2)])
+            product_admin.mark_as_inactive(None, products)
+            self.assertEqual(self.alerts(), [])
+
+    def test_property_matches_queryset(self):
+        Product.objects.filter(pk=self.sofa.pk).update(stock=0)
+        place_holds('pi_ana', {self.puff.pk: 18})
+        silla = Product.objects.create(
+            name='Silla', sku='SILLA-1', category=self.sofa.category, price=80, stock=2, min_stock=3
+        )
+        low = set(Product.objects.low_stock().values_list('pk', flat=True))
+        self.assertEqual(low, {self.sofa.pk, silla.pk})
+        self.assertEqual({p.pk for p in Product.objects.all() if p.is_low_stock}, low)
+
+    def test_digest_sends_pending_alerts_once(self):
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 6}])
+
+        self.assertEqual(send_low_stock_digest(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['compras@example.com'])
+        self.assertIn('SOFA-1', mail.outbox[0].body)
+
+        # Ya notificada: no se reenvía aunque siga bajando
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 1}])
+        self.assertEqual(send_low_stock_digest(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.alerts(), [(self.sofa.pk, 1)])
+
+    @override_settings(LOW_STOCK_WEBHOOK_URL='http://hooks.example/stock')
+    def test_failed_channel_is_retried_alone(self):
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 6}])
+
+        with mock.patch('applications.orders.tasks.urlopen', side_effect=OSError('sin conexión')):
+            self.assertEqual(send_low_stock_digest(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(LowStockAlert.objects.filter(notified_at__isnull=False).exists())
+
+        # El email ya salió: solo se reintenta el webhook
+        with mock.patch('applications.orders.tasks.urlopen') as urlopen:
+            self.assertEqual(send_low_stock_digest(), 1)
+        urlopen.assert_called_once()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(LowStockAlert.objects.get(pk=self.sofa.pk).notified_at)
+
+    def test_recreated_alert_stays_pending(self):
+        create_order(self.user, [{'product_id': self.sofa.pk, 'quantity': 6}])
+        read = LowStockAlert.objects.get(pk=self.sofa.pk)
+
+        def recreate(*args, **kwargs):
+            # Se repuso y volvió a bajar mientras se enviaba el resumen
+            LowStockAlert.objects.filter(pk=self.sofa.pk).delete()
+            LowStockAlert.objects.create(product=self.sofa, stock=1, min_stock=3)
+            LowStockAlert.objects.filter(pk=self.sofa.pk).update(created_at=read.created_at + timedelta(minutes=1))
+
+        with mock.patch('applications.orders.tasks.send_mail', side_effect=recreate):
+            send_low_stock_digest()
+        alert = LowStockAlert.objects.get(pk=self.sofa.pk)
+        self.assertIsNone(alert.emailed_at)
+        self.assertIsNone(alert.notified_at)
+
+
+class IdempotentCheckoutTest(APITestCase):
+    """
+    Los reintentos del checkout devuelven la orden ya creada sin descontar stock de nuevo
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+        category = Category.objects.create(name='Dormitorio')
+        self.cama = Product.objects.create(name='Cama', sku='CAMA-1', category=category, price=700, stock=5)
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, quantity=2, **headers):
+        data = dict(ORDER_DATA, items=[{'product_id': self.cama.pk, 'quantity': quantity}])
+        return self.client.post(reverse('orders-list'), data, format='json', headers=headers)
+
+    def confirm(self, payment_intent_id, quantity=2):
+        return self.client.post(reverse('confirm-payment'), {
+            'payment_intent_id': payment_intent_id,
+            'order': dict(ORDER_DATA, items=[{'product_id': self.cama.pk, 'quantity': quantity}]),
+        }, format='json')
+
+    def stock(self):
+        self.cama.refresh_from_db()
+        return self.cama.stock
+
+    def test_retry_replays_stored_response(self):
+        first = self.checkout(**{'Idempotency-Key': 'chk-1'})
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(1):
+            retry = self.checkout(**{'Idempotency-Key': 'chk-1'})
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['order_number'], first.data['order_number'])
+        self.assertEqual((Order.objects.count(), self.stock()), (1, 3))
+
+        # Otra petición con la misma clave
+        self.assertEqual(self.checkout(quantity=1, **{'Idempotency-Key': 'chk-1'}).status_code, 422)
+        # Sin clave no hay idempotencia
+        self.assertEqual(self.checkout(quantity=1).status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.checkout(quantity=9, **{'Idempotency-Key': 'chk-2'}).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.checkout(quantity=2, **{'Idempotency-Key': 'chk-2'}).status_code, 201)
+
+    def test_confirm_payment_once_per_payment_intent(self):
+        first = self.confirm('sim_cama')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(self.confirm('sim_cama').data['order_number'], first.data['order_number'])
+
+        # Con la clave vencida y purgada, el payment_id evita la segunda orden
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_idempotency_keys(), 1)
+        retry = self.confirm('sim_cama')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['order_number'], first.data['order_number'])
+        self.assertEqual((Order.objects.count(), self.stock()), (1, 3))
+
+    def test_one_order_per_payment_intent_across_keys(self):
+        def confirm(key):
+            return self.client.post(reverse('confirm-payment'), {
+                'payment_intent_id': 'sim_cama',
+                'order': dict(ORDER_DATA, items=[{'product_id': self.cama.pk, 'quantity': 2}]),
+            }, format='json', headers={'Idempotency-Key': key})
+
+        first = confirm('clave-a')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(confirm('clave-b').data['order_number'], first.data['order_number'])
+
+        # Carrera: la comprobación previa no ve la orden y la restricción
+        # única de payment_id detiene el segundo INSERT
+        lookups = []
+        paid_order = views.paid_order
+
+        def racing_paid_order(payment_intent_id):
+            lookups.append(payment_intent_id)
+            return None if len(lookups) == 1 else paid_order(payment_intent_id)
+
+        with mock.patch.object(views, 'paid_order', side_effect=racing_paid_order):
+            retry = confirm('clave-c')
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['order_number'], first.data['order_number'])
+        self.assertEqual((Order.objects.count(), self.stock()), (1, 3))
+
+    def test_in_progress_key_conflicts_until_abandoned(self):
+        now = timezone.now()
+        self.assertEqual(self.checkout(**{'Idempotency-Key': 'chk-3'}).status_code, 201)
+        record = IdempotencyKey.objects.get(key='chk-3')
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=None, response=None)
+
+        retry = self.checkout(**{'Idempotency-Key': 'chk-3'})
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(retry['Retry-After'], '1')
+
+        # Pasado IDEMPOTENCY_LOCK_SECONDS la clave se da por abandonada
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=now - timedelta(minutes=5))
+        self.assertEqual(self.checkout(**{'Idempotency-Key': 'chk-3'}).status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='chk-3').status_code, 201)
+
+    @mock.patch('applications.orders.views.stripe.PaymentIntent')
+    def test_stripe_called_outside_the_key_transaction(self, payment_intent):
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def create(**kwargs):
+            depths.append(len(connection.atomic_blocks))
+            self.assertEqual(IdempotencyKey.objects.get(key='intent-2').status_code, None)
+            return SimpleNamespace(id='pi_cama', client_secret='secreto')
+
+        payment_intent.create.side_effect = create
+        response = self.client.post(reverse('create-payment-intent'), {
+            'amount': 70000, 'items': [{'product_id': self.cama.pk, 'quantity': 1}],
+        }, format='json', headers={'Idempotency-Key': 'intent-2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(depths, [depth])
+        self.assertEqual(IdempotencyKey.objects.get(key='intent-2').status_code, 200)
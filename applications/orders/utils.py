@@ -6,3 +6,27 @@ def get_user_orders(user):
     """
     return Order.objects.filter(user=user).order_by('-created_at')
 
+
+def stock_problems(products, quantities):
+    """
+    Líneas que no se pueden atender: productos inexistentes, inactivos o
+    sin stock suficiente. products: {product_id: Product} (in_bulk)
+    """
+    problems = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or not product.is_active:
+            problems.append(f"Producto {product_id} no encontrado o inactivo")
+        elif product.available_stock < quantity:
+            problems.append(f"Stock insuficiente para {product.name} ({product.available_stock})")
+    return problems
+
+
+def order_item_quantities(order):
+    """
+    {product_id: cantidad} de los items de la orden (sin productos eliminados)
+    """
+    quantities = {}
+    for product_id, quantity in order.items.filter(product__isnull=False).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
@@ -1,31 +1,48 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.http import HttpResponse
 from reportlab.pdfgen import canvas
 import io
+import uuid
+from collections import defaultdict
 import stripe
 from django.conf import settings
 from drf_spectacular.utils import extend_schema
 
 from .models import Order, Coupon
 from .serializers import (
-    OrderListSerializer, OrderDetailSerializer, OrderCreateSerializer, CouponSerializer
+    OrderListSerializer, OrderDetailSerializer, OrderCreateSerializer, OrderCreateItemSerializer,
+    CouponSerializer
 )
 from .permissions import IsOwner
-from .utils import get_user_orders
+from .holds import move_holds, place_holds, release_holds
+from .idempotency import idempotent
+from .inventory import record_stock_movements
+from .sales import SALE_STATUSES, order_sales_lines, record_order_sales
+from .utils import get_user_orders, order_item_quantities
+from applications.products.cache import PRODUCTS, invalidate_on_commit
+from applications.products.models import Product
+from applications.products.pagination import KeysetPagination, keyset_orderings
 
 # Config Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
+class OrderCursorPagination(KeysetPagination):
+    default_ordering = '-created_at'
+    orderings = keyset_orderings('created_at')
+
+
 @extend_schema(tags=['Orders'])
 class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     serializer_class = OrderListSerializer
     lookup_field = 'order_number'
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         # Si está autenticado, mostrar solo sus órdenes
@@ -48,6 +65,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         # El serializer ya maneja usuarios en su método create
         serializer.save()
 
+    @idempotent('orders.create')
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -62,14 +80,20 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['put'], url_path='cancel')
     def cancel_order(self, request, order_number=None):
         order = get_object_or_404(Order, order_number=order_number, user=request.user)
-        if order.status not in ['pending', 'confirmed']:
-            return Response({"error": "No se puede cancelar esta orden"}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = 'cancelled'
-        order.save()
-        for item in order.items.all():
-            if item.product:
-                item.product.stock += item.quantity
-                item.product.save()
+        with transaction.atomic():
+            # El cambio de estado es condicional: dos cancelaciones simultáneas
+            # no pueden devolver el stock dos veces
+            cancelled = Order.objects.filter(
+                pk=order.pk, status__in=['pending', 'confirmed']
+            ).update(status='cancelled', updated_at=timezone.now())
+            if not cancelled:
+                return Response({"error": "No se puede cancelar esta orden"}, status=status.HTTP_400_BAD_REQUEST)
+            quantities = order_item_quantities(order)
+            Product.objects.release_stock(quantities)
+            record_stock_movements(quantities, 'cancellation', order)
+            if order.status in SALE_STATUSES:
+                record_order_sales(order, order_sales_lines(order), sign=-1)
+            invalidate_on_commit(PRODUCTS)
         return Response({"message": "Orden cancelada y stock restaurado"}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get'], url_path='invoice')
@@ -117,13 +141,31 @@ def validate_coupon(request):
 @extend_schema(tags=['Payments'])
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@idempotent('payments.intent')
 def create_payment_intent(request):
     """
     Crea un PaymentIntent de Stripe.
-    Body: { "amount": 20000 }  # centavos
+    Body: { "amount": 20000, "items": [{"product_id": 1, "quantity": 2}] }  # centavos
+    Si vienen items se apartan por STOCK_HOLD_MINUTES hasta confirm_payment.
+    Los items se validan y apartan antes de crear el intent; si algo falla
+    después, el intent se cancela y los holds se liberan. Con
+    Idempotency-Key un reintento devuelve el mismo intent sin apartar de
+    nuevo (la clave también se envía a Stripe).
     """
     try:
         amount = int(request.data.get('amount'))
+        items = OrderCreateItemSerializer(data=request.data.get('items', []), many=True)
+        items.is_valid(raise_exception=True)
+        quantities = defaultdict(int)
+        for item in items.validated_data:
+            quantities[item['product_id']] += item['quantity']
+
+        hold_key = f"checkout_{uuid.uuid4().hex}"
+        hold_expires_at = None
+        if quantities:
+            hold_expires_at = place_holds(hold_key, quantities)
+            if hold_expires_at is None:
+                return Response({"error": "Stock insuficiente"}, status=status.HTTP_400_BAD_REQUEST)
         
         # Definir metadata según si está logueado o no
         metadata = {}
@@ -134,23 +176,66 @@ def create_payment_intent(request):
             metadata["user_id"] = "guest"
             metadata["username"] = "guest"
 
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency='pen', # Asegúrate que coincida con tu cuenta Stripe (pen/usd)
-            automatic_payment_methods={"enabled": True},
-            metadata=metadata,
-        )
+        idempotency_key = request.headers.get('Idempotency-Key')
+        stripe_options = {'idempotency_key': idempotency_key} if idempotency_key else {}
+        try:
+            intent = stripe.PaymentIntent.create(
+                amount=amount,
+                currency='pen', # Asegúrate que coincida con tu cuenta Stripe (pen/usd)
+                automatic_payment_methods={"enabled": True},
+                metadata=metadata,
+                **stripe_options,
+            )
+        except Exception:
+            release_holds(hold_key)
+            raise
+        try:
+            # confirm_payment consume los holds por el id del intent
+            move_holds(hold_key, intent.id)
+        except Exception:
+            release_holds(hold_key)
+            stripe.PaymentIntent.cancel(intent.id)
+            raise
         return Response(
-            {"clientSecret": intent.client_secret, "paymentIntentId": intent.id},
+            {
+                "clientSecret": intent.client_secret,
+                "paymentIntentId": intent.id,
+                "holdExpiresAt": hold_expires_at,
+            },
             status=status.HTTP_200_OK,
         )
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def paid_order(payment_intent_id):
+    """Orden ya creada para el pago, si existe"""
+    if not payment_intent_id:
+        return None
+    return Order.objects.filter(payment_id=payment_intent_id).first()
+
+
+def existing_payment_order_response(order, order_data):
+    if order.email != order_data.get('email'):
+        return Response({"error": "El pago ya se usó en otra orden"}, status=status.HTTP_400_BAD_REQUEST)
+    return payment_order_response(order)
+
+
+def payment_order_response(order):
+    return Response(
+        {
+            "message": "Orden creada exitosamente",
+            "order_number": order.order_number,
+            "order": OrderDetailSerializer(order).data,
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
 @extend_schema(tags=['Payments'])
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny]) 
+@idempotent('payments.confirm', default_key=lambda request: request.data.get('payment_intent_id'))
 def confirm_payment(request):
     """
     Confirma el pago y crea la orden.
@@ -159,11 +244,19 @@ def confirm_payment(request):
         "payment_intent_id": "pi_..." or "sim_...",
         "order": { ...datos para OrderCreateSerializer... }
     }
+    Idempotente por Idempotency-Key o, sin ella, por payment_intent_id: un
+    reintento devuelve la orden ya creada para el pago.
     """
     try:
         payment_intent_id = request.data.get('payment_intent_id')
         order_data = request.data.get('order', {})
 
+        # Pago ya convertido en orden (p. ej. reintento con otra clave o con
+        # la clave vencida): se devuelve la misma orden, nunca una segunda
+        order = paid_order(payment_intent_id)
+        if order:
+            return existing_payment_order_response(order, order_data)
+
         # Si es un pago simulado (modo test), saltamos la verificación en Stripe
         if not payment_intent_id.startswith('sim_'):
             # Verificar estado en Stripe (para pagos reales)
@@ -187,16 +280,17 @@ def confirm_payment(request):
         if serializer.is_valid():
             # Guardar la orden pasando el usuario explícitamente
             user_to_save = request.user if request.user.is_authenticated else None
-            order = serializer.save(user=user_to_save)
-            
-            return Response(
-                {
-                    "message": "Orden creada exitosamente",
-                    "order_number": order.order_number,
-                    "order": OrderDetailSerializer(order).data,
-                },
-                status=status.HTTP_201_CREATED,
-            )
+            # Los holds del PaymentIntent se consumen en la misma transacción
+            try:
+                order = serializer.save(user=user_to_save, hold_key=payment_intent_id, payment_id=payment_intent_id)
+            except IntegrityError:
+                # Un reintento concurrente creó la orden del pago primero
+                # (restricción única de payment_id); lo de esta se deshizo
+                order = paid_order(payment_intent_id)
+                if order is None:
+                    raise
+                return existing_payment_order_response(order, order_data)
+            return payment_order_response(order)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
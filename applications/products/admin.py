@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from .cache import invalidate_catalog
 from .models import Category, Brand, Material, Product, ProductImage, ProductSpecification, Review
 
 
@@ -35,6 +36,7 @@ class CategoryAdmin(admin.ModelAdmin):
     """
     list_display = ('name', 'parent', 'product_count_display', 'is_active', 'order', 'created_at')
     list_filter = ('is_active', 'parent', 'created_at')
+    list_select_related = ('parent',)
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ('created_at', 'updated_at', 'product_count_display')
@@ -228,21 +230,36 @@ class ProductAdmin(admin.ModelAdmin):
     # Actions personalizadas
     def mark_as_featured(self, request, queryset):
         updated = queryset.update(is_featured=True)
+        invalidate_catalog()
         self.message_user(request, f'{updated} productos marcados como destacados.')
     mark_as_featured.short_description = '⭐ Marcar como destacado'
     
     def unmark_as_featured(self, request, queryset):
         updated = queryset.update(is_featured=False)
+        invalidate_catalog()
         self.message_user(request, f'{updated} productos desmarcados como destacados.')
     unmark_as_featured.short_description = '☆ Desmarcar como destacado'
     
+    def set_active(self, queryset, is_active):
+        """
+        update() no pasa por record_stock_adjustment: abre o cierra aquí las
+        alertas de stock bajo de los productos afectados
+        """
+        from applications.orders.inventory import detect_low_stock
+        
+        product_ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(is_active=is_active)
+        detect_low_stock(product_ids)
+        invalidate_catalog()
+        return updated
+    
     def mark_as_active(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = self.set_active(queryset, True)
         self.message_user(request, f'{updated} productos activados.')
     mark_as_active.short_description = '✅ Activar productos'
     
     def mark_as_inactive(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = self.set_active(queryset, False)
         self.message_user(request, f'{updated} productos desactivados.')
     mark_as_inactive.short_description = '❌ Desactivar productos'
 
@@ -320,11 +337,16 @@ class ReviewAdmin(admin.ModelAdmin):
     
     def approve_reviews(self, request, queryset):
         updated = queryset.update(is_approved=True)
+        # update() no dispara señales: recalcular rating de los productos afectados
+        Product.objects.filter(pk__in=queryset.values('product')).rebuild_ratings()
+        invalidate_catalog()
         self.message_user(request, f'{updated} reviews aprobadas.')
     approve_reviews.short_description = '✅ Aprobar reviews'
     
     def disapprove_reviews(self, request, queryset):
         updated = queryset.update(is_approved=False)
+        Product.objects.filter(pk__in=queryset.values('product')).rebuild_ratings()
+        invalidate_catalog()
         self.message_user(request, f'{updated} reviews desaprobadas.')
     disapprove_reviews.short_description = '❌ Desaprobar reviews'
 
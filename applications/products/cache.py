@@ -0,0 +1,130 @@
+"""
+Caché de respuestas del catálogo para lecturas anónimas.
+
+Cada respuesta se guarda bajo una clave derivada de la ruta, los
+parámetros normalizados, el header Accept y la generación actual de sus
+etiquetas ('products', 'categories', 'brands'). Las señales de
+products/signals.py incrementan la generación de las etiquetas afectadas,
+con lo que las entradas anteriores dejan de ser alcanzables y expiran
+solas (CATALOG_CACHE_TTL). Funciona con LocMemCache y RedisCache (sólo
+usa get_many, set, add e incr), pero con LocMem las generaciones son de
+cada proceso: con varios workers hace falta Redis, por eso sin REDIS_URL
+los TTL del catálogo son 0 por omisión (settings.SHARED_CACHE).
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+PRODUCTS = 'products'
+CATEGORIES = 'categories'
+BRANDS = 'brands'
+CATALOG_TAGS = (PRODUCTS, CATEGORIES, BRANDS)
+
+# Headers de la respuesta que se conservan en caché
+CACHED_HEADERS = ('Content-Type', 'Vary', 'Allow', 'X-Search-Truncated')
+
+
+def generation_key(tag):
+    return f'catalog:generation:{tag}'
+
+
+def get_generations(tags):
+    """
+    Generación actual de cada etiqueta. Si una clave no existe (primer uso
+    o expulsada por el backend) se inicializa con un valor basado en el
+    reloj, de modo que nunca coincida con una generación anterior.
+    """
+    keys = {generation_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    generations = {}
+    for key, tag in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        generations[tag] = found[key]
+    return generations
+
+
+def invalidate(*tags):
+    """Invalida todas las respuestas que dependen de las etiquetas indicadas"""
+    for tag in tags:
+        key = generation_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_on_commit(*tags):
+    """
+    Invalida ahora y otra vez al confirmar la transacción: una lectura
+    concurrente que cacheó el estado previo al commit con la generación
+    nueva queda descartada
+    """
+    invalidate(*tags)
+    transaction.on_commit(lambda: invalidate(*tags))
+
+
+def invalidate_catalog():
+    invalidate_on_commit(*CATALOG_TAGS)
+
+
+def response_cache_key(request, tags):
+    """
+    Clave por ruta + parámetros (ordenados) + Accept + generaciones
+    """
+    params = sorted(
+        (key, sorted(request.GET.getlist(key)))
+        for key in request.GET.keys()
+    )
+    payload = json.dumps([
+        request.path,
+        params,
+        request.META.get('HTTP_ACCEPT', ''),
+        sorted(get_generations(tags).items()),
+    ])
+    return f'catalog:response:{hashlib.sha1(payload.encode("utf-8")).hexdigest()}'
+
+
+def cache_catalog_response(*tags):
+    """
+    Decorador para acciones de solo lectura de un ViewSet: cachea las
+    respuestas 200 a GET anónimos durante CATALOG_CACHE_TTL segundos
+    (0 desactiva la caché)
+    """
+    tags = tags or CATALOG_TAGS
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            ttl = getattr(settings, 'CATALOG_CACHE_TTL', 0)
+            if not ttl or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view_method(self, request, *args, **kwargs)
+
+            key = response_cache_key(request, tags)
+            cached = cache.get(key)
+            if cached is not None:
+                content, status, headers = cached
+                response = HttpResponse(content, status=status)
+                for header, value in headers.items():
+                    response[header] = value
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+                def store(rendered):
+                    headers = {
+                        header: rendered[header]
+                        for header in CACHED_HEADERS if rendered.has_header(header)
+                    }
+                    cache.set(key, (rendered.content, rendered.status_code, headers), ttl)
+                response.add_post_render_callback(store)
+            return response
+        return wrapper
+    return decorator
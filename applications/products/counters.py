@@ -0,0 +1,136 @@
+"""
+Contador de vistas de productos con buffer por proceso.
+
+Cada worker acumula las vistas en memoria y las escribe agrupadas como
+UPDATE ... SET views_count = views_count + n (sin leer la fila ni
+bloquearla durante la petición). Las escrituras las hace un hilo daemon
+por proceso, fuera de las peticiones, que vacía el buffer:
+- cada PRODUCT_VIEWS_FLUSH_INTERVAL segundos, aunque el worker esté ocioso
+- antes, si se acumulan PRODUCT_VIEWS_MAX_PENDING productos distintos
+- al terminar el proceso (atexit y hook worker_exit de gunicorn.conf.py)
+
+Con PRODUCT_VIEWS_FLUSH_INTERVAL = 0 cada vista se escribe en la petición.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """
+    Buffer de incrementos {product_id: vistas pendientes}. Con background
+    el hilo que escribe arranca con la primera vista del proceso
+    """
+    def __init__(self, background=True):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+        self.background = background
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'PRODUCT_VIEWS_FLUSH_INTERVAL', 10)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'PRODUCT_VIEWS_MAX_PENDING', 500)
+
+    def add(self, product_id, amount=1):
+        """Registra vistas; si el buffer se llenó despierta al hilo que escribe"""
+        if not self.flush_interval:
+            with self._lock:
+                self._counts[product_id] += amount
+            self.flush()
+            return
+        with self._lock:
+            self._counts[product_id] += amount
+            full = len(self._counts) >= self.max_pending
+        self.start()
+        if full:
+            self._wake.set()
+
+    def start(self):
+        """Arranca el hilo del proceso (de nuevo tras un fork)"""
+        if not self.background:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='product-views-flush', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo pendiente"""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._stopping = True
+            self._wake.set()
+            thread.join()
+        self._thread = None
+        return self.flush()
+
+    def _run(self):
+        try:
+            while not self._stopping:
+                self._wake.wait(self.flush_interval or None)
+                self._wake.clear()
+                if self._stopping:
+                    break
+                self.flush()
+                close_old_connections()
+        finally:
+            # Conexión propia del hilo
+            connection.close()
+
+    def pending(self, product_id=None):
+        """Vistas aún no escritas (de un producto o en total)"""
+        with self._lock:
+            if product_id is None:
+                return sum(self._counts.values())
+            return self._counts.get(product_id, 0)
+
+    def flush(self):
+        """
+        Escribe las vistas pendientes: un UPDATE por cada incremento distinto.
+        Si la base de datos falla, los conteos vuelven al buffer.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        by_amount = defaultdict(list)
+        for product_id, amount in counts.items():
+            by_amount[amount].append(product_id)
+
+        try:
+            with transaction.atomic():
+                for amount, product_ids in sorted(by_amount.items()):
+                    Product.objects.filter(pk__in=sorted(product_ids)).update(
+                        views_count=F('views_count') + amount
+                    )
+        except DatabaseError:
+            logger.exception("No se pudieron escribir las vistas de productos; se reintentará")
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+        return sum(counts.values())
+
+
+view_counter = ViewCountBuffer()
+atexit.register(view_counter.stop)
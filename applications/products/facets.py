@@ -0,0 +1,131 @@
+"""
+Navegación por facetas del catálogo.
+
+Calcula, para el resultado de ProductFilter, los conteos por categoría,
+marca, material, color, rango de precio y disponibilidad con un número
+fijo de consultas agrupadas. El resultado se puede cachear por unos
+segundos (PRODUCT_FACETS_CACHE_TTL) con una clave derivada de los
+filtros normalizados.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.db.models.functions import Coalesce
+
+from .cache import CATALOG_TAGS, get_generations
+from .models import Product
+
+# Parámetros que no cambian el conjunto de productos
+NON_FILTER_PARAMS = {'page', 'page_size', 'ordering', 'cursor', 'count', 'format'}
+
+DEFAULT_PRICE_BUCKETS = [0, 100, 250, 500, 1000]
+
+
+def price_ranges():
+    """Límites de los rangos de precio: [(0, 100), ..., (1000, None)]"""
+    bounds = getattr(settings, 'PRODUCT_FACET_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+    return list(zip(bounds, list(bounds[1:]) + [None]))
+
+
+def compute_facets(queryset):
+    """
+    Conteos de facetas para los productos del queryset (5 consultas)
+    """
+    # Re-filtrar por pk evita duplicados de joins (ej: filtro por materiales)
+    products = Product.objects.filter(pk__in=queryset.order_by().values('pk'))
+
+    categories = products.values(
+        'category__slug', 'category__name'
+    ).annotate(count=Count('pk')).order_by('-count', 'category__name')
+
+    brands = products.filter(brand__isnull=False).values(
+        'brand__slug', 'brand__name'
+    ).annotate(count=Count('pk')).order_by('-count', 'brand__name')
+
+    materials = Product.materials.through.objects.filter(
+        product__in=products
+    ).values('material__name').annotate(
+        count=Count('product', distinct=True)
+    ).order_by('-count', 'material__name')
+
+    colors = products.exclude(color='').values('color').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'color')
+
+    # Rangos de precio y stock en un único aggregate
+    ranges = price_ranges()
+    range_counts = {}
+    for index, (low, high) in enumerate(ranges):
+        condition = Q(facet_price__gte=low)
+        if high is not None:
+            condition &= Q(facet_price__lt=high)
+        range_counts[f'price_{index}'] = Count('pk', filter=condition)
+    summary = products.annotate(
+        facet_price=Coalesce('discount_price', 'price')
+    ).aggregate(
+        total=Count('pk'),
+        in_stock=Count('pk', filter=Q(stock__gt=F('held_stock'))),
+        **range_counts
+    )
+
+    return {
+        'total': summary['total'],
+        'categories': [
+            {'slug': row['category__slug'], 'name': row['category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'brands': [
+            {'slug': row['brand__slug'], 'name': row['brand__name'], 'count': row['count']}
+            for row in brands
+        ],
+        'materials': [
+            {'name': row['material__name'], 'count': row['count']}
+            for row in materials
+        ],
+        'colors': [
+            {'value': row['color'], 'count': row['count']}
+            for row in colors
+        ],
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': summary[f'price_{index}']}
+            for index, (low, high) in enumerate(ranges)
+        ],
+        'availability': {
+            'in_stock': summary['in_stock'],
+            'out_of_stock': summary['total'] - summary['in_stock'],
+        },
+    }
+
+
+def facets_cache_key(query_params):
+    """
+    Clave estable para los filtros: ignora paginación/orden y el orden
+    de los parámetros; incluye la generación del catálogo para que los
+    cambios de productos la invaliden
+    """
+    normalized = sorted(
+        (key, sorted(value.strip() for value in query_params.getlist(key)))
+        for key in query_params.keys()
+        if key not in NON_FILTER_PARAMS
+    )
+    generations = sorted(get_generations(CATALOG_TAGS).items())
+    digest = hashlib.sha1(json.dumps([normalized, generations]).encode('utf-8')).hexdigest()
+    return f'products:facets:{digest}'
+
+
+def get_facets(queryset, query_params):
+    """
+    Facetas cacheadas durante PRODUCT_FACETS_CACHE_TTL segundos (0 desactiva)
+    """
+    ttl = getattr(settings, 'PRODUCT_FACETS_CACHE_TTL', 0)
+    if not ttl:
+        return compute_facets(queryset)
+    key = facets_cache_key(query_params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, ttl)
+    return facets
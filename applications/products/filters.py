@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework import filters
 from .models import Product, Category
+from .search import get_search_backend
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -11,7 +13,7 @@ class ProductFilter(django_filters.FilterSet):
     search = django_filters.CharFilter(method='search_products')
     
     # Filtros de relaciones
-    category = django_filters.CharFilter(field_name='category__slug')
+    category = django_filters.CharFilter(method='filter_by_category')
     brand = django_filters.CharFilter(field_name='brand__slug')
     materials = django_filters.CharFilter(method='filter_by_materials')
     
@@ -29,6 +31,9 @@ class ProductFilter(django_filters.FilterSet):
     is_new = django_filters.BooleanFilter()
     in_stock = django_filters.BooleanFilter(method='filter_in_stock')
     
+    # Filtros de rating (columna desnormalizada e indexada)
+    min_rating = django_filters.NumberFilter(field_name='rating_average', lookup_expr='gte')
+    
     # Ordenamiento
     ordering = django_filters.OrderingFilter(
         fields=(
@@ -36,6 +41,7 @@ class ProductFilter(django_filters.FilterSet):
             ('created_at', 'created_at'),
             ('name', 'name'),
             ('views_count', 'views'),
+            ('rating_average', 'rating'),
         )
     )
     
@@ -43,15 +49,37 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = ['category', 'brand', 'color', 'is_featured', 'is_new']
     
+    def filter_queryset(self, queryset):
+        """
+        La búsqueda se aplica al final: el ranking (acotado a
+        PRODUCT_SEARCH_MAX_RESULTS) se calcula sobre el queryset ya filtrado
+        """
+        search = self.form.cleaned_data.pop('search', None)
+        queryset = super().filter_queryset(queryset)
+        if search:
+            queryset = self.search_products(queryset, 'search', search)
+        return queryset
+    
     def search_products(self, queryset, name, value):
         """
-        Búsqueda general en nombre, descripción y SKU
+        Búsqueda de texto completo en nombre, descripción y SKU,
+        ordenada por relevancia (ver search.py). Marca el request si el
+        resultado se cortó en PRODUCT_SEARCH_MAX_RESULTS
         """
-        return queryset.filter(
-            models.Q(name__icontains=value) |
-            models.Q(description__icontains=value) |
-            models.Q(sku__icontains=value)
-        )
+        backend = get_search_backend()
+        queryset = backend.search(queryset, value)
+        if backend.truncated and self.request is not None:
+            self.request.search_truncated = True
+        return queryset
+    
+    def filter_by_category(self, queryset, name, value):
+        """
+        Filtrar por categoría (slug) incluyendo todas sus subcategorías
+        """
+        category = Category.objects.filter(slug=value).only('path').first()
+        if category is None:
+            return queryset.none()
+        return queryset.in_category_tree(category)
     
     def filter_by_materials(self, queryset, name, value):
         """
@@ -94,11 +122,35 @@ class ProductFilter(django_filters.FilterSet):
     
     def filter_in_stock(self, queryset, name, value):
         """
-        Filtra productos en stock
+        Filtra productos con stock disponible (sin contar el apartado)
         """
+        from django.db.models import F
         if value:
-            return queryset.filter(stock__gt=0)
+            return queryset.filter(stock__gt=F('held_stock'))
         return queryset
 
 
-from django.db import models
\ No newline at end of file
+
+class CatalogOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter que acepta los alias públicos del catálogo
+    (ej: ordering=rating → rating_average) en lugar de descartarlos
+    y volver al orden por defecto
+    """
+    ordering_aliases = {
+        'rating': 'rating_average',
+        'views': 'views_count',
+    }
+    
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        resolved = []
+        for term in fields:
+            prefix = '-' if term.startswith('-') else ''
+            resolved.append(prefix + self.ordering_aliases.get(term.lstrip('-'), term.lstrip('-')))
+        return super().remove_invalid_fields(queryset, resolved, view, request)
+    
+    def filter_queryset(self, request, queryset, view):
+        # Una búsqueda sin orden explícito conserva el orden por relevancia
+        if request.query_params.get('search') and not request.query_params.get(self.ordering_param):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
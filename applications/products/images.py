@@ -0,0 +1,190 @@
+"""
+Derivados responsive de las imágenes subidas.
+
+Al guardar una imagen nueva se generan, después del commit, versiones de
+ancho fijo (IMAGE_VARIANT_WIDTHS) en WebP y JPEG con Pillow. Cada archivo
+lleva en el nombre un hash de su contenido, por lo que su URL puede
+cachearse indefinidamente. Los nombres se guardan en un JSONField del
+modelo registrado:
+
+    {'source': 'products/sofa.jpg', 'width': 1800, 'height': 1200,
+     'webp': {'320': 'variants/products/sofa.320.1a2b3c4d5e6f.webp', ...},
+     'jpeg': {'320': 'variants/products/sofa.320.9f8e7d6c5b4a.jpg', ...}}
+
+La generación corre en un pool de hilos del proceso ('thread', por
+defecto), en Celery ('celery') o en línea al confirmar la transacción
+('sync') según IMAGE_VARIANTS_BACKEND. Los modelos se registran con
+register() desde las señales de cada app.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+# {'app_label.model': (campo de imagen, campo de variantes, callback)}
+_registry = {}
+_executor = None
+
+
+def register(model, image_field, variants_field, on_generated=None):
+    """
+    Genera variantes de model.<image_field> en model.<variants_field> cada
+    vez que se guarda una imagen distinta; on_generated(instance) se llama
+    después de guardarlas (ej: para invalidar cachés)
+    """
+    _registry[model._meta.label_lower] = (image_field, variants_field, on_generated)
+    post_save.connect(
+        schedule_on_save, sender=model, weak=False,
+        dispatch_uid=f'image_variants:{model._meta.label_lower}',
+    )
+
+
+def registered_models():
+    return [apps.get_model(label) for label in _registry]
+
+
+def variant_widths():
+    return sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', [320, 640, 1024]))
+
+
+def schedule_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    image_field, variants_field, _ = _registry[sender._meta.label_lower]
+    if raw or (update_fields and image_field not in update_fields):
+        return
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field) or {}
+    if not image:
+        if variants:
+            sender._default_manager.filter(pk=instance.pk).update(**{variants_field: {}})
+        return
+    if variants.get('source') != image.name:
+        schedule(sender._meta.label_lower, instance.pk)
+
+
+def schedule(label, pk):
+    """Encola la generación para después del commit según el backend"""
+    backend = getattr(settings, 'IMAGE_VARIANTS_BACKEND', 'thread')
+    if backend == 'celery':
+        from .tasks import generate_image_variants_task
+        transaction.on_commit(lambda: generate_image_variants_task.delay(label, pk))
+    elif backend == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_generate_in_thread, label, pk))
+    else:
+        transaction.on_commit(lambda: generate_variants(label, pk))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANTS_WORKERS', 2),
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def _generate_in_thread(label, pk):
+    try:
+        generate_variants(label, pk)
+    except Exception:
+        logger.exception("No se pudieron generar las variantes de %s %s", label, pk)
+    finally:
+        close_old_connections()
+
+
+def generate_variants(label, pk, force=False):
+    """
+    Genera y guarda las variantes de un objeto registrado. Devuelve el
+    diccionario guardado o None si no había nada que hacer
+    """
+    image_field, variants_field, on_generated = _registry[label]
+    model = apps.get_model(label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return None
+    image = getattr(instance, image_field)
+    if not image or (not force and (getattr(instance, variants_field) or {}).get('source') == image.name):
+        return None
+    try:
+        variants = build_variants(image)
+    except (OSError, UnidentifiedImageError, ValueError) as error:
+        logger.warning("Imagen inválida en %s %s (%s): %s", label, pk, image.name, error)
+        return None
+    # Solo si la imagen no se reemplazó mientras se generaban
+    updated = model._default_manager.filter(pk=pk, **{image_field: image.name}).update(
+        **{variants_field: variants}
+    )
+    if updated and on_generated:
+        on_generated(instance)
+    return variants
+
+
+def build_variants(image_file):
+    """Escribe las variantes de image_file en su storage y devuelve sus nombres"""
+    storage = image_file.storage
+    with storage.open(image_file.name, 'rb') as handle:
+        original = ImageOps.exif_transpose(Image.open(handle))
+        original.load()
+
+    quality = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+    stem = os.path.splitext(image_file.name)[0]
+    widths = [width for width in variant_widths() if width < original.width] or [original.width]
+    variants = {'source': image_file.name, 'width': original.width, 'height': original.height}
+    for key in FORMATS:
+        variants[key] = {}
+
+    for width in widths:
+        height = max(round(original.height * width / original.width), 1)
+        resized = original.resize((width, height), Image.LANCZOS)
+        for key, (pil_format, extension) in FORMATS.items():
+            frame = resized
+            if pil_format == 'JPEG' and frame.mode != 'RGB':
+                # JPEG no tiene transparencia: se compone sobre blanco
+                background = Image.new('RGB', frame.size, 'white')
+                rgba = frame.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                frame = background
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, quality=quality, optimize=True)
+            data = buffer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            name = f'variants/{stem}.{width}.{digest}.{extension}'
+            # Mismo contenido, mismo nombre: no se vuelve a escribir
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(data))
+            variants[key][str(width)] = name
+    return variants
+
+
+def variant_urls(variants, request=None, storage=default_storage):
+    """
+    URLs por formato y ancho más un srcset listo para <img>/<source>:
+    {'webp': {'320': url, ...}, 'jpeg': {...}, 'srcset': {'webp': 'url 320w, ...'}}
+    """
+    if not variants:
+        return None
+    result = {'srcset': {}}
+    for key in FORMATS:
+        urls = {}
+        for width, name in sorted(variants.get(key, {}).items(), key=lambda item: int(item[0])):
+            url = storage.url(name)
+            urls[width] = request.build_absolute_uri(url) if request else url
+        result[key] = urls
+        result['srcset'][key] = ', '.join(f'{url} {width}w' for width, url in urls.items())
+    return result
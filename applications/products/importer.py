@@ -0,0 +1,261 @@
+"""
+Importación masiva de productos desde CSV o JSONL (comando import_products).
+
+El archivo se lee en streaming y se procesa en lotes: cada lote se valida
+fila por fila y se guarda con un único INSERT ... ON CONFLICT (sku) DO
+UPDATE, así que importar el mismo archivo dos veces actualiza en lugar de
+duplicar. Categorías, marcas y materiales se resuelven contra mapas en
+memoria cargados una vez; los slugs nuevos se reservan con SlugAllocator,
+una consulta por lote en lugar de una por fila.
+
+Columnas: sku, name, description, category (slug o nombre), brand (slug o
+nombre), materials (nombres separados por '|', o una lista en JSONL) y
+cualquiera de IMPORT_FIELDS. Una celda vacía deja el valor actual (o el
+por defecto en productos nuevos), salvo en campos opcionales, donde lo
+borra. Las filas inválidas se informan sin detener la importación.
+"""
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from .cache import CATALOG_TAGS, invalidate_on_commit
+from .models import Brand, Category, Material, Product
+from .search import get_search_backend
+from .slugs import SlugAllocator
+
+# Campos de Product que se pueden importar (además de category, brand y materials)
+IMPORT_FIELDS = (
+    'sku', 'name', 'description', 'price', 'discount_price',
+    'stock', 'min_stock', 'width', 'height', 'depth', 'weight',
+    'color', 'warranty_months', 'assembly_required', 'assembly_time_minutes',
+    'is_featured', 'is_active', 'is_new',
+)
+MATERIALS_SEPARATOR = '|'
+BOOLEANS = {
+    'true': True, 't': True, '1': True, 'yes': True, 'si': True, 'sí': True,
+    'false': False, 'f': False, '0': False, 'no': False,
+}
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """
+    Genera (número de línea, fila) de un CSV con encabezado o de un JSONL
+    (un objeto por línea) sin cargar el archivo completo. Una línea JSON
+    inválida se entrega como RowError en lugar de la fila
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        if fmt == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt in ('jsonl', 'ndjson'):
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("se esperaba un objeto")
+                except ValueError as error:
+                    row = RowError(f"JSON inválido: {error}")
+                yield line_number, row
+        else:
+            raise ValueError(f"Formato no soportado: {fmt!r} (usar csv o jsonl)")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _lookup_map(queryset):
+    """{slug o nombre en minúsculas: id}"""
+    lookup = {}
+    for pk, name, slug in queryset.values_list('pk', 'name', 'slug'):
+        lookup[name.strip().lower()] = pk
+        lookup[slug] = pk
+    return lookup
+
+
+class ProductImporter:
+    """
+    Valida y guarda lotes de filas; mantiene los mapas de búsqueda y los
+    slugs usados entre lotes
+    """
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.categories = _lookup_map(Category.objects.all())
+        self.brands = _lookup_map(Brand.objects.all())
+        self.materials = {
+            name.strip().lower(): pk for pk, name in Material.objects.values_list('pk', 'name')
+        }
+        self.slugs = SlugAllocator(Product)
+        self.seen_skus = {}
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS}
+        self.update_fields = [
+            name for name in IMPORT_FIELDS if name != 'sku'
+        ] + ['category', 'brand', 'updated_at']
+
+    def import_chunk(self, rows):
+        """
+        rows: [(número de línea, fila)]. Devuelve (creados, actualizados,
+        [(número de línea, sku, mensaje)])
+        """
+        errors = []
+        skus = [str(row.get('sku', '')).strip() for _, row in rows if isinstance(row, dict)]
+        existing = {product.sku: product for product in Product.objects.filter(sku__in=skus)}
+        self.slugs.preload(
+            row.get('name') for _, row in rows if isinstance(row, dict) and row.get('sku') not in existing
+        )
+
+        products = []
+        materials = {}
+        for line_number, row in rows:
+            sku = row.get('sku', '') if isinstance(row, dict) else ''
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                product, material_ids = self.build_product(line_number, row, existing)
+            except RowError as error:
+                errors.append((line_number, sku, str(error)))
+                continue
+            products.append(product)
+            if material_ids is not None:
+                materials[product.sku] = material_ids
+
+        created = sum(1 for product in products if product.sku not in existing)
+        if products and not self.dry_run:
+            self.save(products, materials)
+        return created, len(products) - created, errors
+
+    def build_product(self, line_number, row, existing):
+        """Producto validado de la fila y los ids de sus materiales (None si no vienen)"""
+        sku = str(row.get('sku') or '').strip()
+        if not sku:
+            raise RowError("sku: campo obligatorio")
+        if sku in self.seen_skus:
+            raise RowError(f"sku: repetido (línea {self.seen_skus[sku]})")
+
+        current = existing.get(sku)
+        values = {}
+        if current:
+            values = {name: getattr(current, name) for name in IMPORT_FIELDS}
+            values.update(
+                category_id=current.category_id, brand_id=current.brand_id, slug=current.slug
+            )
+        for name, field in self.fields.items():
+            if name not in row:
+                continue
+            value = row[name]
+            if isinstance(value, str):
+                value = value.strip()
+            if value in ('', None):
+                if field.null:
+                    value = None
+                elif field.blank:
+                    value = ''
+                else:
+                    continue
+            elif isinstance(field, models.BooleanField) and isinstance(value, str):
+                value = BOOLEANS.get(value.lower(), value)
+            values[name] = value
+        values['sku'] = sku
+
+        if row.get('category') not in ('', None):
+            values['category_id'] = self.resolve(self.categories, row['category'], 'category')
+        elif 'category_id' not in values:
+            raise RowError("category: campo obligatorio")
+        if 'brand' in row:
+            brand = row['brand']
+            values['brand_id'] = self.resolve(self.brands, brand, 'brand') if brand not in ('', None) else None
+
+        material_ids = None
+        if 'materials' in row:
+            names = row['materials'] or []
+            if isinstance(names, str):
+                names = names.split(MATERIALS_SEPARATOR)
+            material_ids = {
+                self.resolve(self.materials, name, 'materials')
+                for name in names if str(name).strip()
+            }
+
+        product = Product(**values)
+        # Sin stock en la fila se conserva el actual, releído con bloqueo en save()
+        product._stock_from_row = row.get('stock') not in ('', None)
+        try:
+            product.clean_fields(exclude=['slug', 'category', 'brand'])
+        except ValidationError as error:
+            raise RowError('; '.join(
+                f"{name}: {' '.join(messages)}" for name, messages in error.message_dict.items()
+            ))
+        if product.discount_price is not None and product.discount_price >= product.price:
+            raise RowError("discount_price: el precio con descuento debe ser menor al precio normal.")
+
+        if not product.slug:
+            product.slug = self.slugs.allocate(product.name)
+        self.seen_skus[sku] = line_number
+        return product, material_ids
+
+    @staticmethod
+    def resolve(lookup, value, field):
+        key = str(value).strip()
+        pk = lookup.get(key) or lookup.get(key.lower())
+        if pk is None:
+            raise RowError(f"{field}: no existe {key!r}")
+        return pk
+
+    def save(self, products, materials):
+        from applications.orders.inventory import record_stock_movements
+
+        with transaction.atomic():
+            # Stock actual bloqueado hasta el final del lote: un checkout
+            # no puede cambiarlo entre esta lectura y el upsert, así que el
+            # movimiento 'import' cuadra con Product.stock
+            locked = dict(
+                Product.objects.select_for_update().filter(
+                    sku__in=[product.sku for product in products]
+                ).order_by('pk').values_list('sku', 'stock')
+            )
+            for product in products:
+                product._previous_stock = locked.get(product.sku, 0)
+                if not product._stock_from_row:
+                    product.stock = product._previous_stock
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=self.update_fields,
+            )
+            ids = dict(
+                Product.objects.filter(sku__in=[product.sku for product in products]).values_list('sku', 'pk')
+            )
+            for product in products:
+                product.pk = ids[product.sku]
+
+            if materials:
+                through = Product.materials.through
+                product_ids = [ids[sku] for sku in materials]
+                through.objects.filter(product_id__in=product_ids).delete()
+                through.objects.bulk_create([
+                    through(product_id=ids[sku], material_id=material_id)
+                    for sku, material_ids in materials.items()
+                    for material_id in material_ids
+                ])
+
+            # bulk_create no envía señales: libro de inventario, índice y
+            # caché se actualizan aquí
+            record_stock_movements(
+                {product.pk: product.stock - product._previous_stock for product in products}, 'import'
+            )
+            get_search_backend().index_products(products)
+            invalidate_on_commit(*CATALOG_TAGS)
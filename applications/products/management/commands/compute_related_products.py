@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from applications.products.related import compute_related_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the precomputed related-products lists. By default only products "
+        "whose inputs changed since their last computation are processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every active product instead of only the stale ones",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Products recomputed and written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        computed = compute_related_products(
+            full=options["full"], batch_size=max(options["batch_size"], 1)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Computed related products for {computed} products."))
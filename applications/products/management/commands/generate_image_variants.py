@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from applications.products.images import generate_variants, registered_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the responsive WebP/JPEG variants of product images, category "
+        "images, brand logos and avatars. By default only images without current "
+        "variants are processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate the variants of every image (e.g. after changing IMAGE_VARIANT_WIDTHS)",
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in registered_models():
+            label = model._meta.label_lower
+            for pk in model._default_manager.order_by("pk").values_list("pk", flat=True).iterator():
+                if generate_variants(label, pk, force=options["force"]) is not None:
+                    generated += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {generated} images."))
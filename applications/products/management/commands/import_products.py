@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from applications.products.importer import ProductImporter, chunked, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a CSV or JSONL file, creating new SKUs and updating "
+        "existing ones. Invalid rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with header) or JSONL file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows validated and written per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate every row without writing anything",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rows = read_rows(options["path"], options["format"])
+            importer = ProductImporter(dry_run=options["dry_run"])
+            started = time.monotonic()
+            created = updated = failed = 0
+            for number, chunk in enumerate(chunked(rows, max(options["batch_size"], 1)), start=1):
+                chunk_created, chunk_updated, errors = importer.import_chunk(chunk)
+                created += chunk_created
+                updated += chunk_updated
+                failed += len(errors)
+                for line_number, sku, message in errors:
+                    self.stderr.write(f"Line {line_number} [{sku or '-'}]: {message}")
+                if options["verbosity"] >= 2:
+                    elapsed = time.monotonic() - started
+                    processed = created + updated + failed
+                    self.stdout.write(
+                        f"Batch {number}: {processed} rows ({processed / max(elapsed, 1e-6):.0f} rows/s)"
+                    )
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        elapsed = time.monotonic() - started
+        processed = created + updated + failed
+        action = "Validated" if options["dry_run"] else "Imported"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} {created + updated} products ({created} new, {updated} updated), "
+                f"{failed} errors, in {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.0f} rows/s)."
+            )
+        )
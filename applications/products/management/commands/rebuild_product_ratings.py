@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from applications.products.cache import invalidate_catalog
+from applications.products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating counters (rating_sum, rating_count, rating_average) from approved reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Products updated per UPDATE statement (by primary key range)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options["batch_size"], 1)
+        bounds = Product.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write("No products found.")
+            return
+
+        updated = 0
+        for start in range(bounds["low"], bounds["high"] + 1, batch_size):
+            updated += Product.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).rebuild_ratings()
+        invalidate_catalog()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating counters for {updated} products."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from applications.products.models import Product
+from applications.products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        total = backend.rebuild(Product.objects.all(), batch_size=max(options["batch_size"], 1))
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {total} products with {backend.__class__.__name__}.")
+        )
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:52
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    approved_reviews = Review.objects.filter(
+        product=OuterRef('pk'),
+        is_approved=True
+    ).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(Subquery(approved_reviews.annotate(value=Sum('rating')).values('value')), 0),
+        rating_count=Coalesce(Subquery(approved_reviews.annotate(value=Count('pk')).values('value')), 0),
+    )
+    Product.objects.update(
+        rating_average=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', FloatField()) / F('rating_count'),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'rating_average'], name='products_pr_is_acti_63028e_idx'),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# DDL del índice tal como era al crearlo; no importa search.py para que
+# cambios posteriores del código no alteren esta migración
+SEARCH_INDEX_TABLE = 'products_search_index'
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Crea el índice de búsqueda según el motor: FTS5 en SQLite,
+    tsvector + GIN en PostgreSQL; otros motores usan icontains.
+
+    PostgreSQL se llena aquí en SQL. En SQLite el texto se normaliza y
+    stemiza en Python al indexar: los productos ya existentes se indexan
+    con manage.py rebuild_search_index (los nuevos, con las señales)
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} "
+            f"USING fts5(name, description, sku, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} ("
+            f"product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX_TABLE}_document_gin "
+            f"ON {SEARCH_INDEX_TABLE} USING GIN (document)"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_INDEX_TABLE} (product_id, document) "
+            f"SELECT id, "
+            f"setweight(to_tsvector('spanish', unaccent(coalesce(name, ''))), 'A') || "
+            f"setweight(to_tsvector('simple', coalesce(sku, '')), 'A') || "
+            f"setweight(to_tsvector('spanish', unaccent(coalesce(description, ''))), 'B') "
+            f"FROM products_product "
+            f"ON CONFLICT (product_id) DO NOTHING"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_rating_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
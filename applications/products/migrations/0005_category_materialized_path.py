@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:18
+
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path_for(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (path_for(parent_id) if parent_id else '') + f'{pk}/'
+        return paths[pk]
+
+    categories = list(Category.objects.only('pk'))
+    for category in categories:
+        category.path = path_for(category.pk)
+        category.depth = category.path.count('/') - 1
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='products_ca_path_e3cf32_idx'),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_held_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lte', models.F('min_stock'))), fields=['is_active', 'stock'], name='product_low_stock_idx'),
+        ),
+    ]
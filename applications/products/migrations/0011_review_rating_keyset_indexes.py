@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_category_path_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['is_approved', '-rating', '-id'], name='products_re_is_appr_2c2e50_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'is_approved', '-rating', '-id'], name='products_re_product_1a1e3b_idx'),
+        ),
+    ]
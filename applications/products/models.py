@@ -1,8 +1,71 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.utils.text import slugify
-from django.db.models import Avg
+from django.db.models import Case, Count, F, FloatField, OuterRef, Prefetch, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat, Substr
+
+from .slugs import save_with_slug
+
+
+class CategoryQuerySet(models.QuerySet):
+    """
+    Consultas reutilizables para categorías
+    """
+    def with_product_count(self):
+        """Anota el número de productos activos (evita un COUNT por fila)"""
+        return self.annotate(
+            active_product_count=Count('products', filter=Q(products__is_active=True))
+        )
+    
+    def for_detail(self):
+        """Conteos precalculados para la categoría, su padre y sus subcategorías"""
+        counted = Category.objects.with_product_count()
+        return self.with_product_count().prefetch_related(
+            Prefetch('parent', queryset=counted),
+            Prefetch('subcategories', queryset=counted),
+        )
+    
+    def subtree(self, category):
+        """La categoría y todas sus descendientes (prefijo de path)"""
+        return self.filter(path__startswith=category.path)
+    
+    def tree(self):
+        """
+        Árbol completo en una consulta: devuelve las raíces, cada nodo con
+        tree_children (en el orden del queryset) y total_product_count
+        (productos activos de todo su subárbol). Los nodos cuyo padre no
+        está en el queryset (ej: padre inactivo) quedan fuera.
+        """
+        nodes = list(self.with_product_count().order_by('depth', 'order', 'name'))
+        by_id = {}
+        roots = []
+        for node in nodes:
+            node.tree_children = []
+            node.total_product_count = node.active_product_count
+            if node.parent_id is None:
+                roots.append(node)
+            elif node.parent_id in by_id:
+                by_id[node.parent_id].tree_children.append(node)
+            else:
+                continue
+            by_id[node.pk] = node
+        # De las hojas hacia la raíz: los hijos suman antes que sus padres
+        for node in reversed(nodes):
+            if node.pk in by_id and node.parent_id in by_id:
+                by_id[node.parent_id].total_product_count += node.total_product_count
+        return roots
+
+
+class BrandQuerySet(models.QuerySet):
+    """
+    Consultas reutilizables para marcas
+    """
+    def with_product_count(self):
+        """Anota el número de productos activos (evita un COUNT por fila)"""
+        return self.annotate(
+            active_product_count=Count('products', filter=Q(products__is_active=True))
+        )
 
 
 class Category(models.Model):
@@ -13,6 +76,8 @@ class Category(models.Model):
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Derivados responsive de image (images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     parent = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
@@ -22,9 +87,18 @@ class Category(models.Model):
     )
     is_active = models.BooleanField(default=True)
     order = models.IntegerField(default=0, help_text="Orden de visualización")
+    # Camino materializado de ids ('1/5/12/'), mantenido en save(). Los
+    # subárboles se filtran por prefijo (path__startswith): db_index crea en
+    # PostgreSQL también el índice varchar_pattern_ops que usa LIKE 'x%'
+    # con cualquier collation (un rango [path, tope) dependería del orden
+    # de la collation, que puede ignorar las '/')
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CategoryQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Categoría'
         verbose_name_plural = 'Categorías'
@@ -39,14 +113,57 @@ class Category(models.Model):
             return f"{self.parent.name} > {self.name}"
         return self.name
     
+    def clean(self):
+        if self.pk and self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+            if parent_path and parent_path.startswith(self.path):
+                raise ValidationError({'parent': 'Una categoría no puede estar dentro de sí misma.'})
+    
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            save_with_slug(self, super().save, *args, **kwargs)
+            self.update_path()
+    
+    def update_path(self):
+        """
+        Recalcula path y depth a partir del padre; si la categoría se movió,
+        reescribe los caminos de todo su subárbol con un único UPDATE
+        """
+        # Caminos actuales de la categoría y de su padre en una consulta
+        paths = dict(Category.objects.filter(pk__in=[self.pk, self.parent_id]).values_list('pk', 'path'))
+        old_path = paths[self.pk]
+        path = f'{paths.get(self.parent_id, "")}{self.pk}/'
+        depth = path.count('/') - 1
+        if path == old_path:
+            self.path, self.depth = path, depth
+            return
+        if old_path:
+            if path.startswith(old_path):
+                raise ValidationError({'parent': 'Una categoría no puede estar dentro de sí misma.'})
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (depth - old_path.count('/') + 1),
+            )
+        Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        self.path, self.depth = path, depth
+    
+    def get_ancestor_ids(self):
+        """Ids de los ancestros, de la raíz al padre (sin consultas)"""
+        return [int(pk) for pk in self.path.split('/')[:-2]]
+    
+    def get_ancestors(self):
+        """Ancestros de la raíz al padre en una consulta"""
+        return Category.objects.filter(pk__in=self.get_ancestor_ids()).order_by('depth')
+    
+    def get_descendants(self, include_self=False):
+        descendants = Category.objects.subtree(self)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
     
     @property
     def product_count(self):
         """Cuenta productos en esta categoría"""
+        if hasattr(self, 'active_product_count'):
+            return self.active_product_count
         return self.products.filter(is_active=True).count()
 
 
@@ -57,10 +174,13 @@ class Brand(models.Model):
     name = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     logo = models.ImageField(upload_to='brands/', blank=True, null=True)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = BrandQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Marca'
         verbose_name_plural = 'Marcas'
@@ -73,9 +193,14 @@ class Brand(models.Model):
         return self.name
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        save_with_slug(self, super().save, *args, **kwargs)
+    
+    @property
+    def product_count(self):
+        """Cuenta productos activos de esta marca"""
+        if hasattr(self, 'active_product_count'):
+            return self.active_product_count
+        return self.products.filter(is_active=True).count()
 
 
 class Material(models.Model):
@@ -94,6 +219,194 @@ class Material(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """
+    Consultas reutilizables para productos
+    """
+    def with_catalog_data(self):
+        """
+        Anota la ruta y las variantes de la imagen principal como
+        subconsultas de la misma consulta (rating y reviews ya están
+        desnormalizados en Product)
+        """
+        primary_image = ProductImage.objects.filter(
+            product=OuterRef('pk'),
+            is_primary=True
+        ).order_by('order', 'created_at')
+        return self.annotate(
+            primary_image_path=Subquery(primary_image.values('image')[:1]),
+            primary_image_variants=Subquery(
+                primary_image.values('variants')[:1], output_field=models.JSONField()
+            ),
+        )
+    
+    def for_catalog(self):
+        """
+        Modo catálogo para listados: datos anotados y categoría/marca
+        precargadas con sus conteos, para serializar con un número fijo
+        de consultas.
+        No combinar con select_related('category', 'brand'): el prefetch
+        se omite si la relación ya está cargada.
+        """
+        return self.with_catalog_data().prefetch_related(*catalog_prefetches())
+    
+    def for_detail(self):
+        """
+        Modo catálogo para el detalle: además precarga el árbol de la
+        categoría y las relaciones anidadas del producto
+        """
+        return self.with_catalog_data().prefetch_related(*detail_prefetches())
+    
+    def in_category_tree(self, category):
+        """Productos de la categoría y de todas sus subcategorías"""
+        return self.filter(category__path__startswith=category.path)
+    
+    def low_stock(self):
+        """
+        Productos activos con Product.is_low_stock (stock físico en o bajo
+        min_stock, incluidos los agotados); usa el índice parcial low_stock
+        de Product
+        """
+        return self.filter(is_active=True, stock__lte=F('min_stock'))
+    
+    def apply_rating_delta(self, rating_delta, count_delta):
+        """
+        Ajusta los contadores de rating de forma incremental (sin leer ni
+        reagrupar las reviews) y recalcula el promedio en la misma transacción
+        """
+        with transaction.atomic():
+            updated = self.update(
+                rating_sum=F('rating_sum') + rating_delta,
+                rating_count=F('rating_count') + count_delta,
+            )
+            self.update(rating_average=rating_average_expression())
+        return updated
+    
+    def reserve_stock(self, quantities):
+        """
+        Descuenta {product_id: cantidad} con un único UPDATE condicional
+        (stock = stock - CASE ... WHERE (id = a AND stock - held_stock >= qa) OR ...).
+        Es todo o nada: si alguna línea no tiene stock disponible (sin
+        contar lo apartado por otros checkouts) no se descuenta ninguna y
+        devuelve False.
+        """
+        quantities = {pk: qty for pk, qty in quantities.items() if qty}
+        if not quantities:
+            return True
+        condition = Q()
+        for pk, qty in quantities.items():
+            condition |= Q(pk=pk, stock__gte=F('held_stock') + qty)
+        decrement = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            default=Value(0)
+        )
+        with transaction.atomic():
+            updated = self.filter(condition).update(stock=F('stock') - decrement)
+            if updated != len(quantities):
+                # Revierte solo este savepoint; la transacción externa sigue viva
+                transaction.set_rollback(True)
+                return False
+        return True
+    
+    def release_stock(self, quantities):
+        """
+        Devuelve al stock {product_id: cantidad} en un único UPDATE
+        """
+        quantities = {pk: qty for pk, qty in quantities.items() if pk and qty}
+        if not quantities:
+            return 0
+        increment = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            default=Value(0)
+        )
+        return self.filter(pk__in=quantities).update(stock=F('stock') + increment)
+    
+    def hold_stock(self, quantities):
+        """
+        Aparta {product_id: cantidad} del stock disponible sumándolo a
+        held_stock, con el mismo UPDATE condicional todo o nada que
+        reserve_stock. Ver applications.orders.holds
+        """
+        quantities = {pk: qty for pk, qty in quantities.items() if qty}
+        if not quantities:
+            return True
+        condition = Q()
+        for pk, qty in quantities.items():
+            condition |= Q(pk=pk, stock__gte=F('held_stock') + qty)
+        increment = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            default=Value(0)
+        )
+        with transaction.atomic():
+            updated = self.filter(condition).update(held_stock=F('held_stock') + increment)
+            if updated != len(quantities):
+                transaction.set_rollback(True)
+                return False
+        return True
+    
+    def unhold_stock(self, quantities):
+        """
+        Devuelve al stock disponible {product_id: cantidad} apartados
+        """
+        quantities = {pk: qty for pk, qty in quantities.items() if pk and qty}
+        if not quantities:
+            return 0
+        decrement = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            default=Value(0)
+        )
+        return self.filter(pk__in=quantities).update(held_stock=F('held_stock') - decrement)
+    
+    def rebuild_ratings(self):
+        """
+        Recalcula los contadores de rating desde las reviews aprobadas
+        con un único UPDATE por conjunto
+        """
+        approved_reviews = Review.objects.filter(
+            product=OuterRef('pk'),
+            is_approved=True
+        ).order_by().values('product')
+        with transaction.atomic():
+            updated = self.update(
+                rating_sum=Coalesce(
+                    Subquery(approved_reviews.annotate(value=Sum('rating')).values('value')),
+                    0
+                ),
+                rating_count=Coalesce(
+                    Subquery(approved_reviews.annotate(value=Count('pk')).values('value')),
+                    0
+                ),
+            )
+            self.update(rating_average=rating_average_expression())
+        return updated
+
+
+def catalog_prefetches():
+    """Categoría y marca con sus conteos, para el modo catálogo"""
+    return [
+        Prefetch('category', queryset=Category.objects.with_product_count()),
+        Prefetch('brand', queryset=Brand.objects.with_product_count()),
+    ]
+
+
+def detail_prefetches():
+    """Árbol de la categoría, marca y relaciones anidadas, para el detalle"""
+    return [
+        Prefetch('category', queryset=Category.objects.for_detail()),
+        Prefetch('brand', queryset=Brand.objects.with_product_count()),
+        'materials', 'images', 'specifications',
+    ]
+
+
+def rating_average_expression():
+    """Promedio rating_sum / rating_count, 0 si no hay reviews"""
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast('rating_sum', FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
 class Product(models.Model):
     """
     Producto principal del e-commerce
@@ -146,6 +459,9 @@ class Product(models.Model):
         default=5,
         help_text="Stock mínimo para alertas"
     )
+    # Unidades apartadas por checkouts en curso (StockHold activos, ver
+    # applications.orders.holds); disponible = stock - held_stock
+    held_stock = models.PositiveIntegerField(default=0, editable=False)
     
     # Dimensiones (importantes para muebles)
     width = models.DecimalField(
@@ -195,9 +511,18 @@ class Product(models.Model):
     # Estadísticas
     views_count = models.IntegerField(default=0)
     
+    # Rating desnormalizado (mantenido por las señales de Review)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Último cálculo de productos relacionados (ver related.py)
+    related_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Producto'
@@ -209,15 +534,28 @@ class Product(models.Model):
             models.Index(fields=['is_active', 'is_featured']),
             models.Index(fields=['-created_at']),
             models.Index(fields=['category', 'is_active']),
+            # Paginación keyset: orden + desempate por id
+            models.Index(fields=['is_active', '-created_at', '-id']),
+            models.Index(fields=['is_active', 'price', 'id']),
+            models.Index(fields=['is_active', 'views_count', 'id']),
+            models.Index(fields=['is_active', 'name', 'id']),
+            models.Index(fields=['is_active', 'rating_average', 'id']),
+            # Alertas de stock bajo (ProductQuerySet.low_stock)
+            models.Index(
+                fields=['is_active', 'stock'],
+                condition=Q(stock__lte=F('min_stock')),
+                name='product_low_stock_idx',
+            ),
         ]
     
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        # Las señales bloquean la fila y registran el ajuste de stock en el
+        # libro de inventario dentro de la misma transacción (ver signals)
+        with transaction.atomic():
+            save_with_slug(self, super().save, *args, **kwargs)
     
     @property
     def final_price(self):
@@ -231,31 +569,43 @@ class Product(models.Model):
             return int(((self.price - self.discount_price) / self.price) * 100)
         return 0
     
+    @property
+    def available_stock(self):
+        """Stock que se puede vender o apartar ahora"""
+        return max(self.stock - self.held_stock, 0)
+    
     @property
     def is_in_stock(self):
-        """Verifica si hay stock disponible"""
-        return self.stock > 0
+        """Verifica si hay stock disponible (sin contar el apartado)"""
+        return self.available_stock > 0
     
     @property
     def is_low_stock(self):
-        """Verifica si el stock está bajo"""
-        return 0 < self.stock <= self.min_stock
+        """
+        Stock físico en o bajo min_stock, incluidos los agotados. Misma
+        definición que ProductQuerySet.low_stock y las alertas: los holds
+        son temporales y no cuentan para reponer
+        """
+        return self.stock <= self.min_stock
     
     @property
     def average_rating(self):
-        """Calcula el rating promedio del producto"""
-        avg = self.reviews.filter(is_approved=True).aggregate(Avg('rating'))['rating__avg']
-        return round(avg, 1) if avg else 0
+        """Rating promedio del producto (desnormalizado en rating_average)"""
+        return round(self.rating_average, 1) if self.rating_count else 0
     
     @property
     def review_count(self):
-        """Cuenta las reviews aprobadas"""
-        return self.reviews.filter(is_approved=True).count()
+        """Cantidad de reviews aprobadas (desnormalizada en rating_count)"""
+        return self.rating_count
     
     def increment_views(self):
-        """Incrementa el contador de vistas"""
+        """
+        Registra una vista en el buffer del proceso; se escribe en lote
+        con F('views_count') + n (ver counters.py)
+        """
+        from .counters import view_counter
+        view_counter.add(self.pk)
         self.views_count += 1
-        self.save(update_fields=['views_count'])
 
 
 class ProductImage(models.Model):
@@ -268,6 +618,8 @@ class ProductImage(models.Model):
         related_name='images'
     )
     image = models.ImageField(upload_to='products/')
+    # Derivados responsive de image (images.py)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     is_primary = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=200, blank=True)
     order = models.IntegerField(default=0)
@@ -351,7 +703,40 @@ class Review(models.Model):
         indexes = [
             models.Index(fields=['product', 'is_approved']),
             models.Index(fields=['-created_at']),
+            models.Index(fields=['is_approved', '-created_at', '-id']),
+            models.Index(fields=['product', 'is_approved', '-created_at', '-id']),
+            # Orden keyset por rating (ReviewCursorPagination)
+            models.Index(fields=['is_approved', '-rating', '-id']),
+            models.Index(fields=['product', 'is_approved', '-rating', '-id']),
         ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating}⭐)"
+    
+    def save(self, *args, **kwargs):
+        # Las señales actualizan los contadores de rating del producto
+        # dentro de la misma transacción que la review
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class RelatedProduct(models.Model):
+    """
+    Productos relacionados precalculados por compute_related_products
+    (una fila por par, ordenadas por rank dentro de cada producto)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        verbose_name = 'Producto relacionado'
+        verbose_name_plural = 'Productos relacionados'
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_product_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.2f})"
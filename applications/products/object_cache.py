@@ -0,0 +1,210 @@
+"""
+Caché de lectura de objetos serializados del catálogo (productos y categorías).
+
+Dos niveles: un LRU acotado en la memoria del proceso
+(OBJECT_CACHE_LOCAL_SIZE entradas) delante de la caché compartida
+(Redis o LocMem, OBJECT_CACHE_TTL segundos). Las claves incluyen el slug,
+la versión del objeto (updated_at) y la generación de las etiquetas de las
+que depende el payload (cache.py), así que nunca se borran entradas: una
+versión nueva usa otra clave y la anterior sale del LRU o expira.
+
+Los campos que cambian sin pasar por save() (stock, vistas, rating) no
+se sirven desde la caché: se superponen desde la fila leída en cada
+petición.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+
+from .cache import BRANDS, CATEGORIES, get_generations
+from .models import catalog_prefetches, detail_prefetches
+from .serializers import CategoryDetailSerializer, ProductDetailSerializer, ProductListSerializer
+
+# Campos del payload de Product que se actualizan con UPDATE directos
+# ({campo: atributo de la instancia}); 'stock' publica el stock disponible
+PRODUCT_VOLATILE_FIELDS = {
+    'stock': 'available_stock',
+    **{
+        field: field for field in (
+            'is_in_stock', 'is_low_stock', 'views_count', 'average_rating', 'review_count',
+        )
+    },
+}
+
+
+class LRUCache:
+    """
+    Diccionario acotado en memoria; descarta la entrada usada hace más tiempo
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, mapping):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ObjectCache:
+    """
+    Payloads de serializer_class por objeto, con lectura a través de las
+    dos capas de caché y carga agrupada de los que falten
+    """
+    def __init__(self, name, serializer_class, tags=(), volatile_fields=None, prefetches=list):
+        self.name = name
+        self.serializer_class = serializer_class
+        self.tags = tags
+        self.volatile_fields = volatile_fields or {}
+        self.prefetches = prefetches
+        self.local = LRUCache(getattr(settings, 'OBJECT_CACHE_LOCAL_SIZE', 1000))
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'OBJECT_CACHE_TTL', 0)
+
+    def reset_stats(self):
+        with self._lock:
+            self.local_hits = self.shared_hits = self.misses = 0
+            self.local.evictions = 0
+
+    def stats(self):
+        """Contadores del proceso actual"""
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.local.evictions,
+            'local_size': len(self.local),
+            'local_max_size': self.local.max_size,
+        }
+
+    def make_key(self, request, slug, version, generations):
+        # Las URLs de imágenes son absolutas: el host forma parte de la clave
+        host = request.build_absolute_uri('/') if request else ''
+        payload = json.dumps([slug, version, sorted(generations.items()), host])
+        return f'objects:{self.name}:{hashlib.sha1(payload.encode("utf-8")).hexdigest()}'
+
+    def fetch(self, request, versions, load):
+        """
+        versions: {slug: versión}. load(slugs) devuelve {slug: instancia}
+        con lo necesario para serializar; solo se llama con los que faltan
+        en ambas capas. Devuelve {slug: payload}
+        """
+        if not self.timeout:
+            instances = load(list(versions))
+            return {slug: self.serialize(instance, request) for slug, instance in instances.items()}
+
+        generations = get_generations(self.tags) if self.tags else {}
+        keys = {
+            slug: self.make_key(request, slug, version, generations)
+            for slug, version in versions.items()
+        }
+        found = self.local.get_many(keys.values())
+        local_hits = len(found)
+        missing = [key for key in keys.values() if key not in found]
+        shared = cache.get_many(missing) if missing else {}
+        self.local.set_many(shared)
+        found.update(shared)
+
+        pending = [slug for slug, key in keys.items() if key not in found]
+        if pending:
+            loaded = {
+                keys[slug]: self.serialize(instance, request)
+                for slug, instance in load(pending).items()
+            }
+            cache.set_many(loaded, self.timeout)
+            self.local.set_many(loaded)
+            found.update(loaded)
+
+        with self._lock:
+            self.local_hits += local_hits
+            self.shared_hits += len(shared)
+            self.misses += len(pending)
+        return {slug: found[key] for slug, key in keys.items() if key in found}
+
+    def serialize(self, instance, request):
+        return dict(self.serializer_class(instance, context={'request': request}).data)
+
+    def load_objects(self, objects):
+        """Precarga las relaciones del payload solo en los objetos que faltan"""
+        prefetch_related_objects(objects, *self.prefetches())
+        return {obj.slug: obj for obj in objects}
+
+    def get_many(self, objects, request):
+        """
+        Payloads de objects (instancias con slug y updated_at, en su orden);
+        los campos volátiles se toman siempre de cada instancia
+        """
+        objects = list(objects)
+        by_slug = {obj.slug: obj for obj in objects}
+        payloads = self.fetch(
+            request,
+            {obj.slug: obj.updated_at.isoformat() for obj in objects},
+            lambda slugs: self.load_objects([by_slug[slug] for slug in slugs]),
+        )
+        result = []
+        for obj in objects:
+            if obj.slug not in payloads:
+                continue  # eliminado mientras tanto
+            payload = dict(payloads[obj.slug])
+            for field, attribute in self.volatile_fields.items():
+                if field in payload:
+                    payload[field] = getattr(obj, attribute)
+            result.append(payload)
+        return result
+
+    def get(self, obj, request):
+        return self.get_many([obj], request)[0]
+
+
+# El payload de producto anida la categoría y la marca con sus conteos
+product_detail_cache = ObjectCache(
+    'product_detail', ProductDetailSerializer, tags=(CATEGORIES, BRANDS),
+    volatile_fields=PRODUCT_VOLATILE_FIELDS, prefetches=detail_prefetches,
+)
+product_list_cache = ObjectCache(
+    'product_list', ProductListSerializer, tags=(CATEGORIES, BRANDS),
+    volatile_fields=PRODUCT_VOLATILE_FIELDS, prefetches=catalog_prefetches,
+)
+# Cualquier cambio de una categoría (o de los conteos de productos) cambia
+# la generación de 'categories', que versiona el payload completo
+category_detail_cache = ObjectCache('category_detail', CategoryDetailSerializer, tags=(CATEGORIES,))
+
+OBJECT_CACHES = (product_detail_cache, product_list_cache, category_detail_cache)
+
+
+def object_cache_stats():
+    """Contadores de las cachés de objetos del proceso actual"""
+    return {object_cache.name: object_cache.stats() for object_cache in OBJECT_CACHES}
@@ -0,0 +1,256 @@
+"""
+Paginación keyset (por cursor) para los listados grandes.
+
+En lugar de OFFSET n, cada página filtra por la posición del último
+elemento (ej: created_at < X OR (created_at = X AND id < Y)) sobre un
+orden con desempate estable, respaldado por un índice compuesto.
+
+- ?cursor=<token>   posición opaca; next/previous ya la incluyen
+- ?ordering=price   cualquiera de las órdenes declaradas en `orderings`
+- ?page_size=50     tamaño de página (máximo max_page_size)
+- ?count=false      omite el COUNT(*) total
+- ?page=N           compatibilidad: usa la paginación por número de página
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_orderings(*fields, aliases=None, tiebreaker='id'):
+    """
+    Construye {'price': ('price', 'id'), '-price': ('-price', '-id'), ...}
+    incluyendo los alias públicos (ej: rating -> rating_average)
+    """
+    names = {field: field for field in fields}
+    names.update(aliases or {})
+    orderings = {}
+    for name, field in names.items():
+        orderings[name] = (field, tiebreaker)
+        orderings[f'-{name}'] = (f'-{field}', f'-{tiebreaker}')
+    return orderings
+
+
+class PageNumberFallbackPagination(PageNumberPagination):
+    """
+    Paginación por número de página para ?page=N y órdenes sin índice keyset
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación keyset con desempate estable y conteo opcional
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    count_query_param = 'count'
+    # Órdenes permitidas: alias -> campos (el último es el desempate único)
+    orderings = {}
+    default_ordering = None
+    fallback_class = PageNumberFallbackPagination
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_keyset_fields(self, request, view):
+        """
+        Campos del orden keyset, o None si la petición debe usar la
+        paginación por número de página (page=N, orden no soportado o
+        búsqueda ordenada por relevancia)
+        """
+        if self.fallback_class.page_query_param in request.query_params:
+            return None
+        requested = request.query_params.get(self.ordering_param)
+        if requested:
+            return self.orderings.get(requested.strip())
+        if request.query_params.get('search'):
+            return None
+        return self.orderings.get(self.default_ordering)
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0', 'no')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = self.get_keyset_fields(request, view)
+        if self.fields is None:
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+        self.fallback = None
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        values, backwards = self.decode_cursor(request)
+        self.count = queryset.count() if self.include_count(request) else None
+
+        fields = self.fields
+        if backwards:
+            fields = tuple(self._reverse(field) for field in fields)
+        queryset = queryset.order_by(*fields)
+        if values is not None:
+            queryset = queryset.filter(self._after(fields, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.fallback:
+            return self.fallback.get_paginated_response(data)
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor de paginación (usar los enlaces next/previous)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Resultados por página (máximo {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'false para omitir el total (evita el COUNT)',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+    # Enlaces
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], backwards=True)
+
+    def _link(self, row, backwards):
+        url = remove_query_param(self.request.build_absolute_uri(), self.fallback_class.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, backwards))
+
+    # Cursor
+
+    def encode_cursor(self, row, backwards):
+        values = []
+        for field in self.fields:
+            value = getattr(row, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = json.dumps({'v': values, 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            raw_values, backwards = payload['v'], bool(payload['b'])
+            if len(raw_values) != len(self.fields):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.fields, raw_values)
+            ]
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, backwards
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(fields, values):
+        """
+        Condición "después de la posición" para un orden compuesto:
+        (a > x) OR (a = x AND b > y) ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(fields, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+class ProductCursorPagination(KeysetPagination):
+    """
+    Catálogo: mismas órdenes que ?ordering= del listado de productos
+    """
+    default_ordering = '-created_at'
+    orderings = keyset_orderings(
+        'created_at', 'price', 'name', 'views_count', 'rating_average',
+        aliases={'views': 'views_count', 'rating': 'rating_average'},
+    )
+
+
+class ReviewCursorPagination(KeysetPagination):
+    """
+    Feed de reviews
+    """
+    default_ordering = '-created_at'
+    orderings = keyset_orderings('created_at', 'rating')
@@ -0,0 +1,192 @@
+"""
+Cálculo offline de productos relacionados (comando compute_related_products).
+
+Para cada producto se puntúan los candidatos activos de su misma
+categoría raíz y los que aparecen junto a él en órdenes o listas de
+deseos:
+
+- categoría: proporción del camino de categorías compartido (mismo
+  subárbol pesa más cuanto más profundo)
+- marca: misma marca
+- materiales: índice de Jaccard de los materiales
+- precio: cercanía relativa del precio final
+- co-ocurrencia: órdenes y listas de deseos que contienen a ambos
+
+Los mejores RELATED_PRODUCTS_STORED se guardan en RelatedProduct. El
+cálculo es incremental: solo se recalculan los productos cuyos datos
+cambiaron desde su related_computed_at (ver stale_products).
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .cache import PRODUCTS, invalidate_on_commit
+from .models import Product, RelatedProduct
+
+WEIGHTS = {
+    'category': 3.0,
+    'brand': 1.5,
+    'materials': 1.0,
+    'price': 1.0,
+    'orders': 2.0,
+    'wishlists': 1.0,
+}
+
+
+def stale_products():
+    """
+    Productos activos cuya lista debe recalcularse:
+    - nunca calculados o modificados desde el último cálculo
+    - con órdenes o listas de deseos nuevas que los incluyen
+    - cuya lista incluye un producto modificado (precio, estado, ...)
+    - con productos nuevos en su misma categoría
+    """
+    from applications.cart.models import Wishlist
+    from applications.orders.models import OrderItem
+
+    computed_at = OuterRef('related_computed_at')
+    return Product.objects.filter(is_active=True).filter(
+        Q(related_computed_at__isnull=True)
+        | Q(updated_at__gt=F('related_computed_at'))
+        | Exists(OrderItem.objects.filter(product=OuterRef('pk'), created_at__gt=computed_at))
+        | Exists(Wishlist.objects.filter(product=OuterRef('pk'), added_at__gt=computed_at))
+        | Exists(RelatedProduct.objects.filter(product=OuterRef('pk'), related__updated_at__gt=computed_at))
+        | Exists(Product.objects.filter(category=OuterRef('category'), created_at__gt=computed_at))
+    )
+
+
+def load_features():
+    """
+    {product_id: (ids del camino de categorías, marca, precio, materiales)}
+    de todos los productos activos, en dos consultas
+    """
+    materials = defaultdict(set)
+    for product_id, material_id in Product.materials.through.objects.filter(
+        product__is_active=True
+    ).values_list('product_id', 'material_id'):
+        materials[product_id].add(material_id)
+
+    features = {}
+    rows = Product.objects.filter(is_active=True).values_list(
+        'pk', 'category__path', 'brand_id', 'price', 'discount_price'
+    )
+    for pk, path, brand_id, price, discount_price in rows:
+        features[pk] = (
+            tuple((path or '').split('/')[:-1]),
+            brand_id,
+            float(discount_price or price),
+            materials[pk],
+        )
+    return features
+
+
+def co_occurrences(product_ids):
+    """
+    Para cada producto de product_ids: Counter de los productos con los que
+    comparte órdenes y Counter de los que comparte listas de deseos
+    """
+    from applications.cart.models import Wishlist
+    from applications.orders.models import OrderItem
+
+    def count(rows):
+        groups = defaultdict(set)
+        for group_id, product_id in rows:
+            groups[group_id].add(product_id)
+        counts = defaultdict(Counter)
+        for members in groups.values():
+            for product_id in members & product_ids:
+                counts[product_id].update(members - {product_id})
+        return counts
+
+    orders = OrderItem.objects.filter(
+        order__in=OrderItem.objects.filter(product__in=product_ids).values('order'),
+        product__isnull=False,
+    ).values_list('order_id', 'product_id')
+    wishlists = Wishlist.objects.filter(
+        user__in=Wishlist.objects.filter(product__in=product_ids).values('user'),
+    ).values_list('user_id', 'product_id')
+    return count(orders), count(wishlists)
+
+
+def score(features, a, b, orders=0, wishlists=0):
+    path_a, brand_a, price_a, materials_a = features[a]
+    path_b, brand_b, price_b, materials_b = features[b]
+
+    shared = 0
+    for segment_a, segment_b in zip(path_a, path_b):
+        if segment_a != segment_b:
+            break
+        shared += 1
+    total = WEIGHTS['category'] * shared / max(len(path_a), 1)
+    if brand_a and brand_a == brand_b:
+        total += WEIGHTS['brand']
+    if materials_a or materials_b:
+        total += WEIGHTS['materials'] * len(materials_a & materials_b) / len(materials_a | materials_b)
+    if price_a or price_b:
+        total += WEIGHTS['price'] * (1 - abs(price_a - price_b) / max(price_a, price_b))
+    total += WEIGHTS['orders'] * math.log1p(orders)
+    total += WEIGHTS['wishlists'] * math.log1p(wishlists)
+    return total
+
+
+def group_by_root(features):
+    """{id de la categoría raíz: ids de sus productos activos}"""
+    by_root = defaultdict(set)
+    for pk, (path, *_) in features.items():
+        if path:
+            by_root[path[0]].add(pk)
+    return by_root
+
+
+def rank_related(features, by_root, product_id, orders, wishlists, limit):
+    """Los limit mejores candidatos como [(score, related_id)]"""
+    path = features[product_id][0]
+    candidates = set(by_root[path[0]]) if path else set()
+    candidates |= set(orders) | set(wishlists)
+    candidates &= features.keys()
+    candidates.discard(product_id)
+    scored = [
+        (score(features, product_id, pk, orders[pk], wishlists[pk]), pk)
+        for pk in candidates
+    ]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return scored[:limit]
+
+
+def compute_related_products(full=False, batch_size=500, limit=None):
+    """
+    Recalcula y guarda los relacionados de los productos desactualizados
+    (o de todos los activos con full=True). Devuelve cuántos recalculó
+    """
+    limit = limit or getattr(settings, 'RELATED_PRODUCTS_STORED', 12)
+    # Lo que cambie durante el cálculo queda para la próxima corrida
+    started = timezone.now()
+    pending = Product.objects.filter(is_active=True) if full else stale_products()
+    pending_ids = list(pending.order_by('pk').values_list('pk', flat=True))
+    if not pending_ids:
+        return 0
+
+    features = load_features()
+    by_root = group_by_root(features)
+    for start in range(0, len(pending_ids), batch_size):
+        batch = set(pending_ids[start:start + batch_size]) & features.keys()
+        orders, wishlists = co_occurrences(batch)
+        rows = []
+        for product_id in sorted(batch):
+            ranked = rank_related(
+                features, by_root, product_id, orders[product_id], wishlists[product_id], limit
+            )
+            rows.extend(
+                RelatedProduct(product_id=product_id, related_id=related_id, score=value, rank=rank)
+                for rank, (value, related_id) in enumerate(ranked)
+            )
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product__in=batch).delete()
+            RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+            Product.objects.filter(pk__in=batch).update(related_computed_at=started)
+            invalidate_on_commit(PRODUCTS)
+    return len(pending_ids)
@@ -0,0 +1,249 @@
+"""
+Búsqueda de texto completo del catálogo con backends intercambiables.
+
+- PostgreSQL: tsvector con la configuración 'spanish' + unaccent, índice GIN
+- SQLite: tabla virtual FTS5 con stemming español ligero (desarrollo local)
+- Otros motores: icontains sobre nombre, descripción y SKU (sin ranking)
+
+El índice vive en la tabla products_search_index (creada por la migración
+0003_product_search_index) y se mantiene con las señales de Product.
+Se puede forzar un backend con PRODUCT_SEARCH_BACKEND.
+
+El ranking se calcula dentro del queryset ya filtrado (subconsulta de sus
+ids) y se corta en PRODUCT_SEARCH_MAX_RESULTS; si hubo más coincidencias
+el backend queda con truncated = True (cabecera X-Search-Truncated).
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+SEARCH_INDEX_TABLE = 'products_search_index'
+
+_WORD_RE = re.compile(r'\w+')
+_VOWELS = 'aeiou'
+
+
+def normalize(text):
+    """Minúsculas y sin tildes: 'Estantería' -> 'estanteria'"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def stem(word):
+    """
+    Stemming español ligero: quita plurales y la vocal final de género
+    ('sofás' -> 'sof', 'sillones' -> 'sillon', 'luces' -> 'luz')
+    """
+    if len(word) > 4 and word.endswith('ces'):
+        word = word[:-3] + 'z'
+    elif len(word) > 4 and word.endswith('es') and word[-3] not in _VOWELS:
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s'):
+        word = word[:-1]
+    if len(word) > 3 and word[-1] in 'aoe':
+        word = word[:-1]
+    return word
+
+
+def analyze(text):
+    """Tokens normalizados y reducidos a su raíz"""
+    return [stem(token) for token in _WORD_RE.findall(normalize(text))]
+
+
+class IcontainsSearchBackend:
+    """
+    Backend de respaldo: filtra con icontains, sin índice ni ranking
+    """
+    truncated = False
+
+    def index_rows(self, rows):
+        """rows: iterable de (id, name, description, sku)"""
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def rank(self, query, limit, candidates=None):
+        return []
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(sku__icontains=query)
+        )
+
+    def index_products(self, products):
+        self.index_rows((p.pk, p.name, p.description, p.sku) for p in products)
+
+    def rebuild(self, queryset, batch_size=500):
+        """Reindexa todos los productos del queryset en lotes"""
+        self.clear()
+        total = 0
+        rows = queryset.order_by('pk').values_list('pk', 'name', 'description', 'sku')
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.index_rows(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index_rows(batch)
+            total += len(batch)
+        return total
+
+
+class RankedSearchBackend(IcontainsSearchBackend):
+    """
+    Base de los backends con índice: obtiene (id, score) del índice y
+    ordena el queryset por relevancia
+    """
+    @staticmethod
+    def candidates_sql(column, candidates):
+        """Condición 'column IN (ids de candidates)' y sus parámetros"""
+        if candidates is None:
+            return '', []
+        sql, params = candidates.query.sql_with_params()
+        return f" AND {column} IN ({sql})", list(params)
+
+    @property
+    def max_results(self):
+        return getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', 500)
+
+    def search(self, queryset, query):
+        # Un resultado de más indica que hubo que cortar
+        ranked = self.rank(query, self.max_results + 1, queryset.order_by().values('pk'))
+        self.truncated = len(ranked) > self.max_results
+        product_ids = [pk for pk, _ in ranked[:self.max_results]]
+        if not product_ids:
+            return queryset.none()
+        relevance = Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(product_ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=product_ids).annotate(search_rank=relevance).order_by('search_rank')
+
+
+class SQLiteSearchBackend(RankedSearchBackend):
+    """
+    FTS5 sobre texto ya normalizado y con stemming; consultas por prefijo
+    ordenadas por bm25 (nombre y SKU pesan más que la descripción)
+    """
+    def index_rows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        self.remove([row[0] for row in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_INDEX_TABLE} (rowid, name, description, sku) VALUES (%s, %s, %s, %s)",
+                [
+                    (pk, ' '.join(analyze(name)), ' '.join(analyze(description)), normalize(sku))
+                    for pk, name, description, sku in rows
+                ]
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_INDEX_TABLE}")
+
+    def rank(self, query, limit, candidates=None):
+        tokens = analyze(query)
+        if not tokens:
+            return []
+        match = ' AND '.join(f'"{token}"*' for token in tokens)
+        condition, params = self.candidates_sql('rowid', candidates)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({SEARCH_INDEX_TABLE}, 10.0, 1.0, 5.0) AS score "
+                f"FROM {SEARCH_INDEX_TABLE} WHERE {SEARCH_INDEX_TABLE} MATCH %s{condition} "
+                f"ORDER BY score LIMIT %s",
+                [match, *params, limit]
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(RankedSearchBackend):
+    """
+    tsvector 'spanish' sin tildes (unaccent) con pesos A (nombre, SKU) y
+    B (descripción), consultado por prefijo y ordenado por ts_rank
+    """
+    document_sql = (
+        "setweight(to_tsvector('spanish', unaccent(coalesce(%s, ''))), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+        "setweight(to_tsvector('spanish', unaccent(coalesce(%s, ''))), 'B')"
+    )
+
+    def index_rows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_INDEX_TABLE} (product_id, document) "
+                f"VALUES (%s, {self.document_sql}) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [(pk, name, sku, description) for pk, name, description, sku in rows]
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE product_id = ANY(%s)",
+                [product_ids]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {SEARCH_INDEX_TABLE}")
+
+    def rank(self, query, limit, candidates=None):
+        tokens = _WORD_RE.findall(normalize(query))
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        condition, params = self.candidates_sql('product_id', candidates)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id, ts_rank(document, query) AS score "
+                f"FROM {SEARCH_INDEX_TABLE}, to_tsquery('spanish', %s) query "
+                f"WHERE document @@ query{condition} ORDER BY score DESC LIMIT %s",
+                [tsquery, *params, limit]
+            )
+            return cursor.fetchall()
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+    'icontains': IcontainsSearchBackend,
+}
+
+
+def get_search_backend():
+    """
+    Backend según PRODUCT_SEARCH_BACKEND o el motor de la base de datos
+    """
+    name = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None) or connection.vendor
+    return SEARCH_BACKENDS.get(name, IcontainsSearchBackend)()
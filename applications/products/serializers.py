@@ -1,17 +1,28 @@
 from rest_framework import serializers
 from django.db.models import Avg
+from .images import variant_urls
 from .models import Category, Brand, Material, Product, ProductImage, ProductSpecification, Review
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    URLs de los derivados responsive de una imagen (images.py) por formato
+    y ancho, con su srcset; None mientras no se hayan generado
+    """
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
 class CategoryListSerializer(serializers.ModelSerializer):
     """
     Serializer básico para listar categorías
     """
     product_count = serializers.ReadOnlyField()
+    image_variants = ImageVariantsField()
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image', 'product_count', 'is_active']
+        fields = ['id', 'name', 'slug', 'image', 'image_variants', 'product_count', 'is_active']
 
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
@@ -21,28 +32,44 @@ class CategoryDetailSerializer(serializers.ModelSerializer):
     subcategories = CategoryListSerializer(many=True, read_only=True)
     parent = CategoryListSerializer(read_only=True)
     product_count = serializers.ReadOnlyField()
+    image_variants = ImageVariantsField()
     
     class Meta:
         model = Category
         fields = [
-            'id', 'name', 'slug', 'description', 'image',
+            'id', 'name', 'slug', 'description', 'image', 'image_variants',
             'parent', 'subcategories', 'is_active', 'order',
             'product_count', 'created_at', 'updated_at'
         ]
 
 
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    """
+    Nodo del árbol de navegación (ver CategoryQuerySet.tree)
+    """
+    product_count = serializers.ReadOnlyField()
+    total_product_count = serializers.ReadOnlyField()
+    children = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
+    
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'image', 'image_variants', 'depth', 'product_count', 'total_product_count', 'children']
+    
+    def get_children(self, obj):
+        return CategoryTreeSerializer(obj.tree_children, many=True, context=self.context).data
+
+
 class BrandSerializer(serializers.ModelSerializer):
     """
     Serializer para marcas
     """
-    product_count = serializers.SerializerMethodField()
+    product_count = serializers.ReadOnlyField()
+    logo_variants = ImageVariantsField()
     
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'slug', 'logo', 'description', 'is_active', 'product_count']
-    
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+        fields = ['id', 'name', 'slug', 'logo', 'logo_variants', 'description', 'is_active', 'product_count']
 
 
 class MaterialSerializer(serializers.ModelSerializer):
@@ -59,10 +86,11 @@ class ProductImageSerializer(serializers.ModelSerializer):
     Serializer para imágenes de productos
     """
     image = serializers.SerializerMethodField()
+    variants = ImageVariantsField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary', 'alt_text', 'order']
+        fields = ['id', 'image', 'variants', 'is_primary', 'alt_text', 'order']
     
     def get_image(self, obj):
         request = self.context.get('request')
@@ -87,10 +115,13 @@ class ProductListSerializer(serializers.ModelSerializer):
     category = CategoryListSerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
     primary_image = serializers.SerializerMethodField()
+    primary_image_variants = serializers.SerializerMethodField()
     final_price = serializers.ReadOnlyField()
     discount_percentage = serializers.ReadOnlyField()
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
+    # Stock disponible: descuenta lo apartado por checkouts en curso
+    stock = serializers.IntegerField(source='available_stock', read_only=True)
     is_in_stock = serializers.ReadOnlyField()
     
     class Meta:
@@ -99,7 +130,7 @@ class ProductListSerializer(serializers.ModelSerializer):
             'id', 'name', 'slug', 'sku',
             'category', 'brand',
             'price', 'discount_price', 'final_price', 'discount_percentage',
-            'primary_image', 'stock', 'is_in_stock',
+            'primary_image', 'primary_image_variants', 'stock', 'is_in_stock',
             'is_featured', 'is_new',
             'average_rating', 'review_count',
             'created_at'
@@ -107,10 +138,24 @@ class ProductListSerializer(serializers.ModelSerializer):
     
     def get_primary_image(self, obj):
         request = self.context.get('request')
+        # Ruta precalculada por Product.objects.for_catalog()
+        if hasattr(obj, 'primary_image_path'):
+            if not obj.primary_image_path:
+                return None
+            url = ProductImage._meta.get_field('image').storage.url(obj.primary_image_path)
+            return request.build_absolute_uri(url) if request else url
         image = obj.images.filter(is_primary=True).first()
         if image and hasattr(image.image, 'url'):
             return request.build_absolute_uri(image.image.url) if request else image.image.url
         return None
+    
+    def get_primary_image_variants(self, obj):
+        # Variantes precalculadas por Product.objects.for_catalog()
+        if hasattr(obj, 'primary_image_variants'):
+            variants = obj.primary_image_variants
+        else:
+            variants = obj.images.filter(is_primary=True).values_list('variants', flat=True).first()
+        return variant_urls(variants, self.context.get('request'))
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -126,12 +171,13 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     discount_percentage = serializers.ReadOnlyField()
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
+    stock = serializers.IntegerField(source='available_stock', read_only=True)
     is_in_stock = serializers.ReadOnlyField()
     is_low_stock = serializers.ReadOnlyField()
     
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['related_computed_at', 'held_stock', 'rating_sum', 'rating_count', 'rating_average']
 
 
 class ProductCreateSerializer(serializers.ModelSerializer):
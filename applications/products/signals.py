@@ -1,58 +1,26 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.utils.text import slugify
-from .models import Product, Category, Brand, ProductImage
+from django.utils import timezone
+from .models import Product, Category, Brand, ProductImage, ProductSpecification, Review
+from .search import get_search_backend
+from .cache import BRANDS, CATALOG_TAGS, CATEGORIES, PRODUCTS, invalidate_on_commit
+from . import images
 
 
-@receiver(pre_save, sender=Product)
-def generate_product_slug(sender, instance, **kwargs):
-    """
-    Genera slug automáticamente si no existe
-    """
-    if not instance.slug:
-        base_slug = slugify(instance.name)
-        slug = base_slug
-        counter = 1
-        
-        while Product.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        
-        instance.slug = slug
-
-
-@receiver(pre_save, sender=Category)
-def generate_category_slug(sender, instance, **kwargs):
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, **kwargs):
     """
-    Genera slug para categoría
+    Mantiene el índice de búsqueda de texto completo sincronizado
     """
-    if not instance.slug:
-        base_slug = slugify(instance.name)
-        slug = base_slug
-        counter = 1
-        
-        while Category.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        
-        instance.slug = slug
+    get_search_backend().index_products([instance])
 
 
-@receiver(pre_save, sender=Brand)
-def generate_brand_slug(sender, instance, **kwargs):
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, **kwargs):
     """
-    Genera slug para marca
+    Quita el producto eliminado del índice de búsqueda
     """
-    if not instance.slug:
-        base_slug = slugify(instance.name)
-        slug = base_slug
-        counter = 1
-        
-        while Brand.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        
-        instance.slug = slug
+    get_search_backend().remove([instance.pk])
 
 
 @receiver(post_save, sender=ProductImage)
@@ -71,4 +39,185 @@ def ensure_one_primary_image(sender, instance, created, **kwargs):
         is_primary=True
     ).exists():
         instance.is_primary = True
-        instance.save(update_fields=['is_primary'])
\ No newline at end of file
+        instance.save(update_fields=['is_primary'])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def touch_product(sender, instance, **kwargs):
+    """
+    Cambia updated_at del producto: versiona su payload en la caché de objetos
+    """
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Product.materials.through)
+def touch_product_materials(sender, instance, action, pk_set, **kwargs):
+    """
+    Igual que touch_product al cambiar los materiales (desde ambos lados)
+    """
+    if isinstance(instance, Product):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        products = Product.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        # Después del clear ya no se sabe qué productos tenía el material
+        products = Product.objects.filter(materials=instance)
+    elif action in ('post_add', 'post_remove'):
+        products = Product.objects.filter(pk__in=pk_set)
+    else:
+        return
+    products.update(updated_at=timezone.now())
+
+
+# Campos de Product que cambian los conteos de categorías y marcas
+GROUPING_FIELDS = ('category_id', 'brand_id', 'is_active')
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_stock(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Guarda el stock almacenado antes de una edición (admin, API) para
+    registrar la diferencia en el libro de inventario. La fila queda
+    bloqueada hasta el final de Product.save(): un checkout no puede
+    cambiar el stock entre esta lectura y el UPDATE. En la misma consulta
+    guarda categoría, marca e is_active (ver invalidate_catalog_cache)
+    """
+    instance._previous_stock = None
+    instance._previous_grouping = None
+    if raw or not instance.pk:
+        return
+    fields = None if update_fields is None else set(update_fields)
+    wants_stock = fields is None or 'stock' in fields
+    wants_grouping = fields is None or bool(fields & {'category', 'brand', *GROUPING_FIELDS})
+    if not (wants_stock or wants_grouping):
+        return
+    rows = Product.objects.filter(pk=instance.pk)
+    if wants_stock:
+        rows = rows.select_for_update()
+    previous = rows.values_list('stock', *GROUPING_FIELDS).first()
+    if previous:
+        if wants_stock:
+            instance._previous_stock = previous[0]
+        instance._previous_grouping = previous[1:]
+
+
+@receiver(post_save, sender=Product)
+def record_stock_adjustment(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Agrega al libro el stock inicial o la diferencia de la edición
+    (ver applications.orders.inventory). Con diferencia cero igual revisa
+    el stock bajo, por si cambió min_stock o is_active
+    """
+    from applications.orders.inventory import detect_low_stock, record_stock_movements
+
+    if raw:
+        return
+    if created:
+        record_stock_movements({instance.pk: instance.stock}, 'initial')
+    elif getattr(instance, '_previous_stock', None) is not None:
+        record_stock_movements({instance.pk: instance.stock - instance._previous_stock}, 'adjustment')
+    elif {'min_stock', 'is_active'} & set(update_fields or ()):
+        detect_low_stock([instance.pk])
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """
+    Guarda el estado previo de la review para calcular el delta de rating
+    """
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'rating', 'is_approved'
+        ).first()
+
+
+def _apply_rating_deltas(deltas):
+    """
+    Aplica {product_id: (delta_rating, delta_count)} a los contadores
+    """
+    for product_id, (rating_delta, count_delta) in deltas.items():
+        if rating_delta or count_delta:
+            Product.objects.filter(pk=product_id).apply_rating_delta(rating_delta, count_delta)
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    """
+    Mantiene rating_sum/rating_count del producto al crear, aprobar o editar
+    """
+    deltas = {}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous and previous[2]:
+        product_id, rating, _ = previous
+        deltas[product_id] = (-rating, -1)
+    if instance.is_approved:
+        rating_delta, count_delta = deltas.get(instance.product_id, (0, 0))
+        deltas[instance.product_id] = (rating_delta + instance.rating, count_delta + 1)
+    _apply_rating_deltas(deltas)
+
+
+@receiver(post_delete, sender=Review)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    """
+    Descuenta la review eliminada de los contadores del producto
+    """
+    if instance.is_approved:
+        _apply_rating_deltas({instance.product_id: (-instance.rating, -1)})
+
+
+# Etiquetas de la caché de respuestas afectadas por cada modelo
+CACHE_TAGS_BY_MODEL = {
+    Product: CATALOG_TAGS,  # altas, bajas y cambios de categoría, marca o is_active
+    Category: (CATEGORIES, PRODUCTS),
+    Brand: (BRANDS, PRODUCTS),
+    ProductImage: (PRODUCTS,),
+    Review: (PRODUCTS,),
+}
+
+
+def _grouping_unchanged(instance, signal, created=False, update_fields=None, **kwargs):
+    """
+    Producto editado sin cambiar categoría, marca ni is_active: los
+    conteos de categorías y marcas siguen igual
+    """
+    if signal is not post_save or created:
+        return False
+    if update_fields is not None and not set(update_fields) & {'category', 'brand', *GROUPING_FIELDS}:
+        return True
+    previous = getattr(instance, '_previous_grouping', None)
+    return previous is not None and previous == tuple(getattr(instance, field) for field in GROUPING_FIELDS)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """
+    Invalida las respuestas cacheadas del catálogo que dependen del modelo.
+    Una edición de producto que no cambia los conteos invalida solo
+    PRODUCTS: los payloads de la caché de objetos (etiquetados con
+    CATEGORIES y BRANDS) siguen versionados por updated_at
+    """
+    if sender is Product and _grouping_unchanged(instance, **kwargs):
+        invalidate_on_commit(PRODUCTS)
+        return
+    invalidate_on_commit(*CACHE_TAGS_BY_MODEL[sender])
+
+
+def _image_variants_generated(instance):
+    """
+    Las variantes se guardan con UPDATE: versiona los payloads cacheados
+    que las incluyen
+    """
+    if isinstance(instance, ProductImage):
+        touch_product(ProductImage, instance)
+    invalidate_on_commit(*CACHE_TAGS_BY_MODEL[type(instance)])
+
+
+images.register(ProductImage, 'image', 'variants', _image_variants_generated)
+images.register(Category, 'image', 'image_variants', _image_variants_generated)
+images.register(Brand, 'logo', 'logo_variants', _image_variants_generated)
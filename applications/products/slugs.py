@@ -0,0 +1,110 @@
+"""
+Asignación de slugs únicos para productos, categorías y marcas.
+
+Los slugs repetidos llevan un sufijo numérico ('silla', 'silla-1',
+'silla-2', ...). El siguiente slug libre se obtiene con una sola consulta
+por prefijo (slug = base o slug LIKE 'base-%'): la base sola si está libre
+(aunque exista 'mesa-2' de un producto "Mesa 2"), si no el mayor sufijo en
+uso + 1; los huecos que dejan los borrados no se rellenan.
+
+- save_with_slug: guardado de una instancia; si otra transacción tomó el
+  mismo slug entre la consulta y el INSERT, reintenta con el siguiente.
+- SlugAllocator: asignación en lote para importaciones, con una consulta
+  por grupo de bases y los sufijos reservados en memoria.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+# Espacio reservado para el sufijo ('-1234567') dentro de max_length
+SUFFIX_ROOM = 8
+MAX_ATTEMPTS = 5
+PRELOAD_CHUNK = 200
+
+
+def suffixes_in_use(base, slugs):
+    """(base en uso, mayor sufijo numérico en uso o 0) para base entre slugs"""
+    taken = False
+    highest = 0
+    prefix = f'{base}-'
+    for slug in slugs:
+        if slug == base:
+            taken = True
+        elif slug.startswith(prefix) and slug[len(prefix):].isdigit():
+            highest = max(highest, int(slug[len(prefix):]))
+    return taken, highest
+
+
+class SlugAllocator:
+    """
+    Slugs únicos para objetos de un modelo con campo slug. Recuerda el
+    siguiente sufijo de cada base, así que reservar muchos slugs con la
+    misma base cuesta una sola consulta
+    """
+    def __init__(self, model):
+        self.model = model
+        self.max_length = model._meta.get_field('slug').max_length
+        self._next = {}
+        self._highest = {}
+        self._allocated = set()
+
+    def base(self, text):
+        base = slugify(text or '')[:self.max_length - SUFFIX_ROOM].strip('-')
+        return base or self.model._meta.model_name
+
+    def preload(self, texts):
+        """Carga los sufijos en uso de las bases de texts que aún no conoce"""
+        bases = sorted({self.base(text) for text in texts} - self._next.keys())
+        for start in range(0, len(bases), PRELOAD_CHUNK):
+            chunk = bases[start:start + PRELOAD_CHUNK]
+            condition = reduce(or_, [Q(slug__startswith=f'{base}-') for base in chunk], Q(slug__in=chunk))
+            slugs = list(self.model._default_manager.filter(condition).values_list('slug', flat=True))
+            for base in chunk:
+                taken, highest = suffixes_in_use(base, slugs)
+                self._next[base] = highest + 1 if taken else 0
+                self._highest[base] = highest
+
+    def allocate(self, text):
+        """Reserva y devuelve el siguiente slug libre para text"""
+        base = self.base(text)
+        if base not in self._next:
+            self.preload([text])
+        while True:
+            suffix = self._next[base]
+            # Tras la base sola sigue el mayor sufijo ya usado + 1
+            self._next[base] = max(suffix, self._highest[base]) + 1
+            slug = f'{base}-{suffix}' if suffix else base
+            # Otra base puede haber reservado el mismo slug ('Mesa 2' -> 'mesa-2')
+            if slug not in self._allocated:
+                self._allocated.add(slug)
+                return slug
+
+
+def allocate_slug(model, text):
+    """Slug libre para text en model (una consulta)"""
+    return SlugAllocator(model).allocate(text)
+
+
+def save_with_slug(instance, save, *args, **kwargs):
+    """
+    Llama a save(*args, **kwargs) asignando antes un slug a partir de
+    instance.name si no tiene uno. Si el INSERT choca con un slug tomado
+    por una transacción concurrente, reintenta con un slug nuevo
+    """
+    if instance.slug:
+        return save(*args, **kwargs)
+
+    model = type(instance)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        instance.slug = allocate_slug(model, instance.name)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            taken = model._default_manager.filter(slug=instance.slug).exclude(pk=instance.pk).exists()
+            if not taken or attempt == MAX_ATTEMPTS:
+                instance.slug = ''
+                raise
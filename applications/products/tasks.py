@@ -0,0 +1,9 @@
+from celery import shared_task
+
+@shared_task
+def generate_image_variants_task(label, pk):
+    """
+    Genera las variantes responsive de una imagen (IMAGE_VARIANTS_BACKEND = 'celery')
+    """
+    from .images import generate_variants
+    generate_variants(label, pk)
@@ -0,0 +1,573 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from applications.cart.models import Wishlist
+from applications.orders.inventory import record_stock_movements, stock_drift
+from applications.products.counters import ViewCountBuffer
+from applications.products.importer import ProductImporter
+from applications.products.models import Brand, Category, Material, Product, ProductImage, Review
+from applications.products.related import compute_related_products, stale_products
+from applications.products.search import get_search_backend
+from applications.products.slugs import SlugAllocator, allocate_slug
+
+
+class ProductRatingCountersTest(TestCase):
+    """
+    Los contadores de rating se mantienen de forma incremental
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Comedor')
+        self.product = Product.objects.create(
+            name='Mesa', sku='MESA-1', description='Mesa de roble',
+            category=self.category, price=300, stock=5,
+        )
+        self.other = Product.objects.create(
+            name='Silla', sku='SILLA-1', description='Silla de roble',
+            category=self.category, price=80, stock=5,
+        )
+        self.ana = User.objects.create_user(username='ana', password='pass1234')
+        self.luis = User.objects.create_user(username='luis', password='pass1234')
+
+    def review(self, user, rating, **kwargs):
+        return Review.objects.create(
+            product=kwargs.pop('product', self.product), user=user, rating=rating,
+            title='Opinión', comment='Comentario', **kwargs
+        )
+
+    def assertCounters(self, product, rating_sum, rating_count, average):
+        product.refresh_from_db()
+        self.assertEqual(product.rating_sum, rating_sum)
+        self.assertEqual(product.rating_count, rating_count)
+        self.assertEqual(product.average_rating, average)
+
+    def test_create_and_delete(self):
+        review = self.review(self.ana, 5)
+        self.review(self.luis, 2)
+        self.assertCounters(self.product, 7, 2, 3.5)
+        review.delete()
+        self.assertCounters(self.product, 2, 1, 2)
+
+    def test_approval_and_edit(self):
+        review = self.review(self.ana, 4, is_approved=False)
+        self.assertCounters(self.product, 0, 0, 0)
+        review.is_approved = True
+        review.save()
+        self.assertCounters(self.product, 4, 1, 4)
+        review.rating = 1
+        review.save()
+        self.assertCounters(self.product, 1, 1, 1)
+        review.product = self.other
+        review.save()
+        self.assertCounters(self.product, 0, 0, 0)
+        self.assertCounters(self.other, 1, 1, 1)
+
+    def test_rebuild_command(self):
+        self.review(self.ana, 5)
+        self.review(self.luis, 3)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_average=0)
+        call_command('rebuild_product_ratings', batch_size=1, stdout=StringIO())
+        self.assertCounters(self.product, 8, 2, 4)
+        self.assertCounters(self.other, 0, 0, 0)
+
+
+class ViewCountBufferTest(TestCase):
+    """
+    Las vistas se acumulan por proceso y se escriben en lote
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Dormitorio')
+        self.cama = Product.objects.create(
+            name='Cama', sku='CAMA-1', description='Cama', category=category, price=500
+        )
+        self.velador = Product.objects.create(
+            name='Velador', sku='VEL-1', description='Velador', category=category, price=90
+        )
+        self.buffer = ViewCountBuffer(background=False)
+
+    def views(self, product):
+        product.refresh_from_db()
+        return product.views_count
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=3600)
+    def test_buffered_until_flush(self):
+        for _ in range(3):
+            self.buffer.add(self.cama.pk)
+        self.buffer.add(self.velador.pk)
+        self.assertEqual(self.views(self.cama), 0)
+        self.assertEqual(self.buffer.pending(self.cama.pk), 3)
+
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(self.views(self.cama), 3)
+        self.assertEqual(self.views(self.velador), 1)
+        self.assertEqual(self.buffer.pending(), 0)
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=3600, PRODUCT_VIEWS_MAX_PENDING=2)
+    def test_full_buffer_is_not_written_in_the_request(self):
+        self.buffer.add(self.cama.pk)
+        self.buffer.add(self.velador.pk)
+        self.assertEqual(self.views(self.cama), 0)
+        self.assertEqual(self.buffer.pending(), 2)
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=0)
+    def test_write_through_without_interval(self):
+        self.buffer.add(self.cama.pk)
+        self.assertEqual(self.views(self.cama), 1)
+
+
+class ViewCountFlushThreadTest(TransactionTestCase):
+    """
+    El hilo del proceso escribe las vistas fuera de las peticiones
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Dormitorio')
+        self.cama = Product.objects.create(
+            name='Cama', sku='CAMA-1', description='Cama', category=category, price=500
+        )
+        self.buffer = ViewCountBuffer()
+        self.addCleanup(self.buffer.stop)
+
+    def wait_for_views(self, expected):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            self.cama.refresh_from_db()
+            if self.cama.views_count == expected:
+                return
+            time.sleep(0.05)
+        self.fail(f"views_count = {self.cama.views_count}, se esperaba {expected}")
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=1)
+    def test_idle_worker_flushes_on_interval(self):
+        self.buffer.add(self.cama.pk)
+        self.buffer.add(self.cama.pk)
+        self.wait_for_views(2)
+        self.assertEqual(self.buffer.pending(), 0)
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=3600, PRODUCT_VIEWS_MAX_PENDING=1)
+    def test_full_buffer_wakes_the_thread(self):
+        self.buffer.add(self.cama.pk)
+        self.wait_for_views(1)
+
+
+class CategoryTreeTest(TestCase):
+    """
+    Camino materializado de categorías mantenido en save()
+    """
+    def setUp(self):
+        self.hogar = Category.objects.create(name='Hogar')
+        self.sala = Category.objects.create(name='Sala', parent=self.hogar)
+        self.sofas = Category.objects.create(name='Sofás', parent=self.sala)
+        self.jardin = Category.objects.create(name='Jardín')
+
+    def test_paths_and_ancestors(self):
+        self.assertEqual(self.sofas.path, f'{self.hogar.pk}/{self.sala.pk}/{self.sofas.pk}/')
+        self.assertEqual(self.sofas.depth, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.sofas.get_ancestors()), [self.hogar, self.sala])
+        self.assertEqual(set(self.hogar.get_descendants()), {self.sala, self.sofas})
+
+    def test_move_rewrites_subtree(self):
+        self.sala.parent = self.jardin
+        self.sala.save()
+        self.sofas.refresh_from_db()
+        self.assertEqual(self.sofas.path, f'{self.jardin.pk}/{self.sala.pk}/{self.sofas.pk}/')
+        self.assertEqual(set(self.jardin.get_descendants()), {self.sala, self.sofas})
+        self.assertFalse(self.hogar.get_descendants().exists())
+
+        self.sala.parent = None
+        self.sala.save()
+        self.sofas.refresh_from_db()
+        self.assertEqual(self.sofas.depth, 1)
+
+    def test_subtree_is_a_path_prefix(self):
+        # '91/95/912/' queda fuera del rango ['91/95/', '91/950') en
+        # collations que ignoran las '/' ("9195912" > "91950")
+        raiz = Category.objects.create(pk=91, name='Raíz')
+        hijo = Category.objects.create(pk=95, name='Hijo', parent=raiz)
+        nieto = Category.objects.create(pk=912, name='Nieto', parent=hijo)
+        vecino = Category.objects.create(pk=950, name='Vecino', parent=raiz)
+        Product.objects.create(name='Lámpara', sku='LAMP-1', description='-', category=nieto, price=10)
+        Product.objects.create(name='Espejo', sku='ESPE-1', description='-', category=vecino, price=10)
+
+        self.assertEqual(set(Category.objects.subtree(hijo)), {hijo, nieto})
+        self.assertEqual(
+            list(Product.objects.in_category_tree(hijo).values_list('sku', flat=True)), ['LAMP-1']
+        )
+
+        hijo.parent = self.jardin
+        hijo.save()
+        nieto.refresh_from_db()
+        vecino.refresh_from_db()
+        self.assertEqual(nieto.path, f'{self.jardin.pk}/95/912/')
+        self.assertEqual(vecino.path, '91/950/')
+
+    def test_cannot_move_into_own_subtree(self):
+        self.hogar.parent = self.sofas
+        with self.assertRaises(ValidationError):
+            self.hogar.clean()
+
+    def test_tree_rolls_up_product_counts(self):
+        Product.objects.create(name='Sofá', sku='SOFA-1', description='-', category=self.sofas, price=10)
+        Product.objects.create(name='Mesa ratona', sku='MESA-1', description='-', category=self.sala, price=10)
+        Product.objects.create(name='Baja', sku='BAJA-1', description='-', category=self.sala, price=10, is_active=False)
+        with self.assertNumQueries(1):
+            roots = Category.objects.tree()
+        self.assertEqual([root.name for root in roots], ['Hogar', 'Jardín'])
+        sala = roots[0].tree_children[0]
+        self.assertEqual((sala.product_count, sala.total_product_count), (1, 2))
+        self.assertEqual(roots[0].total_product_count, 2)
+        self.assertEqual(Product.objects.in_category_tree(self.hogar).filter(is_active=True).count(), 2)
+
+
+class RelatedProductsTest(TestCase):
+    """
+    Relacionados precalculados e incrementales
+    """
+    def setUp(self):
+        self.living = Category.objects.create(name='Living')
+        self.sofas = Category.objects.create(name='Sofás', parent=self.living)
+        self.mesas = Category.objects.create(name='Mesas', parent=self.living)
+        self.jardin = Category.objects.create(name='Jardín')
+        self.nordic = Brand.objects.create(name='Nordic')
+
+        def create(name, category, price, brand=None):
+            return Product.objects.create(
+                name=name, sku=name.upper(), description='-', category=category, brand=brand, price=price
+            )
+        self.sofa = create('Sofá', self.sofas, 500, self.nordic)
+        self.sofa_cama = create('Sofá cama', self.sofas, 550, self.nordic)
+        self.mesa = create('Mesa', self.mesas, 200)
+        self.reposera = create('Reposera', self.jardin, 90)
+
+    def related_ids(self, product):
+        return list(product.related_links.values_list('related_id', flat=True))
+
+    def test_scored_by_subtree_brand_and_price(self):
+        self.assertEqual(compute_related_products(), 4)
+        self.assertEqual(self.related_ids(self.sofa), [self.sofa_cama.pk, self.mesa.pk])
+        # Sin otros productos en su subárbol ni co-ocurrencias
+        self.assertEqual(self.related_ids(self.reposera), [])
+
+    def test_co_occurrence_in_wishlists(self):
+        user = User.objects.create_user(username='ana', password='pass1234')
+        Wishlist.objects.create(user=user, product=self.sofa)
+        Wishlist.objects.create(user=user, product=self.reposera)
+        compute_related_products()
+        self.assertIn(self.reposera.pk, self.related_ids(self.sofa))
+
+    def test_incremental(self):
+        compute_related_products()
+        self.assertEqual(compute_related_products(), 0)
+
+        self.reposera.name = 'Reposera plegable'
+        self.reposera.save()
+        self.assertEqual(list(stale_products()), [self.reposera])
+
+        # Un producto nuevo desactualiza a los de su categoría
+        compute_related_products()
+        Product.objects.create(name='Sillón', sku='SILLON', description='-', category=self.sofas, price=300)
+        self.assertEqual(
+            set(stale_products().values_list('name', flat=True)), {'Sofá', 'Sofá cama', 'Sillón'}
+        )
+
+        # Cambiar un relacionado desactualiza las listas que lo incluyen
+        compute_related_products()
+        self.mesa.price = 250
+        self.mesa.save()
+        self.assertEqual(
+            set(stale_products().values_list('name', flat=True)), {'Mesa', 'Sofá', 'Sofá cama', 'Sillón'}
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compute_related_products', '--full', stdout=out)
+        self.assertIn('4 products', out.getvalue())
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(name='foto.png', size=(1200, 800), mode='RGBA'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 120, 40, 255) if mode == 'RGBA' else 'orange').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANTS_BACKEND='sync',
+    IMAGE_VARIANT_WIDTHS=[320, 640, 1024, 2048], PRODUCT_VIEWS_FLUSH_INTERVAL=0,
+)
+class ImageVariantsTest(TestCase):
+    """
+    Derivados responsive generados al confirmar la transacción
+    """
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Living')
+        self.product = Product.objects.create(
+            name='Sofá', sku='SOFA-1', description='Sofá de lino',
+            category=self.category, price=900, stock=3,
+        )
+
+    def test_product_image_variants_use_content_hashed_names(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=make_image(), is_primary=True)
+        image.refresh_from_db()
+
+        variants = image.variants
+        self.assertEqual(variants['source'], image.image.name)
+        self.assertEqual((variants['width'], variants['height']), (1200, 800))
+        # Solo anchos menores al original
+        self.assertEqual(list(variants['webp']), ['320', '640', '1024'])
+        self.assertEqual(list(variants['jpeg']), ['320', '640', '1024'])
+        storage = image.image.storage
+        for fmt, extension in (('webp', '.webp'), ('jpeg', '.jpg')):
+            name = variants[fmt]['640']
+            self.assertTrue(name.startswith('variants/products/'))
+            self.assertTrue(name.endswith(extension))
+            self.assertTrue(storage.exists(name))
+            with storage.open(name) as handle:
+                self.assertEqual(Image.open(handle).size, (640, 427))
+
+        # El hash depende solo del contenido de cada variante
+        with self.captureOnCommitCallbacks(execute=True):
+            other = ProductImage.objects.create(product=self.product, image=make_image())
+        other.refresh_from_db()
+        self.assertNotEqual(other.variants['webp']['640'], variants['webp']['640'])
+        self.assertEqual(
+            other.variants['webp']['640'].split('.')[-2], variants['webp']['640'].split('.')[-2]
+        )
+
+    def test_catalog_payloads_include_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image=make_image(), is_primary=True)
+
+        response = self.client.get(reverse('product-list'))
+        item = response.data['results'][0]
+        self.assertIn('320w', item['primary_image_variants']['srcset']['webp'])
+        self.assertTrue(item['primary_image_variants']['jpeg']['1024'].startswith('http://testserver/media/variants/'))
+
+        response = self.client.get(reverse('product-detail', args=[self.product.slug]))
+        self.assertEqual(
+            response.data['images'][0]['variants']['srcset'],
+            item['primary_image_variants']['srcset'],
+        )
+
+    def test_category_brand_and_avatar_variants(self):
+        user = User.objects.create_user(username='eva', password='pass1234')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.image = make_image('living.png', size=(500, 300), mode='RGB')
+            self.category.save()
+            brand = Brand.objects.create(name='Nórdica', logo=make_image('logo.png', size=(200, 100)))
+            user.profile.avatar = make_image('eva.png', size=(400, 400))
+            user.profile.save()
+
+        self.category.refresh_from_db()
+        brand.refresh_from_db()
+        user.profile.refresh_from_db()
+        self.assertEqual(list(self.category.image_variants['webp']), ['320'])
+        # Más chica que todos los anchos: una variante del tamaño original
+        self.assertEqual(list(brand.logo_variants['jpeg']), ['200'])
+        self.assertEqual(list(user.profile.avatar_variants['webp']), ['320'])
+
+        self.category.image = None
+        self.category.save()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_variants, {})
+
+    def test_invalid_image_leaves_no_variants(self):
+        with self.assertLogs('applications.products.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product,
+                image=SimpleUploadedFile('roto.png', b'no es una imagen', content_type='image/png'),
+            )
+        image.refresh_from_db()
+        self.assertEqual(image.variants, {})
+
+    def test_backfill_command(self):
+        image = ProductImage.objects.create(product=self.product, image=make_image())
+        self.assertEqual(image.variants, {})
+
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants for 1 images', out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(list(image.variants['webp']), ['320', '640', '1024'])
+
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants for 0 images', out.getvalue())
+
+
+class ImportProductsTest(TestCase):
+    """
+    Importación masiva con upsert por SKU
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Dormitorio')
+        self.brand = Brand.objects.create(name='Nórdica')
+        Material.objects.create(name='Roble')
+        Material.objects.create(name='Lino')
+        self.existing = Product.objects.create(
+            name='Cama', sku='CAMA-1', description='Cama de roble',
+            category=self.category, price=500, stock=2, color='Natural',
+        )
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_products', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_creates_updates_and_reports_errors(self):
+        path = self.write('productos.csv', (
+            'sku,name,description,category,brand,materials,price,discount_price,stock,is_featured\n'
+            'CAMA-1,Cama King,Cama de roble macizo,dormitorio,,,550,,4,true\n'
+            'VELADOR-1,Cama,Velador,Dormitorio,nordica,Roble|Lino,120,99.90,10,false\n'
+            'ROTA-1,Rota,Sin precio,dormitorio,,,,,1,false\n'
+            'ROTA-2,Rota,Categoría inexistente,jardin,,,10,,1,false\n'
+            'VELADOR-1,Repetido,Otro,dormitorio,,,10,,1,false\n'
+        ))
+        out, err = self.run_import(path, '--batch-size', '2')
+
+        self.assertIn('Imported 2 products (1 new, 1 updated), 3 errors', out)
+        self.assertIn('Line 4 [ROTA-1]: price:', err)
+        self.assertIn("Line 5 [ROTA-2]: category: no existe 'jardin'", err)
+        self.assertIn('Line 6 [VELADOR-1]: sku: repetido (línea 3)', err)
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Cama King', 550, 4))
+        self.assertTrue(self.existing.is_featured)
+        self.assertEqual(self.existing.color, 'Natural')  # columna ausente: sin cambios
+        self.assertEqual(self.existing.slug, 'cama')
+        self.assertEqual(
+            list(self.existing.stock_movements.order_by('pk').values_list('reason', 'delta')),
+            [('initial', 2), ('import', 2)],
+        )
+
+        velador = Product.objects.get(sku='VELADOR-1')
+        self.assertEqual(velador.slug, 'cama-1')
+        self.assertEqual(velador.brand, self.brand)
+        self.assertEqual(sorted(velador.materials.values_list('name', flat=True)), ['Lino', 'Roble'])
+        self.assertEqual(list(get_search_backend().search(Product.objects.all(), 'velador')), [velador])
+
+    def test_jsonl_and_dry_run(self):
+        path = self.write('productos.jsonl', (
+            '{"sku": "CAMA-1", "materials": ["Lino"], "brand": null}\n'
+            '{"sku": "SILLA-9", "name": "Silla", "description": "Silla", "category": "dormitorio", "price": "40"}\n'
+            'no es json\n'
+        ))
+        out, err = self.run_import(path, '--dry-run')
+        self.assertIn('Validated 2 products (1 new, 1 updated), 1 errors', out)
+        self.assertIn('Line 3 [-]: JSON inválido', err)
+        self.assertFalse(Product.objects.filter(sku='SILLA-9').exists())
+
+        self.run_import(path)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Cama')
+        self.assertEqual(list(self.existing.materials.values_list('name', flat=True)), ['Lino'])
+        self.assertTrue(Product.objects.filter(sku='SILLA-9', slug='silla').exists())
+
+
+    def test_stock_reread_in_save_transaction(self):
+        otra = Product.objects.create(
+            name='Mesa', sku='MESA-1', description='-', category=self.category, price=90, stock=5,
+        )
+        path = self.write('productos.jsonl', (
+            '{"sku": "CAMA-1", "stock": 10}\n'
+            '{"sku": "MESA-1", "price": "95"}\n'
+        ))
+        save = ProductImporter.save
+
+        def sale_before_save(importer, products, materials):
+            # Un checkout confirma entre la validación del lote y su escritura
+            Product.objects.reserve_stock({self.existing.pk: 1, otra.pk: 2})
+            record_stock_movements({self.existing.pk: -1, otra.pk: -2}, 'sale')
+            return save(importer, products, materials)
+
+        with mock.patch.object(ProductImporter, 'save', sale_before_save):
+            self.run_import(path)
+
+        self.assertEqual(dict(Product.objects.values_list('sku', 'stock')), {'CAMA-1': 10, 'MESA-1': 3})
+        self.assertFalse(stock_drift().exists())
+
+
+class SlugAllocationTest(TestCase):
+    """
+    Slugs únicos con una consulta por base y reintento ante conflictos
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Oficina')
+
+    def create_product(self, name, sku):
+        return Product.objects.create(
+            name=name, sku=sku, description=name, category=self.category, price=10,
+        )
+
+    def test_suffixes_follow_highest_in_use(self):
+        slugs = [self.create_product('Silla', f'SILLA-{n}').slug for n in range(3)]
+        self.assertEqual(slugs, ['silla', 'silla-1', 'silla-2'])
+        self.create_product('Silla de oficina', 'SILLA-OF')
+
+        # Los huecos no se rellenan: siempre el mayor sufijo en uso + 1
+        Product.objects.filter(slug='silla-1').delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug(Product, 'Silla'), 'silla-3')
+        self.assertEqual(self.create_product('Silla', 'SILLA-9').slug, 'silla-3')
+
+    def test_free_base_is_used_before_suffixes(self):
+        # 'mesa-2' y 'silla-2024' vienen de nombres con número, no de repetidos
+        self.create_product('Mesa 2', 'MESA-2')
+        self.create_product('Silla 2024', 'SILLA-2024')
+        self.assertEqual(self.create_product('Mesa', 'MESA-1').slug, 'mesa')
+        self.assertEqual(self.create_product('Silla', 'SILLA-1').slug, 'silla')
+
+        allocator = SlugAllocator(Product)
+        slugs = [allocator.allocate(name) for name in ['Mesa', 'Lámpara', 'Lámpara', 'Lámpara', 'Lámpara 2']]
+        self.assertEqual(slugs, ['mesa-3', 'lampara', 'lampara-1', 'lampara-2', 'lampara-2-1'])
+
+    def test_batch_allocation_uses_one_query(self):
+        self.create_product('Mesa', 'MESA-1')
+        allocator = SlugAllocator(Product)
+        with self.assertNumQueries(1):
+            allocator.preload(['Mesa', 'Lámpara', 'Mesa', '¡!'])
+            slugs = [allocator.allocate(name) for name in ['Mesa', 'Lámpara', 'Mesa', '¡!']]
+        self.assertEqual(slugs[:3], ['mesa-1', 'lampara', 'mesa-2'])
+        self.assertEqual(slugs[3], 'product')
+
+    def test_retries_when_slug_taken_concurrently(self):
+        Brand.objects.create(name='Nórdica Chile', slug='nordica')
+        # La primera asignación se calculó antes del INSERT de otra transacción
+        with mock.patch(
+            'applications.products.slugs.allocate_slug', side_effect=['nordica', 'nordica-1']
+        ) as allocate:
+            brand = Brand.objects.create(name='Nórdica')
+        self.assertEqual(allocate.call_count, 2)
+        self.assertEqual(brand.slug, 'nordica-1')
+
+        # Un conflicto que no es del slug no se reintenta
+        with self.assertRaises(IntegrityError):
+            Brand.objects.create(name='Nórdica')
+        self.assertEqual(Brand.objects.count(), 2)
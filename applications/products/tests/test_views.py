@@ -0,0 +1,514 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from applications.products.cache import BRANDS, CATEGORIES, get_generations
+from applications.products.models import Brand, Category, Material, Product, ProductImage, Review
+from applications.products.object_cache import OBJECT_CACHES, LRUCache, product_detail_cache, product_list_cache
+
+
+class CatalogQueryCountTest(APITestCase):
+    """
+    Regresión de consultas: los listados del catálogo deben costar un número
+    fijo de consultas sin importar cuántos productos se serialicen
+    """
+    def setUp(self):
+        self.parent = Category.objects.create(name='Sala')
+        self.category = Category.objects.create(name='Sofás', parent=self.parent)
+        self.brand = Brand.objects.create(name='Nordic Home')
+        self.users = [
+            User.objects.create_user(username=f'cliente{i}', password='pass1234')
+            for i in range(3)
+        ]
+
+    def create_products(self, count):
+        products = []
+        for i in range(Product.objects.count(), Product.objects.count() + count):
+            product = Product.objects.create(
+                name=f'Sofá {i}',
+                sku=f'SKU-{i}',
+                description='Sofá de tres cuerpos',
+                category=self.category,
+                brand=self.brand,
+                price=100 + i,
+                stock=10,
+                is_featured=True,
+            )
+            ProductImage.objects.create(product=product, image=f'products/sofa_{i}.png', is_primary=True)
+            for user in self.users:
+                Review.objects.create(
+                    product=product, user=user, rating=4, title='Bueno', comment='Cómodo'
+                )
+            products.append(product)
+        return products
+
+    def assertConstantQueries(self, num, url):
+        """Mismo número de consultas con pocos y con muchos productos"""
+        self.create_products(2)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.create_products(5)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_list(self):
+        response = self.assertConstantQueries(4, reverse('product-list'))
+        item = response.data['results'][0]
+        self.assertEqual(item['average_rating'], 4)
+        self.assertEqual(item['review_count'], 3)
+        self.assertTrue(item['primary_image'].endswith('.png'))
+        self.assertEqual(item['category']['product_count'], 7)
+        self.assertEqual(item['brand']['product_count'], 7)
+
+    def test_featured(self):
+        self.assertConstantQueries(3, reverse('product-featured'))
+
+    def test_new(self):
+        self.assertConstantQueries(3, reverse('product-new'))
+
+    def test_best_sellers(self):
+        self.assertConstantQueries(3, reverse('product-best-sellers'))
+
+    def test_related(self):
+        product = self.create_products(1)[0]
+        self.assertConstantQueries(6, reverse('product-related', args=[product.slug]))
+
+    @override_settings(PRODUCT_VIEWS_FLUSH_INTERVAL=0)
+    def test_product_detail(self):
+        product = self.create_products(1)[0]
+        response = self.assertConstantQueries(11, reverse('product-detail', args=[product.slug]))
+        self.assertEqual(response.data['review_count'], 3)
+        self.assertEqual(response.data['category']['parent']['product_count'], 0)
+        self.assertFalse({'rating_sum', 'rating_count', 'rating_average'} & set(response.data))
+
+    def test_category_list(self):
+        self.assertConstantQueries(2, reverse('category-list'))
+
+    def test_category_detail(self):
+        self.assertConstantQueries(3, reverse('category-detail', args=[self.category.slug]))
+
+    def test_category_products(self):
+        self.assertConstantQueries(4, reverse('category-products', args=[self.category.slug]))
+
+    def test_brand_list(self):
+        self.assertConstantQueries(2, reverse('brand-list'))
+
+
+class ProductRatingFilterTest(APITestCase):
+    """
+    Filtro y orden por rating sobre la columna desnormalizada
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Comedor')
+        self.mesa = Product.objects.create(
+            name='Mesa', sku='MESA-1', description='Mesa', category=category, price=300, stock=5
+        )
+        self.silla = Product.objects.create(
+            name='Silla', sku='SILLA-1', description='Silla', category=category, price=80, stock=5
+        )
+        user = User.objects.create_user(username='ana', password='pass1234')
+        Review.objects.create(product=self.mesa, user=user, rating=2, title='Meh', comment='Regular')
+        Review.objects.create(product=self.silla, user=user, rating=5, title='Top', comment='Excelente')
+
+    def test_min_rating(self):
+        response = self.client.get(reverse('product-list'), {'min_rating': 4})
+        self.assertEqual([p['sku'] for p in response.data['results']], ['SILLA-1'])
+
+    def test_ordering_by_rating(self):
+        response = self.client.get(reverse('product-list'), {'ordering': 'rating'})
+        self.assertEqual([p['sku'] for p in response.data['results']], ['MESA-1', 'SILLA-1'])
+        response = self.client.get(reverse('product-list'), {'ordering': '-rating'})
+        self.assertEqual([p['sku'] for p in response.data['results']], ['SILLA-1', 'MESA-1'])
+
+
+class ProductSearchTest(APITestCase):
+    """
+    Búsqueda de texto completo: sin tildes, con plurales y por relevancia
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Living')
+        self.sofa = Product.objects.create(
+            name='Sofá Chester', sku='SOF-001', description='Tapizado en cuero',
+            category=category, price=900, stock=3,
+        )
+        self.estanteria = Product.objects.create(
+            name='Estantería Nórdica', sku='EST-002', description='Ideal junto al sofá',
+            category=category, price=250, stock=8,
+        )
+        Product.objects.create(
+            name='Lámpara de pie', sku='LAM-003', description='Luz cálida',
+            category=category, price=120, stock=4,
+        )
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('product-list'), {'search': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [p['sku'] for p in response.data['results']]
+
+    def test_accent_and_plural_insensitive(self):
+        self.assertEqual(self.search('estanterias'), ['EST-002'])
+        self.assertEqual(self.search('LAMPARA'), ['LAM-003'])
+
+    def test_ranked_by_relevance(self):
+        # Coincidencia en el nombre pesa más que en la descripción
+        self.assertEqual(self.search('sofa'), ['SOF-001', 'EST-002'])
+        self.assertEqual(self.search('sofa', ordering='price'), ['EST-002', 'SOF-001'])
+
+    def test_sku_and_prefix(self):
+        self.assertEqual(self.search('EST-002'), ['EST-002'])
+        self.assertEqual(self.search('nord'), ['EST-002'])
+
+    def test_ranks_within_filters(self):
+        with self.settings(PRODUCT_SEARCH_MAX_RESULTS=1):
+            # El sofá rankea primero pero el filtro lo excluye: se rankea
+            # dentro del resultado filtrado, no sobre todo el catálogo
+            self.assertEqual(self.search('sofa', max_price=300), ['EST-002'])
+            response = self.client.get(reverse('product-list'), {'search': 'sofa', 'max_price': 300})
+            self.assertFalse(response.has_header('X-Search-Truncated'))
+
+            response = self.client.get(reverse('product-list'), {'search': 'sofa'})
+            self.assertEqual([p['sku'] for p in response.data['results']], ['SOF-001'])
+            self.assertEqual(response['X-Search-Truncated'], 'true')
+
+    def test_index_follows_save_and_delete(self):
+        self.sofa.name = 'Sillón Chester'
+        self.sofa.save()
+        self.assertEqual(self.search('sillones'), ['SOF-001'])
+        self.estanteria.delete()
+        self.assertEqual(self.search('nordica'), [])
+
+
+class ProductFacetsTest(APITestCase):
+    """
+    Facetas calculadas con un número fijo de consultas agrupadas
+    """
+    def setUp(self):
+        cache.clear()
+        self.sofas = Category.objects.create(name='Sofás')
+        self.mesas = Category.objects.create(name='Mesas')
+        nordic = Brand.objects.create(name='Nordic Home')
+        wood = Material.objects.create(name='Madera')
+        metal = Material.objects.create(name='Metal')
+        rows = [
+            ('Sofá Oslo', self.sofas, nordic, 450, None, 2, 'Gris', [wood]),
+            ('Sofá Bergen', self.sofas, None, 1200, 950, 0, 'Azul', [wood, metal]),
+            ('Mesa Roble', self.mesas, nordic, 300, None, 5, 'Gris', [wood]),
+        ]
+        for i, (name, category, brand, price, discount, stock, color, materials) in enumerate(rows):
+            product = Product.objects.create(
+                name=name, sku=f'FAC-{i}', description=name, category=category, brand=brand,
+                price=price, discount_price=discount, stock=stock, color=color,
+            )
+            product.materials.set(materials)
+
+    @override_settings(PRODUCT_FACETS_CACHE_TTL=0)
+    def test_counts_for_filtered_result(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('product-facets'), {'materials': 'Madera'})
+        data = response.data
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['categories'][0], {'slug': self.sofas.slug, 'name': 'Sofás', 'count': 2})
+        self.assertEqual(data['brands'], [{'slug': 'nordic-home', 'name': 'Nordic Home', 'count': 2}])
+        self.assertEqual(data['materials'], [{'name': 'Madera', 'count': 3}, {'name': 'Metal', 'count': 1}])
+        self.assertEqual(data['colors'][0], {'value': 'Gris', 'count': 2})
+        counts = {r['min']: r['count'] for r in data['price_ranges']}
+        self.assertEqual(counts, {0: 0, 100: 0, 250: 2, 500: 1, 1000: 0})
+        self.assertEqual(data['availability'], {'in_stock': 2, 'out_of_stock': 1})
+
+        response = self.client.get(reverse('product-facets'), {'category': self.mesas.slug})
+        self.assertEqual(response.data['total'], 1)
+
+    @override_settings(PRODUCT_FACETS_CACHE_TTL=60)
+    def test_cached_by_normalized_filters(self):
+        self.client.get(reverse('product-facets'), {'color': 'Gris', 'in_stock': 'true'})
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('product-facets'), {'in_stock': 'true', 'color': 'Gris', 'page': 2}
+            )
+        self.assertEqual(response.data['total'], 2)
+
+
+class ProductCursorPaginationTest(APITestCase):
+    """
+    Paginación keyset: recorrido estable con empates y conteo opcional
+    """
+    def setUp(self):
+        category = Category.objects.create(name='Living')
+        # Precios repetidos para forzar el desempate por id
+        self.products = [
+            Product.objects.create(
+                name=f'Producto {index}', sku=f'PROD-{index}', description='Producto',
+                category=category, price=100 + (index // 3) * 50, stock=5,
+            )
+            for index in range(7)
+        ]
+
+    def walk(self, params):
+        """Recorre todas las páginas siguiendo los enlaces next"""
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, 200)
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        return pages
+
+    def test_walk_with_ties(self):
+        pages = self.walk({'ordering': 'price', 'page_size': 2})
+        self.assertEqual(len(pages), 4)
+        ids = [item['id'] for page in pages for item in page['results']]
+        expected = sorted(self.products, key=lambda p: (p.price, p.pk))
+        self.assertEqual(ids, [p.pk for p in expected])
+        self.assertEqual(pages[0]['count'], 7)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Volver atrás desde la última página
+        previous = self.client.get(pages[-1]['previous']).data
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_default_ordering_without_count(self):
+        # Sin COUNT(*): página + categorías
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product-list'), {'count': 'false', 'page_size': 3})
+        self.assertNotIn('count', response.data)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, [p.pk for p in reversed(self.products)][:3])
+
+    def test_page_number_fallback(self):
+        response = self.client.get(reverse('product-list'), {'page': 2, 'page_size': 5, 'ordering': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.products[5].pk, self.products[6].pk])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CATALOG_CACHE_TTL=60)
+class CatalogResponseCacheTest(APITestCase):
+    """
+    Respuestas anónimas cacheadas e invalidadas por las señales
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Terraza')
+        self.brand = Brand.objects.create(name='Outdoor')
+        self.product = Product.objects.create(
+            name='Reposera', sku='REP-1', description='Reposera plegable',
+            category=self.category, brand=self.brand, price=120, stock=4, is_featured=True,
+        )
+        self.user = User.objects.create_user(username='ana', password='pass1234')
+
+    def assertCached(self, url, **params):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, params)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        return second
+
+    def test_catalog_reads_are_cached(self):
+        self.assertCached(reverse('product-list'), ordering='price')
+        self.assertCached(reverse('product-featured'))
+        self.assertCached(reverse('product-related', args=[self.product.slug]))
+        self.assertCached(reverse('category-list'))
+        self.assertCached(reverse('brand-list'))
+
+    def test_invalidated_by_product_and_review_changes(self):
+        url = reverse('product-list')
+        self.assertCached(url)
+
+        self.product.name = 'Reposera XL'
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Reposera XL')
+
+        Review.objects.create(product=self.product, user=self.user, rating=5, title='Top', comment='Muy cómoda')
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['review_count'], 1)
+
+    def test_product_edit_keeps_category_and_brand_generations(self):
+        categories = reverse('category-list')
+        self.assertCached(categories)
+        generations = get_generations([CATEGORIES, BRANDS])
+
+        self.product.name = 'Reposera XL'
+        self.product.save()
+        self.assertEqual(get_generations([CATEGORIES, BRANDS]), generations)
+        with self.assertNumQueries(0):
+            self.client.get(categories)
+        self.assertEqual(self.client.get(reverse('product-list')).data['results'][0]['name'], 'Reposera XL')
+
+        # Desactivar cambia los conteos de categorías y marcas
+        self.product.is_active = False
+        self.product.save(update_fields=['is_active'])
+        self.assertNotEqual(get_generations([CATEGORIES]), {CATEGORIES: generations[CATEGORIES]})
+        self.assertNotEqual(get_generations([BRANDS]), {BRANDS: generations[BRANDS]})
+
+    def test_invalidated_by_brand_change(self):
+        url = reverse('brand-list')
+        self.assertCached(url)
+        self.brand.name = 'Outdoor Living'
+        self.brand.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Outdoor Living')
+
+    def test_key_includes_accept_and_params(self):
+        url = reverse('product-list')
+        self.client.get(url, {'ordering': 'price'})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'ordering': 'price'})
+        self.assertNotEqual(
+            self.client.get(url, {'ordering': 'price'}, HTTP_ACCEPT='application/json; indent=4').content,
+            self.client.get(url, {'ordering': 'price'}).content,
+        )
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('product-list')
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.product.name = 'Reposera XL'
+        self.product.save(update_fields=['name'])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).data['results'][0]['name'], 'Reposera XL')
+
+
+@override_settings(CATALOG_CACHE_TTL=0, OBJECT_CACHE_TTL=60, PRODUCT_VIEWS_FLUSH_INTERVAL=0)
+class ObjectCacheTest(APITestCase):
+    """
+    Caché de payloads por objeto (LRU del proceso + caché compartida)
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Dormitorio')
+        self.brand = Brand.objects.create(name='Descanso')
+        self.product = Product.objects.create(
+            name='Cama', sku='CAMA-1', description='Cama de dos plazas',
+            category=self.category, brand=self.brand, price=800, stock=5,
+        )
+        for object_cache in OBJECT_CACHES:
+            object_cache.local.clear()
+            object_cache.reset_stats()
+
+    def test_product_detail_read_through(self):
+        url = reverse('product-detail', args=[self.product.slug])
+        first = self.client.get(url)
+        self.assertEqual(product_detail_cache.stats()['misses'], 1)
+        # La fila del producto y la escritura de la vista (con su savepoint)
+        with self.assertNumQueries(4):
+            second = self.client.get(url)
+        self.assertEqual(second.data['name'], first.data['name'])
+        self.assertEqual(product_detail_cache.stats()['local_hits'], 1)
+
+        # Sin la capa local responde la caché compartida
+        product_detail_cache.local.clear()
+        self.client.get(url)
+        self.assertEqual(product_detail_cache.stats()['shared_hits'], 1)
+
+    def test_volatile_fields_are_fresh(self):
+        url = reverse('product-detail', args=[self.product.slug])
+        self.client.get(url)
+        Product.objects.reserve_stock({self.product.pk: 2})
+        response = self.client.get(url)
+        self.assertEqual(response.data['stock'], 3)
+        self.assertEqual(response.data['views_count'], 2)
+
+    def test_new_version_after_related_changes(self):
+        url = reverse('product-detail', args=[self.product.slug])
+        self.client.get(url)
+        ProductImage.objects.create(product=self.product, image='products/cama.png', is_primary=True)
+        self.assertEqual(len(self.client.get(url).data['images']), 1)
+        self.product.materials.add(Material.objects.create(name='Roble'))
+        self.assertEqual(len(self.client.get(url).data['materials']), 1)
+        self.brand.name = 'Descanso Plus'
+        self.brand.save()
+        self.assertEqual(self.client.get(url).data['brand']['name'], 'Descanso Plus')
+
+    def test_list_page_uses_get_many(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['brand']['product_count'], 1)
+        self.assertEqual(product_list_cache.stats()['local_hits'], 1)
+
+    def test_category_detail_without_queries(self):
+        url = reverse('category-detail', args=[self.category.slug])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['product_count'], 1)
+        self.assertEqual(self.client.get(reverse('category-detail', args=['no-existe'])).status_code, 404)
+
+    def test_local_tier_is_bounded(self):
+        lru = LRUCache(max_size=2)
+        lru.set_many({'a': 1, 'b': 2})
+        lru.get_many(['a'])
+        lru.set_many({'c': 3})
+        self.assertEqual(lru.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(lru.evictions, 1)
+
+    def test_stats_endpoint_is_admin_only(self):
+        url = reverse('product-cache-stats')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        admin = User.objects.create_superuser(username='admin', password='pass1234')
+        self.client.force_authenticate(admin)
+        response = self.client.get(url)
+        self.assertEqual(set(response.data), {'product_detail', 'product_list', 'category_detail'})
+
+
+@override_settings(CATALOG_CACHE_TTL=0)
+class CategoryTreeViewTest(APITestCase):
+    """
+    Árbol de navegación y filtro por subárbol de categorías
+    """
+    def setUp(self):
+        self.living = Category.objects.create(name='Living')
+        self.sofas = Category.objects.create(name='Sofás', parent=self.living)
+        self.hidden = Category.objects.create(name='Oculta', parent=self.living, is_active=False)
+        self.oficina = Category.objects.create(name='Oficina')
+        for i, category in enumerate([self.living, self.sofas, self.sofas, self.oficina]):
+            Product.objects.create(
+                name=f'Producto {i}', sku=f'TREE-{i}', description='-', category=category, price=100
+            )
+
+    def test_tree_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('category-tree'))
+        living, oficina = response.data
+        self.assertEqual(living['total_product_count'], 3)
+        self.assertEqual(living['product_count'], 1)
+        self.assertEqual([child['slug'] for child in living['children']], [self.sofas.slug])
+        self.assertEqual(living['children'][0]['depth'], 1)
+        self.assertEqual(oficina['children'], [])
+
+    def test_category_filter_includes_subcategories(self):
+        response = self.client.get(reverse('product-list'), {'category': self.living.slug})
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.get(reverse('product-list'), {'category': self.sofas.slug})
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get(reverse('product-list'), {'category': 'no-existe'})
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get(reverse('category-products', args=[self.living.slug]))
+        self.assertEqual(len(response.data), 3)
+
+    def test_related_reads_precomputed_lists(self):
+        mesa = Product.objects.create(name='Mesa', sku='TREE-M', description='-', category=self.oficina, price=100)
+        call_command('compute_related_products', stdout=StringIO())
+        sofa = Product.objects.get(sku='TREE-1')
+        response = self.client.get(reverse('product-related', args=[sofa.slug]))
+        self.assertEqual(
+            [item['id'] for item in response.data],
+            list(sofa.related_links.values_list('related_id', flat=True)[:6])
+        )
+        self.assertNotIn(mesa.pk, [item['id'] for item in response.data])
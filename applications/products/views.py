@@ -2,22 +2,27 @@
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Avg
+from django.db.models import Q, Count, Avg, F
+from django.http import Http404
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
 
 from .models import Category, Brand, Material, Product, Review
 from .serializers import (
-    CategoryListSerializer, CategoryDetailSerializer,
+    CategoryListSerializer, CategoryDetailSerializer, CategoryTreeSerializer,
     BrandSerializer, MaterialSerializer,
     ProductListSerializer, ProductDetailSerializer,
     ProductCreateSerializer, ProductUpdateSerializer,
     ReviewSerializer, ReviewCreateSerializer
 )
-from .filters import ProductFilter
+from .filters import ProductFilter, CatalogOrderingFilter
+from .cache import BRANDS, CATEGORIES, PRODUCTS, cache_catalog_response
+from .facets import get_facets
+from .object_cache import category_detail_cache, object_cache_stats, product_detail_cache, product_list_cache
+from .pagination import ProductCursorPagination, ReviewCursorPagination
 from .permissions import IsAdminOrReadOnly, IsOwnerOrAdmin
 
 @extend_schema(tags=['Products'])
@@ -32,11 +37,54 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return queryset.for_detail()
+        return queryset.with_product_count()
+    
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return CategoryDetailSerializer
         return CategoryListSerializer
     
+    @cache_catalog_response(CATEGORIES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_catalog_response(CATEGORIES)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Detalle desde la caché de objetos: con acierto no consulta la base
+        de datos ni para resolver el slug
+        """
+        slug = kwargs[self.lookup_field]
+        payloads = category_detail_cache.fetch(
+            request, {slug: None},
+            lambda slugs: self.get_queryset().in_bulk(slugs, field_name='slug')
+        )
+        if slug not in payloads:
+            raise Http404
+        return Response(payloads[slug])
+    
+    @action(detail=False, methods=['get'])
+    @extend_schema(
+        description=(
+            'Árbol de navegación completo de categorías activas, con productos '
+            'propios (product_count) y de todo el subárbol (total_product_count)'
+        ),
+        responses=CategoryTreeSerializer(many=True),
+    )
+    @cache_catalog_response(CATEGORIES)
+    def tree(self, request):
+        """
+        Árbol de categorías en una sola consulta
+        GET /api/products/categories/tree/
+        """
+        roots = Category.objects.filter(is_active=True).tree()
+        serializer = CategoryTreeSerializer(roots, many=True, context={'request': request})
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['get'])
     @extend_schema(
         parameters=[
@@ -50,13 +98,14 @@ class CategoryViewSet(viewsets.ModelViewSet):
         ],
         description='Obtener subcategorías de una categoría específica'
     )
+    @cache_catalog_response(CATEGORIES)
     def subcategories(self, request, slug=None):
         """
         Obtener subcategorías de una categoría
         GET /api/products/categories/{slug}/subcategories/
         """
         category = self.get_object()
-        subcategories = category.subcategories.filter(is_active=True)
+        subcategories = category.subcategories.filter(is_active=True).with_product_count()
         serializer = CategoryListSerializer(subcategories, many=True, context={'request': request})
         return Response(serializer.data)
     
@@ -78,18 +127,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 location=OpenApiParameter.QUERY,
             ),
         ],
-        description='Obtener productos de una categoría específica'
+        description='Obtener productos de una categoría específica y de sus subcategorías'
     )
+    @cache_catalog_response(CATEGORIES, PRODUCTS)
     def products(self, request, slug=None):
         """
-        Obtener productos de una categoría
+        Obtener productos de una categoría y de todo su subárbol
         GET /api/products/categories/{slug}/products/
         """
         category = self.get_object()
-        products = Product.objects.filter(
-            category=category,
+        products = Product.objects.in_category_tree(category).filter(
             is_active=True
-        ).select_related('category', 'brand').prefetch_related('images', 'materials')
+        ).for_catalog()
         
         serializer = ProductListSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
@@ -99,7 +148,7 @@ class BrandViewSet(viewsets.ModelViewSet):
     """
     ViewSet para gestión de marcas
     """
-    queryset = Brand.objects.filter(is_active=True)
+    queryset = Brand.objects.filter(is_active=True).with_product_count()
     serializer_class = BrandSerializer
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug'
@@ -133,8 +182,13 @@ class BrandViewSet(viewsets.ModelViewSet):
         ],
         description='Listar todas las marcas activas con búsqueda y ordenamiento'
     )
+    @cache_catalog_response(BRANDS)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+    
+    @cache_catalog_response(BRANDS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 @extend_schema(tags=['Products'])
@@ -175,18 +229,29 @@ class ProductViewSet(viewsets.ModelViewSet):
     """
     ViewSet completo para productos con filtros y búsqueda
     """
-    queryset = Product.objects.filter(is_active=True).select_related(
-        'category', 'brand'
-    ).prefetch_related(
-        'materials', 'images', 'specifications', 'reviews'
-    )
+    queryset = Product.objects.filter(is_active=True)
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # La búsqueda (?search=) la resuelve ProductFilter con el índice de texto completo
+    filter_backends = [DjangoFilterBackend, CatalogOrderingFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name', 'views_count']
+    ordering_fields = ['price', 'created_at', 'name', 'views_count', 'rating_average']
     ordering = ['-created_at']
+    pagination_class = ProductCursorPagination
+    
+    def get_queryset(self):
+        """
+        Los listados usan el modo catálogo (rating, reviews, imagen
+        principal y conteos precalculados). En el listado principal y el
+        detalle el payload sale de la caché de objetos: las relaciones se
+        cargan solo para los productos que faltan en ella.
+        """
+        queryset = super().get_queryset()
+        if self.action in ('facets', 'retrieve'):
+            return queryset
+        if self.action == 'list':
+            return queryset.with_catalog_data()
+        return queryset.for_catalog()
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -201,7 +266,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         parameters=[
             OpenApiParameter(
                 name='search',
-                description='Buscar por nombre, descripción o SKU del producto',
+                description='Búsqueda de texto completo por nombre, descripción o SKU (ordenada por relevancia si no se indica ordering; como máximo PRODUCT_SEARCH_MAX_RESULTS resultados, con la cabecera X-Search-Truncated si hubo más)',
                 required=False,
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
@@ -211,7 +276,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             ),
             OpenApiParameter(
                 name='page',
-                description='Número de página (paginación por defecto: 20 por página)',
+                description='Número de página (compatibilidad; se recomienda usar cursor)',
                 required=False,
                 type=OpenApiTypes.INT,
                 location=OpenApiParameter.QUERY,
@@ -251,9 +316,16 @@ class ProductViewSet(viewsets.ModelViewSet):
                 type=OpenApiTypes.BOOL,
                 location=OpenApiParameter.QUERY,
             ),
+            OpenApiParameter(
+                name='min_rating',
+                description='Rating promedio mínimo (filtro)',
+                required=False,
+                type=OpenApiTypes.DECIMAL,
+                location=OpenApiParameter.QUERY,
+            ),
             OpenApiParameter(
                 name='ordering',
-                description='Ordenar por: price, -price, created_at, -created_at, name, views_count',
+                description='Ordenar por: price, -price, created_at, -created_at, name, views_count, rating, -rating',
                 required=False,
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
@@ -261,17 +333,50 @@ class ProductViewSet(viewsets.ModelViewSet):
         ],
         description='Listar productos con filtros, búsqueda y ordenamiento'
     )
+    @cache_catalog_response(PRODUCTS)
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        # Solo los productos sin payload en caché cargan categoría y marca
+        data = product_list_cache.get_many(queryset if page is None else page, request)
+        response = self.get_paginated_response(data) if page is not None else Response(data)
+        if getattr(request, 'search_truncated', False):
+            # Hubo más coincidencias que PRODUCT_SEARCH_MAX_RESULTS
+            response['X-Search-Truncated'] = 'true'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    @extend_schema(
+        description=(
+            'Conteos por categoría, marca, material, color, rango de precio y '
+            'disponibilidad para el resultado de los mismos filtros del listado'
+        )
+    )
+    def facets(self, request):
+        """
+        Facetas para la navegación del catálogo
+        GET /api/products/facets/?category=sofas&min_price=100
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_facets(queryset, request.query_params))
     
     def retrieve(self, request, *args, **kwargs):
         """
-        Incrementa contador de vistas al ver detalle
+        Incrementa contador de vistas al ver detalle; las relaciones solo
+        se consultan si el payload no está en la caché de objetos
         """
         instance = self.get_object()
         instance.increment_views()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return Response(product_detail_cache.get(instance, request))
+    
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    @extend_schema(description='Aciertos, fallos y expulsiones de la caché de objetos del catálogo (por proceso)')
+    def cache_stats(self, request):
+        """
+        Estadísticas de la caché de objetos
+        GET /api/products/cache-stats/
+        """
+        return Response(object_cache_stats())
     
     @action(detail=False, methods=['get'])
     @extend_schema(
@@ -286,6 +391,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             ),
         ]
     )
+    @cache_catalog_response(PRODUCTS)
     def featured(self, request):
         """
         Productos destacados
@@ -308,6 +414,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             ),
         ]
     )
+    @cache_catalog_response(PRODUCTS)
     def new(self, request):
         """
         Productos nuevos
@@ -319,24 +426,47 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     @extend_schema(
-        description='Obtener hasta 12 productos más vendidos (ordenados por vistas, actualizado cuando se integren ordenes reales)',
+        description=(
+            'Obtener hasta 12 productos más vendidos en una ventana móvil de días '
+            '(unidades vendidas; a igualdad, por vistas)'
+        ),
         parameters=[
             OpenApiParameter(
-                name='page',
-                description='Número de página (opcional)',
+                name='window',
+                description='Ventana en días: 7, 30 (por defecto) o 90',
                 required=False,
                 type=OpenApiTypes.INT,
                 location=OpenApiParameter.QUERY,
+                enum=[7, 30, 90],
+            ),
+            OpenApiParameter(
+                name='category',
+                description='Filtrar por categoría (slug), incluyendo subcategorías',
+                required=False,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
             ),
         ]
     )
+    @cache_catalog_response(PRODUCTS)
     def best_sellers(self, request):
         """
-        Productos más vendidos (por ahora por vistas)
-        GET /api/products/best-sellers/
-        TODO: Implementar basado en ventas reales cuando se integre orders
+        Productos más vendidos según el ranking de ventas (orders.sales)
+        GET /api/products/best-sellers/?window=7&category=sofas
         """
-        products = self.get_queryset().order_by('-views_count')[:12]
+        window = request.query_params.get('window', '30')
+        if window not in ('7', '30', '90'):
+            window = '30'
+        products = self.get_queryset()
+        category_slug = request.query_params.get('category')
+        if category_slug:
+            category = Category.objects.filter(slug=category_slug).only('path').first()
+            if category is None:
+                return Response([])
+            products = products.in_category_tree(category)
+        products = products.order_by(
+            F(f'sales_rank__units_{window}d').desc(nulls_last=True), '-views_count', 'pk'
+        )[:12]
         serializer = ProductListSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
     
@@ -351,17 +481,27 @@ class ProductViewSet(viewsets.ModelViewSet):
                 location=OpenApiParameter.PATH,
             ),
         ],
-        description='Obtener hasta 6 productos relacionados (misma categoría)'
+        description=(
+            'Obtener hasta 6 productos relacionados (precalculados por '
+            'compute_related_products; misma categoría si aún no se calcularon)'
+        )
     )
+    @cache_catalog_response(PRODUCTS)
     def related(self, request, slug=None):
         """
-        Productos relacionados (misma categoría)
+        Productos relacionados
         GET /api/products/{slug}/related/
         """
         product = self.get_object()
-        related_products = self.get_queryset().filter(
-            category=product.category
-        ).exclude(id=product.id)[:6]
+        if product.related_computed_at:
+            # Lectura por el índice (product, rank) de RelatedProduct
+            related_products = self.get_queryset().filter(
+                related_from__product=product
+            ).order_by('related_from__rank')[:6]
+        else:
+            related_products = self.get_queryset().filter(
+                category=product.category
+            ).exclude(id=product.id)[:6]
         
         serializer = ProductListSerializer(related_products, many=True, context={'request': request})
         return Response(serializer.data)
@@ -410,6 +550,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'rating']
     ordering = ['-created_at']
+    pagination_class = ReviewCursorPagination
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
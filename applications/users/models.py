@@ -32,6 +32,8 @@ class UserProfile(models.Model):
         null=True,
         help_text="Foto de perfil del usuario"
     )
+    # Derivados responsive del avatar (applications.products.images)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     # Dirección por defecto
     default_address_line1 = models.CharField(max_length=300, blank=True)
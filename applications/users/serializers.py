@@ -4,6 +4,9 @@ from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import UserProfile, Address
 from .validators import validate_age, validate_password_simple
+from applications.cart.signed import SignedCart
+from applications.cart.utils import merge_carts, merge_quantities
+from applications.products.serializers import ImageVariantsField
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
@@ -42,7 +45,17 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
             # Si falla aquí es contraseña incorrecta o usuario no activo
             raise serializers.ValidationError("Credenciales inválidas o cuenta inactiva.")
 
-        # 4. Agregar datos del usuario a la respuesta para el frontend
+        # 4. Pasar el carrito anónimo (de la sesión o firmado) al usuario
+        request = self.context.get('request')
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key:
+            merge_carts(self.user, session.session_key)
+        if hasattr(request, 'COOKIES'):
+            signed_cart = SignedCart.from_request(request)
+            if signed_cart.quantities:
+                merge_quantities(self.user, signed_cart.quantities, signed_cart.digest)
+
+        # 5. Agregar datos del usuario a la respuesta para el frontend
         data['user'] = {
             'id': self.user.id,
             'username': self.user.username,
@@ -107,12 +120,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
     last_name = serializers.CharField(source='user.last_name', read_only=True)
     full_name = serializers.ReadOnlyField()
     has_default_address = serializers.ReadOnlyField()
+    avatar_variants = ImageVariantsField()
     
     class Meta:
         model = UserProfile
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name', 'full_name',
-            'phone', 'birth_date', 'avatar',
+            'phone', 'birth_date', 'avatar', 'avatar_variants',
             'default_address_line1', 'default_address_line2',
             'default_city', 'default_state', 'default_postal_code', 'default_country',
             'has_default_address', 'created_at', 'updated_at'
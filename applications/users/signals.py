@@ -2,6 +2,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import UserProfile
+from applications.products import images
 
 
 @receiver(post_save, sender=User)
@@ -19,4 +20,7 @@ def save_user_profile(sender, instance, **kwargs):
     Guarda el perfil cuando se guarda el usuario
     """
     if hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+# Derivados responsive del avatar
+images.register(UserProfile, 'avatar', 'avatar_variants')
@@ -0,0 +1,91 @@
+import threading
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from applications.cart.models import Cart, CartItem
+from applications.cart.utils import merge_carts
+from applications.products.models import Category, Product
+from applications.users.serializers import MyTokenObtainPairSerializer
+
+
+class CartMergeMixin:
+    def create_fixtures(self):
+        self.user = User.objects.create_user(username='ana', email='ana@example.com', password='pass1234')
+        category = Category.objects.create(name='Living')
+        self.sofa = Product.objects.create(name='Sofá', sku='SOFA-1', category=category, price=500, stock=3)
+        self.puff = Product.objects.create(name='Puff', sku='PUFF-1', category=category, price=50, stock=10)
+        self.mesa = Product.objects.create(name='Mesa', sku='MESA-1', category=category, price=200, stock=5)
+        self.anon_cart = Cart.objects.create(session_id='sesion-1', is_active=True)
+        CartItem.objects.create(cart=self.anon_cart, product=self.sofa, quantity=2)
+        CartItem.objects.create(cart=self.anon_cart, product=self.puff, quantity=1)
+
+    def quantities(self, cart):
+        return dict(cart.items.values_list('product_id', 'quantity'))
+
+
+class MergeCartsTest(CartMergeMixin, TestCase):
+    """
+    El carrito anónimo se fusiona con el del usuario al iniciar sesión
+    """
+    def setUp(self):
+        self.create_fixtures()
+
+    def test_sums_and_clamps_to_stock(self):
+        user_cart = Cart.objects.create(user=self.user, is_active=True)
+        CartItem.objects.create(cart=user_cart, product=self.sofa, quantity=2)
+        CartItem.objects.create(cart=user_cart, product=self.mesa, quantity=1)
+
+        merged = merge_carts(self.user, 'sesion-1')
+        self.assertEqual(merged.pk, user_cart.pk)
+        self.assertEqual(self.quantities(merged), {self.sofa.pk: 3, self.puff.pk: 1, self.mesa.pk: 1})
+        self.assertFalse(Cart.objects.filter(pk=self.anon_cart.pk).exists())
+        self.assertEqual(merged.total_items, 5)
+
+    def test_adopts_anonymous_cart(self):
+        merged = merge_carts(self.user, 'sesion-1')
+        self.assertEqual(merged.pk, self.anon_cart.pk)
+        self.assertEqual(merged.user, self.user)
+        self.assertIsNone(merged.session_id)
+
+    def test_login_merges_session_cart(self):
+        request = SimpleNamespace(session=SimpleNamespace(session_key='sesion-1'))
+        serializer = MyTokenObtainPairSerializer(
+            data={'email': 'ana@example.com', 'password': 'pass1234'}, context={'request': request}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        cart = Cart.objects.get(user=self.user, is_active=True)
+        self.assertEqual(self.quantities(cart), {self.sofa.pk: 2, self.puff.pk: 1})
+
+
+class ConcurrentMergeTest(CartMergeMixin, TransactionTestCase):
+    """
+    Dos pestañas que inician sesión a la vez no duplican cantidades
+    """
+    def setUp(self):
+        self.create_fixtures()
+        self.user_cart = Cart.objects.create(user=self.user, is_active=True)
+
+    def merge(self, barrier):
+        barrier.wait()
+        try:
+            for _ in range(50):
+                try:
+                    merge_carts(self.user, 'sesion-1')
+                    return
+                except OperationalError:
+                    continue
+        finally:
+            connection.close()
+
+    def test_merge_is_applied_once(self):
+        barrier = threading.Barrier(2)
+        threads = [threading.Thread(target=self.merge, args=(barrier,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Cart.objects.filter(user=self.user, is_active=True).count(), 1)
+        self.assertEqual(self.quantities(self.user_cart), {self.sofa.pk: 2, self.puff.pk: 1})
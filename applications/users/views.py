@@ -14,6 +14,7 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from drf_spectacular.utils import extend_schema
 
+from applications.cart.signed import clear_token, request_token
 from .models import UserProfile, Address
 from .serializers import (
     MyTokenObtainPairSerializer,  # <--- Asegúrate de que este serializer exista en serializers.py
@@ -37,6 +38,15 @@ class LoginAPIView(TokenObtainPairView):
     """
     serializer_class = MyTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        # El carrito firmado ya se persistió en el carrito del usuario: el
+        # cliente debe descartar el token (cookie o header X-Cart-Token)
+        if response.status_code == 200 and request_token(request):
+            response.data['cart_token'] = None
+            clear_token(response)
+        return response
+
 
 @extend_schema(tags=['Users'])
 class UserRegistrationAPIView(generics.CreateAPIView):
@@ -8,6 +8,7 @@ from datetime import timedelta
 import os
 import dj_database_url
 from dotenv import load_dotenv  # <--- Importante
+from corsheaders.defaults import default_headers
 
 # Cargar variables de entorno desde .env si existe
 load_dotenv()
@@ -33,6 +34,9 @@ if os.getenv('CORS_ORIGINS'):
     CORS_ALLOWED_ORIGINS.extend(os.getenv('CORS_ORIGINS', '').split(','))
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-cart-token')
+# El SPA lee el token del carrito firmado (vacío tras el login: descartarlo)
+CORS_EXPOSE_HEADERS = ['x-cart-token']
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -138,6 +142,88 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
 
+# Contador de vistas de productos (buffer por worker)
+# Segundos entre escrituras agrupadas; 0 escribe en cada vista
+PRODUCT_VIEWS_FLUSH_INTERVAL = int(os.getenv('PRODUCT_VIEWS_FLUSH_INTERVAL', '10'))
+# Productos distintos acumulados que fuerzan una escritura anticipada
+PRODUCT_VIEWS_MAX_PENDING = int(os.getenv('PRODUCT_VIEWS_MAX_PENDING', '500'))
+
+# Las cachés del catálogo se invalidan con contadores de generación en la
+# caché por defecto. Sin Redis (LocMem) cada proceso tiene los suyos y una
+# invalidación no llega a los demás workers: por omisión quedan desactivadas
+SHARED_CACHE = bool(os.getenv('REDIS_URL'))
+
+# Facetas del catálogo: segundos de caché por combinación de filtros (0 desactiva)
+PRODUCT_FACETS_CACHE_TTL = int(os.getenv('PRODUCT_FACETS_CACHE_TTL', '60' if SHARED_CACHE else '0'))
+
+# Búsqueda de texto completo: máximo de resultados rankeados dentro de los
+# filtros del listado (si hay más, la respuesta lleva X-Search-Truncated)
+PRODUCT_SEARCH_MAX_RESULTS = int(os.getenv('PRODUCT_SEARCH_MAX_RESULTS', '500'))
+PRODUCT_FACET_PRICE_BUCKETS = [0, 100, 250, 500, 1000]
+
+# Caché compartida: Redis si hay REDIS_URL, memoria local del proceso si no
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Respuestas anónimas del catálogo: tope de segundos en caché (0 desactiva).
+# Las señales de products invalidan antes ante cualquier cambio.
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300' if SHARED_CACHE else '0'))
+
+# Caché de objetos del catálogo (payloads por slug + updated_at): segundos en
+# la caché compartida (0 desactiva) y entradas del LRU en memoria de cada proceso
+OBJECT_CACHE_TTL = int(os.getenv('OBJECT_CACHE_TTL', '3600' if SHARED_CACHE else '0'))
+OBJECT_CACHE_LOCAL_SIZE = int(os.getenv('OBJECT_CACHE_LOCAL_SIZE', '1000'))
+
+# Productos relacionados precalculados (compute_related_products): cuántos se
+# guardan por producto; el endpoint related muestra los 6 primeros activos
+RELATED_PRODUCTS_STORED = int(os.getenv('RELATED_PRODUCTS_STORED', '12'))
+
+# Derivados responsive de imágenes (applications.products.images): anchos en
+# WebP y JPEG, calidad, y dónde se generan: 'thread' (pool del proceso),
+# 'celery' o 'sync' (en línea al confirmar la transacción)
+IMAGE_VARIANT_WIDTHS = [320, 640, 1024]
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', '80'))
+IMAGE_VARIANTS_BACKEND = os.getenv('IMAGE_VARIANTS_BACKEND', 'thread')
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', '2'))
+
+# Purga de carritos anónimos abandonados (task clean_old_carts / purge_carts)
+CART_RETENTION_DAYS = int(os.getenv('CART_RETENTION_DAYS', '30'))
+CART_PURGE_BATCH_SIZE = int(os.getenv('CART_PURGE_BATCH_SIZE', '1000'))
+
+# Carritos anónimos: 'session' (Cart en base de datos por sesión) o 'signed'
+# (token firmado en cookie / X-Cart-Token, sin escrituras hasta el login)
+CART_ANONYMOUS_MODE = os.getenv('CART_ANONYMOUS_MODE', 'session')
+CART_COOKIE_NAME = 'cart_token'
+CART_SIGNED_MAX_ITEMS = 50
+
+# Minutos que se aparta el stock de un checkout entre create_payment_intent y
+# confirm_payment. Los vencidos se liberan al validar carrito y orden y con la
+# task release_expired_stock_holds, cuyo intervalo es el atraso máximo del
+# stock disponible que publica el catálogo
+STOCK_HOLD_MINUTES = int(os.getenv('STOCK_HOLD_MINUTES', '15'))
+
+# Destinos del resumen de stock bajo (task send_low_stock_digest): emails
+# separados por coma y/o un webhook que recibe el resumen en JSON
+LOW_STOCK_ALERT_EMAILS = [email for email in os.getenv('LOW_STOCK_ALERT_EMAILS', '').split(',') if email]
+LOW_STOCK_WEBHOOK_URL = os.getenv('LOW_STOCK_WEBHOOK_URL', '')
+
+# Horas que se guarda la respuesta de una petición con Idempotency-Key
+# (checkout y confirm_payment; ver orders/idempotency.py)
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+# Segundos tras los que una clave en curso se da por abandonada
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
 # 🚀 Configuración para producción (Render, Heroku, etc.)
 if not DEBUG:
     # Security settings para HTTPS
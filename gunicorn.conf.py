@@ -0,0 +1,15 @@
+"""
+Configuración de gunicorn (se carga automáticamente desde el directorio
+de trabajo, ver Procfile)
+"""
+
+
+def worker_exit(server, worker):
+    """
+    Escribe las vistas de productos pendientes antes de que el worker termine
+    """
+    try:
+        from applications.products.counters import view_counter
+        view_counter.stop()
+    except Exception:
+        server.log.exception("No se pudo vaciar el buffer de vistas de productos")